@@ -1,17 +1,34 @@
-from flask import Flask, request, jsonify, send_from_directory, render_template_string, abort
+from flask import Flask, request, jsonify, send_from_directory, render_template, abort, make_response, Response, stream_with_context, g
 from flask_cors import CORS
-import pymysql
 import os
 import logging
 from datetime import datetime, timedelta
 import logging
 from dotenv import load_dotenv
 import random
-import requests
 import json
 from functools import wraps
-from collections import defaultdict
 import time
+import tempfile
+import hmac
+from db_pool import ConnectionPool
+import storage
+from request_log_writer import RequestLogWriter
+from geoip import GeoLocator
+from geo_enricher import GeoEnricher
+from rate_limiter import SlidingWindowLimiter
+from ban_list import BanList
+from ip_policy import ALLOW, DENY, IPPolicy, normalize_network
+from page_templates import PageTemplates
+from static_assets import StaticAssets
+import stats_rollup
+import request_rollup
+import red_packet_io
+import request_log_query
+from retention import Retention
+from response_cache import DataVersions, ResponseCache, CREATE_TABLE_SQL as DATA_VERSIONS_TABLE_SQL
+from change_feed import ChangeFeed, CHANNELS as EVENT_CHANNELS, publish as publish_event, CREATE_TABLE_SQL as CHANGE_EVENTS_TABLE_SQL
+import metrics
 
 # 加载环境变量
 load_dotenv()
@@ -30,12 +47,105 @@ SECURITY_CONFIG = {
     'BAN_THRESHOLD': int(os.getenv('BAN_THRESHOLD', 100)),             # 触发封禁的请求数
     'BAN_WINDOW': int(os.getenv('BAN_WINDOW', 300)),                   # 检测时间窗口（秒）
     'BAN_DURATION': int(os.getenv('BAN_DURATION', 3600)),              # 封禁时长（秒）
-    'WHITELIST_IPS': os.getenv('WHITELIST_IPS', '127.0.0.1,::1').split(',')  # 白名单IP
+    'RATE_LIMIT_MAX_KEYS': int(os.getenv('RATE_LIMIT_MAX_KEYS', 65536)),          # 限流计数表最多跟踪的IP数（固定内存）
+    'RATE_LIMIT_SWEEP_INTERVAL': int(os.getenv('RATE_LIMIT_SWEEP_INTERVAL', 60)),  # 清理不活跃IP计数的间隔（秒）
+    'WHITELIST_IPS': os.getenv('WHITELIST_IPS', '127.0.0.1,::1').split(',')  # 白名单IP，支持 CIDR 网段
 }
 
-# 内存中的请求计数器（用于快速检查）
-request_counts = defaultdict(list)
-blocked_ips = {}
+# 留言分页配置
+MESSAGES_DEFAULT_PAGE_SIZE = int(os.getenv('MESSAGES_DEFAULT_PAGE_SIZE', 50))
+MESSAGES_MAX_PAGE_SIZE = int(os.getenv('MESSAGES_MAX_PAGE_SIZE', 200))
+MESSAGES_BULK_DELETE_MAX = int(os.getenv('MESSAGES_BULK_DELETE_MAX', 500))
+
+# 请求日志查询配置
+REQUEST_LOGS_MAX_OFFSET = int(os.getenv('REQUEST_LOGS_MAX_OFFSET', 10000))   # 旧的页码分页最多跳过的条数
+
+# 红包口令批量导入配置
+RED_PACKET_IMPORT_MAX = int(os.getenv('RED_PACKET_IMPORT_MAX', 20000))       # 单次导入的最大条数
+RED_PACKET_IMPORT_CHUNK = int(os.getenv('RED_PACKET_IMPORT_CHUNK', 500))     # 每条 INSERT 语句的行数
+
+# build_static.py 生成的带哈希、预压缩的静态资源（目录不存在时按原方式提供文件）
+static_assets = StaticAssets(os.path.join(app.root_path, os.getenv('STATIC_DIST_DIR', 'dist')))
+
+# 页面模板在每个 worker 中只读取和编译一次，TEMPLATE_AUTO_RELOAD=true 时按文件修改时间自动重新加载（开发环境）
+page_templates = PageTemplates(
+    app.jinja_env,
+    app.root_path,
+    auto_reload=os.getenv('TEMPLATE_AUTO_RELOAD', 'false').lower() == 'true',
+    transform=static_assets.rewrite
+)
+
+# 各 worker 共享的限流计数器（在 fork 前创建，见 rate_limiter.py）
+rate_limiter = SlidingWindowLimiter(
+    SECURITY_CONFIG['RATE_LIMIT_REQUESTS'],
+    SECURITY_CONFIG['RATE_LIMIT_WINDOW'],
+    max_keys=SECURITY_CONFIG['RATE_LIMIT_MAX_KEYS'],
+    sweep_interval=SECURITY_CONFIG['RATE_LIMIT_SWEEP_INTERVAL']
+)
+# 封禁阈值计数（BAN_WINDOW 内的请求数），由中间件直接计数，不再查询 request_logs
+ban_counter = SlidingWindowLimiter(
+    SECURITY_CONFIG['BAN_THRESHOLD'],
+    SECURITY_CONFIG['BAN_WINDOW'],
+    max_keys=SECURITY_CONFIG['RATE_LIMIT_MAX_KEYS'],
+    sweep_interval=SECURITY_CONFIG['RATE_LIMIT_SWEEP_INTERVAL']
+)
+
+# 指标配置（/metrics，Prometheus 文本格式，见 metrics.py）
+METRICS_CONFIG = {
+    'directory': os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'birthday_board_metrics')),  # 各 worker 快照文件目录，同一台机器上的多个实例需要分开
+    'flush_interval': float(os.getenv('METRICS_FLUSH_INTERVAL', 5)),  # 每个 worker 写快照的间隔（秒）
+}
+
+# /metrics 的访问控制：按连接的对端地址（REMOTE_ADDR，不读取可伪造的 X-Forwarded-For）或令牌放行
+METRICS_ACCESS = {
+    'ALLOWED_IPS': os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(','),  # 允许直接访问的地址，支持 CIDR 网段
+    'TOKEN': os.getenv('METRICS_TOKEN', ''),  # 经反向代理访问时使用，请求头 Authorization: Bearer <令牌>
+}
+
+metrics_allowed = IPPolicy()
+for entry in METRICS_ACCESS['ALLOWED_IPS']:
+    if not entry.strip():
+        continue
+    try:
+        metrics_allowed.allow(entry)
+    except ValueError:
+        logger.warning(f"忽略无效的 METRICS_ALLOWED_IPS 条目: {entry}")
+
+metrics_registry = metrics.Registry(prefix='birthday_board_', **METRICS_CONFIG)
+http_requests = metrics_registry.counter(
+    'http_requests_total', 'HTTP 请求数', ('endpoint', 'method', 'status'))
+http_request_seconds = metrics_registry.histogram(
+    'http_request_duration_seconds', 'HTTP 请求处理时间（秒，流式响应只计到返回响应头）', ('endpoint', 'method'))
+db_query_seconds = metrics_registry.histogram(
+    'db_query_duration_seconds', '数据库语句执行时间（秒）', ('operation',), buckets=metrics.DB_BUCKETS)
+geoip_api_seconds = metrics_registry.histogram(
+    'geoip_api_duration_seconds', '地理位置在线接口调用时间（秒）', ('kind', 'result'))
+rate_limit_decisions = metrics_registry.counter(
+    'rate_limit_decisions_total', '限流检查结果', ('decision',))
+ban_decisions = metrics_registry.counter(
+    'ban_decisions_total', '封禁相关的处理结果（blocked 为被封禁IP的请求，issued 为新发出的封禁）', ('decision',))
+
+DB_OPERATIONS = ('select', 'insert', 'update', 'delete')
+
+def observe_query(sql, seconds):
+    """按语句类型记录数据库耗时"""
+    operation = sql.lstrip()[:6].lower()
+    if operation not in DB_OPERATIONS:
+        operation = 'other'
+    db_query_seconds.observe(seconds, operation)
+
+def observe_geoip(kind, seconds, ok):
+    """记录地理位置在线接口耗时"""
+    geoip_api_seconds.observe(seconds, kind, 'ok' if ok else 'failed')
+
+# 存储后端：mysql（默认）或 sqlite（单文件数据库，WAL 模式，适合单机部署和测试，见 storage.py）
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql').lower()
+
+# SQLite 配置（DB_BACKEND=sqlite 时使用）
+SQLITE_CONFIG = {
+    'path': os.getenv('SQLITE_PATH', 'birthday_board.sqlite3'),
+    'busy_timeout': float(os.getenv('SQLITE_BUSY_TIMEOUT', 5)),  # 等待其它连接的写事务结束的时间（秒）
+}
 
 # MySQL 数据库配置
 MYSQL_CONFIG = {
@@ -45,123 +155,301 @@ MYSQL_CONFIG = {
     'password': os.getenv('MYSQL_PASSWORD', ''),
     'database': os.getenv('MYSQL_DATABASE', 'birthday_board'),
     'charset': 'utf8mb4',
-    'autocommit': True
+    'autocommit': True,
+    'cursorclass': storage.timed_cursor_class(observe_query)
+}
+
+# 连接池配置（每个worker进程一个连接池）
+DB_POOL_CONFIG = {
+    'max_size': int(os.getenv('DB_POOL_SIZE', 8)),                  # 最大连接数（不小于 GUNICORN_THREADS）
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 5)),              # 等待空闲连接的超时（秒）
+    'idle_timeout': float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300)),  # 空闲连接回收时间（秒）
+    'ping_interval': float(os.getenv('DB_POOL_PING_INTERVAL', 5)),  # 空闲超过该时间的连接借出前先ping（秒）
 }
 
+if DB_BACKEND == 'sqlite':
+    db_pool = ConnectionPool(dict(SQLITE_CONFIG, observer=observe_query), connect=storage.connect_sqlite,
+                             **DB_POOL_CONFIG)
+else:
+    db_pool = ConnectionPool(MYSQL_CONFIG, **DB_POOL_CONFIG)
+
 def get_db_connection():
-    """获取数据库连接"""
-    try:
-        connection = pymysql.connect(**MYSQL_CONFIG)
-        return connection
-    except Exception as e:
-        logger.error(f"数据库连接失败: {e}")
-        raise
+    """从连接池借出数据库连接，需配合 with 使用，退出时（包括异常）自动归还"""
+    return db_pool.connection()
+
+# 请求日志批量写入配置
+REQUEST_LOG_CONFIG = {
+    'max_queue': int(os.getenv('REQUEST_LOG_QUEUE_SIZE', 10000)),         # 队列上限（条）
+    'batch_size': int(os.getenv('REQUEST_LOG_BATCH_SIZE', 200)),          # 每批最多写入条数
+    'flush_interval': float(os.getenv('REQUEST_LOG_FLUSH_INTERVAL', 1)),  # 最长攒批时间（秒）
+    'overflow_policy': os.getenv('REQUEST_LOG_OVERFLOW', 'drop'),         # 队列满时: drop 丢弃 / block 短暂阻塞
+    'block_timeout': float(os.getenv('REQUEST_LOG_BLOCK_TIMEOUT', 0.05)), # block 策略的最长等待（秒）
+}
+
+# 每批日志记录到分钟汇总表的高频IP数
+REQUEST_ROLLUP_TOP_IPS = int(os.getenv('REQUEST_ROLLUP_TOP_IPS', 20))
+
+request_log_writer = RequestLogWriter(
+    get_db_connection,
+    after_write=lambda cursor, rows: request_rollup.record_batch(cursor, rows, REQUEST_ROLLUP_TOP_IPS),
+    **REQUEST_LOG_CONFIG
+)
+
+# 请求日志带过滤条件时的总数缓存（秒）
+request_log_counts = request_log_query.CountCache(ttl=float(os.getenv('REQUEST_LOGS_COUNT_TTL', 30)))
+
+# IP地理位置查询配置
+GEOIP_CONFIG = {
+    'api_url': os.getenv('GEOIP_API_URL', 'http://ip-api.com/json/{ip}?lang=zh-CN'),  # 查询接口，{ip} 为占位符
+    'timeout': float(os.getenv('GEOIP_TIMEOUT', 3)),                     # 外部请求超时（秒）
+    'cache_size': int(os.getenv('GEOIP_CACHE_SIZE', 10000)),             # 进程内缓存条数
+    'ttl': int(os.getenv('GEOIP_CACHE_TTL', 86400)),                     # 成功结果缓存时间（秒）
+    'negative_ttl': int(os.getenv('GEOIP_NEGATIVE_TTL', 600)),           # 失败结果缓存时间（秒）
+    'shared_cache_path': os.getenv('GEOIP_SHARED_CACHE',
+                                   os.path.join(tempfile.gettempdir(), 'birthday_geoip_cache.sqlite3')),  # 为空则不使用共享缓存
+    'shared_cache_max': int(os.getenv('GEOIP_SHARED_CACHE_MAX', 100000)),  # 共享缓存最大条数
+    'mode': os.getenv('GEOIP_MODE', 'api'),                              # api / offline / offline+api
+    'offline_db_path': os.getenv('GEOIP_OFFLINE_DB', 'geoip.bin'),       # 离线IP库文件（由 ip_range_db.py import 生成）
+    'batch_url': os.getenv('GEOIP_BATCH_URL', 'http://ip-api.com/batch?lang=zh-CN'),  # 批量查询接口，为空则逐个查询
+}
+
+geo_locator = GeoLocator(observer=observe_geoip, **GEOIP_CONFIG)
+
+# 地理位置异步补全配置
+GEO_ENRICH_CONFIG = {
+    'batch_size': int(os.getenv('GEO_ENRICH_BATCH_SIZE', 100)),         # 每批解析的记录数
+    'interval': float(os.getenv('GEO_ENRICH_INTERVAL', 2)),             # 最长攒批时间（秒）
+    'max_pending': int(os.getenv('GEO_ENRICH_MAX_PENDING', 10000)),     # 待补全队列上限
+    'sweep_interval': int(os.getenv('GEO_ENRICH_SWEEP_INTERVAL', 300)), # 扫描遗漏记录的间隔（秒），0 关闭
+}
+
+geo_enricher = GeoEnricher(get_db_connection, geo_locator, **GEO_ENRICH_CONFIG)
+
+# 响应缓存：data_versions 中的版本号变化时失效，所有worker共享版本号
+# 访问不逐次更新 stats 版本号，访问统计最多延迟 STATS_VERSION_INTERVAL 秒反映到 /api/stats 和推送中
+data_versions = DataVersions(
+    get_db_connection,
+    local_ttl=float(os.getenv('RESPONSE_CACHE_VERSION_TTL', 0)),
+    time_buckets={'stats': float(os.getenv('STATS_VERSION_INTERVAL', 30))}
+)
+
+# 每个 worker 内存中的封禁列表快照，按 data_versions 中 'bans' 的版本号刷新；
+# 白名单和封禁在同一个前缀树中按最长前缀匹配（封禁网段内可以单独放行地址）
+ban_list = BanList(
+    get_db_connection,
+    data_versions,
+    refresh_interval=float(os.getenv('BAN_LIST_REFRESH_INTERVAL', 2)),
+    full_reload_interval=float(os.getenv('BAN_LIST_FULL_RELOAD_INTERVAL', 300)),
+    allow=SECURITY_CONFIG['WHITELIST_IPS']
+)
+response_cache = ResponseCache(max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', 256)))
+
+def _stat_counters(stats_func, keys):
+    """把组件的 stats() 中的累计值转换为指标的 {(标签值,): 值}"""
+    def collect():
+        stats = stats_func()
+        return {(key,): stats[key] for key in keys}
+    return collect
+
+# 各组件已有的进程内统计，写快照时读取
+metrics_registry.register_collector(
+    'response_cache_events_total', '响应缓存命中情况', ('result',),
+    _stat_counters(response_cache.stats, ('hits', 'misses', 'not_modified', 'bypassed')))
+metrics_registry.register_collector(
+    'geoip_cache_events_total', '地理位置查询的缓存与在线接口情况', ('result',),
+    _stat_counters(geo_locator.stats, ('memory_hits', 'shared_hits', 'negative_hits', 'offline_hits',
+                                       'api_calls', 'api_failures')))
+metrics_registry.register_collector(
+    'db_pool_events_total', '连接池借出、等待与超时次数', ('event',),
+    _stat_counters(db_pool.stats, ('checkouts', 'created', 'waits', 'timeouts')))
+metrics_registry.register_collector(
+    'request_log_events_total', '请求日志队列写入情况', ('event',),
+    _stat_counters(request_log_writer.stats, ('queued', 'dropped', 'flushed', 'failed')))
+
+def read_stats():
+    """读取 /api/stats 的统计数据"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        return stats_rollup.read(cursor, datetime.now().date())
+
+# 变更推送配置（/api/events 与 /api/events/poll）
+EVENTS_CONFIG = {
+    'stream_max_seconds': float(os.getenv('EVENTS_STREAM_MAX_SECONDS', 25)),  # 单个 SSE 连接的最长时间（秒），需小于 gunicorn timeout，客户端会自动重连
+    'heartbeat': float(os.getenv('EVENTS_HEARTBEAT', 15)),                   # 没有事件时发送心跳的间隔（秒）
+    'long_poll_timeout': float(os.getenv('EVENTS_LONG_POLL_TIMEOUT', 20)),   # 长轮询最长等待（秒）
+    'retry_ms': int(os.getenv('EVENTS_RETRY_MS', 3000)),                     # 建议客户端重连的间隔（毫秒）
+    'push': os.getenv('EVENTS_PUSH', 'auto').lower(),                        # auto / on / off，见 push_enabled()
+}
+
+# 每个 worker 一个后台线程读取变更事件，所有连接共用
+event_feed = ChangeFeed(
+    get_db_connection,
+    data_versions,
+    read_stats,
+    poll_interval=float(os.getenv('EVENTS_POLL_INTERVAL', 1)),    # 检查版本号的间隔（秒）
+    buffer_size=int(os.getenv('EVENTS_BUFFER_SIZE', 1000)),        # 每个 worker 缓存的事件数，重连时可补发
+    idle_timeout=float(os.getenv('EVENTS_IDLE_TIMEOUT', 60)),      # 没有连接多久后停止轮询（秒）
+    gap_timeout=float(os.getenv('EVENTS_GAP_TIMEOUT', 10))         # 等待较晚提交的事件的时间（秒）
+)
+
+# 数据保留配置：各类数据的保留天数，0 表示不清理
+RETENTION_TTL_DAYS = {
+    'request_logs': int(os.getenv('RETENTION_REQUEST_LOGS_DAYS', 30)),       # 请求日志
+    'visits': int(os.getenv('RETENTION_VISITS_DAYS', 180)),                  # activity_logs 中的访问记录
+    'expired_bans': int(os.getenv('RETENTION_EXPIRED_BANS_DAYS', 7)),        # 过期多少天后删除封禁记录（保留期内再次封禁会累计次数）
+    'visitor_uniques': int(os.getenv('RETENTION_VISITOR_UNIQUES_DAYS', 30)), # 按天的访客去重记录（累计值不受影响）
+    'request_minutes': int(os.getenv('RETENTION_REQUEST_ROLLUP_DAYS', 90)),      # 请求分钟汇总
+    'request_minute_ips': int(os.getenv('RETENTION_REQUEST_ROLLUP_DAYS', 90)),   # 请求分钟汇总中的高频IP
+    'change_events': int(os.getenv('RETENTION_CHANGE_EVENTS_DAYS', 1)),          # 变更推送事件
+}
+
+retention = Retention(
+    get_db_connection,
+    data_versions,
+    RETENTION_TTL_DAYS,
+    batch_size=int(os.getenv('RETENTION_BATCH_SIZE', 1000)),          # 每批删除的行数
+    batch_pause=float(os.getenv('RETENTION_BATCH_PAUSE', 0.1)),       # 批与批之间的暂停（秒）
+    archive_dir=os.getenv('RETENTION_ARCHIVE_DIR', ''),               # 归档目录，为空则不归档
+    interval=float(os.getenv('RETENTION_INTERVAL', 0))                # 后台自动清理的间隔（秒），0 关闭（可改用 cron 运行 retention.py）
+)
+
+def ensure_index(cursor, table, index_name, columns, unique=False):
+    """索引不存在时创建（CREATE TABLE IF NOT EXISTS 不会给旧表加新索引）"""
+    if storage.dialect(cursor).ensure_index(cursor, table, index_name, columns, unique):
+        logger.info(f"已为 {table} 添加索引 {index_name}")
+
+def ensure_column(cursor, table, column, definition):
+    """列不存在时添加（CREATE TABLE IF NOT EXISTS 不会给旧表加新列），返回是否新建"""
+    if storage.dialect(cursor).ensure_column(cursor, table, column, definition):
+        logger.info(f"已为 {table} 添加列 {column}")
+        return True
+    return False
 
 def init_database():
     """初始化数据库和表结构"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
         
-        # 创建统一的活动记录表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS activity_logs (
-                id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                activity_type ENUM('message', 'visit') NOT NULL COMMENT '活动类型：留言或访问',
-                
-                -- 留言相关字段
-                name VARCHAR(100) NULL COMMENT '留言者姓名',
-                message TEXT NULL COMMENT '留言内容',
-                emoji VARCHAR(10) DEFAULT '🎂' COMMENT '表情符号',
+            # 创建统一的活动记录表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS activity_logs (
+                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    activity_type ENUM('message', 'visit') NOT NULL COMMENT '活动类型：留言或访问',
                 
-                -- 访问信息字段
-                ip_address VARCHAR(45) NOT NULL COMMENT 'IP地址 (支持IPv6)',
-                user_agent TEXT NULL COMMENT '用户代理信息',
-                referer VARCHAR(500) NULL COMMENT '来源页面',
+                    -- 留言相关字段
+                    name VARCHAR(100) NULL COMMENT '留言者姓名',
+                    message TEXT NULL COMMENT '留言内容',
+                    emoji VARCHAR(10) DEFAULT '🎂' COMMENT '表情符号',
                 
-                -- 时间和位置信息
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
-                country VARCHAR(50) NULL COMMENT '国家',
-                city VARCHAR(100) NULL COMMENT '城市',
+                    -- 访问信息字段
+                    ip_address VARCHAR(45) NOT NULL COMMENT 'IP地址 (支持IPv6)',
+                    user_agent TEXT NULL COMMENT '用户代理信息',
+                    referer VARCHAR(500) NULL COMMENT '来源页面',
                 
-                -- 索引
-                INDEX idx_activity_type (activity_type),
-                INDEX idx_ip_address (ip_address),
-                INDEX idx_created_at (created_at),
-                INDEX idx_type_time (activity_type, created_at)
-            ) ENGINE=InnoDB 
-              DEFAULT CHARSET=utf8mb4 
-              COLLATE=utf8mb4_unicode_ci 
-              COMMENT='活动日志表：记录留言和访问信息'
-        ''')
-        
-        # 创建红包口令表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS red_packet_codes (
-                id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                code VARCHAR(50) NOT NULL UNIQUE COMMENT '支付宝口令红包代码',
-                description VARCHAR(200) NULL COMMENT '红包描述',
-                amount DECIMAL(10,2) NULL COMMENT '红包金额',
-                is_used BOOLEAN DEFAULT FALSE COMMENT '是否已使用',
-                used_by_ip VARCHAR(45) NULL COMMENT '使用者IP',
-                used_at TIMESTAMP NULL COMMENT '使用时间',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+                    -- 时间和位置信息
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+                    country VARCHAR(50) NULL COMMENT '国家',
+                    city VARCHAR(100) NULL COMMENT '城市',
                 
-                INDEX idx_is_used (is_used),
-                INDEX idx_created_at (created_at)
-            ) ENGINE=InnoDB 
-              DEFAULT CHARSET=utf8mb4 
-              COLLATE=utf8mb4_unicode_ci 
-              COMMENT='红包口令表：管理支付宝红包口令'
-        ''')
-        
-        # 创建IP封禁表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ip_bans (
-                id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                ip_address VARCHAR(45) NOT NULL UNIQUE COMMENT 'IP地址',
-                ban_reason VARCHAR(200) DEFAULT 'Rate limit exceeded' COMMENT '封禁原因',
-                ban_count INT DEFAULT 1 COMMENT '封禁次数',
-                banned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '封禁时间',
-                expires_at TIMESTAMP NOT NULL COMMENT '解封时间',
-                is_permanent BOOLEAN DEFAULT FALSE COMMENT '是否永久封禁',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+                    -- 索引
+                    INDEX idx_activity_type (activity_type),
+                    INDEX idx_ip_address (ip_address),
+                    INDEX idx_created_at (created_at),
+                    INDEX idx_type_time (activity_type, created_at),
+                    INDEX idx_type_id (activity_type, id),
+                    INDEX idx_country (country)
+                ) ENGINE=InnoDB 
+                  DEFAULT CHARSET=utf8mb4 
+                  COLLATE=utf8mb4_unicode_ci 
+                  COMMENT='活动日志表：记录留言和访问信息'
+            ''')
+        
+            # 创建红包口令表
+            cursor.execute(red_packet_io.CREATE_TABLE_SQL)
+        
+            # 创建IP封禁表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ip_bans (
+                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    ip_address VARCHAR(45) NOT NULL UNIQUE COMMENT 'IP地址',
+                    ban_reason VARCHAR(200) DEFAULT 'Rate limit exceeded' COMMENT '封禁原因',
+                    ban_count INT DEFAULT 1 COMMENT '封禁次数',
+                    banned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '封禁时间',
+                    expires_at TIMESTAMP NOT NULL COMMENT '解封时间',
+                    is_permanent BOOLEAN DEFAULT FALSE COMMENT '是否永久封禁',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
                 
-                INDEX idx_ip_address (ip_address),
-                INDEX idx_expires_at (expires_at),
-                INDEX idx_is_permanent (is_permanent)
-            ) ENGINE=InnoDB 
-              DEFAULT CHARSET=utf8mb4 
-              COLLATE=utf8mb4_unicode_ci 
-              COMMENT='IP封禁表：管理被封禁的IP地址'
-        ''')
-        
-        # 创建请求日志表（用于详细的安全分析）
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS request_logs (
-                id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                ip_address VARCHAR(45) NOT NULL COMMENT 'IP地址',
-                endpoint VARCHAR(200) NOT NULL COMMENT '请求端点',
-                method VARCHAR(10) NOT NULL COMMENT 'HTTP方法',
-                user_agent TEXT NULL COMMENT '用户代理',
-                status_code INT NULL COMMENT '响应状态码',
-                response_time FLOAT NULL COMMENT '响应时间(ms)',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '请求时间',
+                    INDEX idx_ip_address (ip_address),
+                    INDEX idx_expires_at (expires_at),
+                    INDEX idx_is_permanent (is_permanent)
+                ) ENGINE=InnoDB 
+                  DEFAULT CHARSET=utf8mb4 
+                  COLLATE=utf8mb4_unicode_ci 
+                  COMMENT='IP封禁表：管理被封禁的IP地址'
+            ''')
+        
+            # 创建请求日志表（用于详细的安全分析）
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS request_logs (
+                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    ip_address VARCHAR(45) NOT NULL COMMENT 'IP地址',
+                    endpoint VARCHAR(200) NOT NULL COMMENT '请求端点',
+                    method VARCHAR(10) NOT NULL COMMENT 'HTTP方法',
+                    user_agent TEXT NULL COMMENT '用户代理',
+                    status_code INT NULL COMMENT '响应状态码',
+                    response_time FLOAT NULL COMMENT '响应时间(ms)',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '请求时间',
                 
-                INDEX idx_ip_address (ip_address),
-                INDEX idx_endpoint (endpoint),
-                INDEX idx_created_at (created_at),
-                INDEX idx_ip_time (ip_address, created_at)
-            ) ENGINE=InnoDB 
-              DEFAULT CHARSET=utf8mb4 
-              COLLATE=utf8mb4_unicode_ci 
-              COMMENT='请求日志表：记录所有API请求用于安全分析'
-        ''')
+                    INDEX idx_ip_address (ip_address),
+                    INDEX idx_created_at (created_at),
+                    INDEX idx_ip_time (ip_address, created_at),
+                    INDEX idx_endpoint_time (endpoint, created_at),
+                    INDEX idx_status_time (status_code, created_at)
+                ) ENGINE=InnoDB 
+                  DEFAULT CHARSET=utf8mb4 
+                  COLLATE=utf8mb4_unicode_ci 
+                  COMMENT='请求日志表：记录所有API请求用于安全分析'
+            ''')
+        
+            # 创建数据版本表（用于响应缓存失效）
+            cursor.execute(DATA_VERSIONS_TABLE_SQL)
+
+            # 创建变更事件表（用于推送更新）
+            cursor.execute(CHANGE_EVENTS_TABLE_SQL)
+        
+            # 创建统计汇总表
+            for sql in stats_rollup.CREATE_TABLES_SQL:
+                cursor.execute(sql)
+            for sql in request_rollup.CREATE_TABLES_SQL:
+                cursor.execute(sql)
+        
+            # 为已存在的旧表补充后来新增的列
+            if ensure_column(cursor, 'request_minutes', 'timed', 'INT NOT NULL DEFAULT 0'):
+                request_rollup.backfill_timed(cursor)
+        
+            # 为已存在的旧表补充后来新增的索引
+            ensure_index(cursor, 'activity_logs', 'idx_type_id', '(activity_type, id)')
+            ensure_index(cursor, 'activity_logs', 'idx_country', '(country)')
+            ensure_index(cursor, 'red_packet_codes', 'idx_used_created', '(is_used, created_at, id)')
+            ensure_index(cursor, 'request_logs', 'idx_endpoint_time', '(endpoint, created_at)')
+            ensure_index(cursor, 'request_logs', 'idx_status_time', '(status_code, created_at)')
+            try:
+                ensure_index(cursor, 'red_packet_codes', 'uq_used_by_ip', '(used_by_ip)', unique=True)
+            except storage.IntegrityError as e:
+                logger.error(f"red_packet_codes 中存在同一IP领取多个口令的记录，无法添加唯一索引 uq_used_by_ip: {e}")
         
-        conn.commit()
-        conn.close()
-        logger.info("MySQL数据库初始化完成")
+            # 汇总表为空（新建或从旧版本升级）时根据已有数据计算一次
+            if stats_rollup.is_empty(cursor):
+                stats_rollup.rebuild(conn)
+            else:
+                stats_rollup.backfill_total_visitors(cursor)
+            # 请求汇总表只补算今天的数据，更早的历史可用 python request_rollup.py rebuild 计算
+            if request_rollup.is_empty(cursor):
+                request_rollup.rebuild(conn, datetime.combine(datetime.now().date(), datetime.min.time()))
+        
+        logger.info(f"数据库初始化完成（{DB_BACKEND}）")
         
     except Exception as e:
         logger.error(f"数据库初始化失败: {e}")
@@ -174,172 +462,95 @@ def get_client_ip():
     else:
         return request.environ['HTTP_X_FORWARDED_FOR']
 
-def get_ip_location(ip_address):
-    """获取IP地址的地理位置信息"""
-    try:
-        # 使用免费的IP地理位置API
-        response = requests.get(f'http://ip-api.com/json/{ip_address}?lang=zh-CN', timeout=3)
-        if response.status_code == 200:
-            data = response.json()
-            if data['status'] == 'success':
-                return {
-                    'country': data.get('country', ''),
-                    'region': data.get('regionName', ''),
-                    'city': data.get('city', ''),
-                    'isp': data.get('isp', '')
-                }
-    except Exception as e:
-        logger.error(f"获取IP位置信息失败: {e}")
-    
-    return {'country': '', 'region': '', 'city': '', 'isp': ''}
-
-def is_ip_banned(ip_address):
-    """检查IP是否被封禁"""
-    # 首先检查内存缓存
-    if ip_address in blocked_ips:
-        ban_info = blocked_ips[ip_address]
-        if ban_info['expires_at'] > datetime.now():
-            return True, ban_info['reason']
-        else:
-            # 过期了，从缓存中移除
-            del blocked_ips[ip_address]
-    
-    # 检查数据库
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT ban_reason, expires_at, is_permanent 
-            FROM ip_bans 
-            WHERE ip_address = %s AND (expires_at > NOW() OR is_permanent = TRUE)
-        ''', (ip_address,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            ban_reason, expires_at, is_permanent = result
-            # 更新内存缓存
-            blocked_ips[ip_address] = {
-                'reason': ban_reason,
-                'expires_at': expires_at if not is_permanent else datetime.max,
-                'is_permanent': is_permanent
-            }
-            return True, ban_reason
-            
-    except Exception as e:
-        logger.error(f"检查IP封禁状态失败: {e}")
-    
-    return False, None
+# 永久封禁的解封时间
+PERMANENT_BAN_EXPIRES_AT = datetime(2099, 12, 31, 23, 59, 59)
 
-def ban_ip(ip_address, reason="Rate limit exceeded", duration_seconds=None):
-    """封禁IP地址"""
+def ban_ip(ip_address, reason="Rate limit exceeded", duration_seconds=None, is_permanent=False):
+    """封禁IP地址（写库、推送 ban.added 和递增版本号在同一个连接中完成，只推送一次）"""
     if duration_seconds is None:
         duration_seconds = SECURITY_CONFIG['BAN_DURATION']
     
-    expires_at = datetime.now() + timedelta(seconds=duration_seconds)
+    if is_permanent:
+        expires_at = PERMANENT_BAN_EXPIRES_AT
+    else:
+        expires_at = datetime.now() + timedelta(seconds=duration_seconds)
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 检查是否已经存在封禁记录
-        cursor.execute('SELECT id, ban_count FROM ip_bans WHERE ip_address = %s', (ip_address,))
-        existing = cursor.fetchone()
-        
-        if existing:
-            # 更新现有记录
-            ban_id, ban_count = existing
-            cursor.execute('''
-                UPDATE ip_bans 
-                SET ban_reason = %s, ban_count = ban_count + 1, 
-                    banned_at = NOW(), expires_at = %s, updated_at = NOW()
-                WHERE id = %s
-            ''', (reason, expires_at, ban_id))
-            logger.warning(f"IP {ip_address} 再次被封禁，原因: {reason}，封禁次数: {ban_count + 1}")
-        else:
-            # 创建新的封禁记录
-            cursor.execute('''
-                INSERT INTO ip_bans (ip_address, ban_reason, expires_at) 
-                VALUES (%s, %s, %s)
-            ''', (ip_address, reason, expires_at))
-            logger.warning(f"IP {ip_address} 被封禁，原因: {reason}，解封时间: {expires_at}")
-        
-        # 更新内存缓存
-        blocked_ips[ip_address] = {
-            'reason': reason,
-            'expires_at': expires_at,
-            'is_permanent': False
-        }
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
         
-        conn.commit()
-        conn.close()
+            # 检查是否已经存在封禁记录
+            cursor.execute('SELECT id, ban_count FROM ip_bans WHERE ip_address = %s', (ip_address,))
+            existing = cursor.fetchone()
+        
+            if existing:
+                # 更新现有记录
+                ban_id, ban_count = existing
+                cursor.execute('''
+                    UPDATE ip_bans 
+                    SET ban_reason = %s, ban_count = ban_count + 1, 
+                        banned_at = NOW(), expires_at = %s, is_permanent = %s, updated_at = NOW()
+                    WHERE id = %s
+                ''', (reason, expires_at, is_permanent, ban_id))
+                logger.warning(f"IP {ip_address} 再次被封禁，原因: {reason}，封禁次数: {ban_count + 1}")
+            else:
+                # 创建新的封禁记录
+                cursor.execute('''
+                    INSERT INTO ip_bans (ip_address, ban_reason, expires_at, is_permanent) 
+                    VALUES (%s, %s, %s, %s)
+                ''', (ip_address, reason, expires_at, is_permanent))
+                logger.warning(f"IP {ip_address} 被封禁，原因: {reason}，解封时间: {expires_at}")
+            publish_event(cursor, 'ban.added', {'ip_address': ip_address, 'reason': reason,
+                                                'expires_at': expires_at.isoformat(), 'is_permanent': is_permanent})
+            data_versions.bump(cursor, 'bans')
+        
+        # 更新本 worker 的封禁列表，其它 worker 按版本号刷新
+        ban_list.add(ip_address, reason, expires_at, is_permanent=is_permanent)
         
     except Exception as e:
         logger.error(f"封禁IP失败: {e}")
 
 def log_request(ip_address, endpoint, method, user_agent, status_code=None, response_time=None):
-    """记录请求日志"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO request_logs (ip_address, endpoint, method, user_agent, status_code, response_time) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (ip_address, endpoint, method, user_agent, status_code, response_time))
-        
-        conn.commit()
-        conn.close()
-        
-    except Exception as e:
-        logger.error(f"记录请求日志失败: {e}")
+    """记录请求日志（放入队列，由后台线程批量写入）"""
+    retention.ensure_started()
+    request_log_writer.submit(ip_address, endpoint, method, user_agent, status_code, response_time,
+                              datetime.now())
 
-def check_rate_limit(ip_address):
-    """检查IP是否超过速率限制"""
+def check_rate_limit(ip_address, whitelisted=False):
+    """检查IP是否超过速率限制（whitelisted 为封禁列表中白名单规则的匹配结果）"""
     # 白名单IP不受限制
-    if ip_address in SECURITY_CONFIG['WHITELIST_IPS']:
+    if whitelisted:
+        rate_limit_decisions.inc('whitelisted')
         return False, 0
     
-    current_time = time.time()
-    window_start = current_time - SECURITY_CONFIG['RATE_LIMIT_WINDOW']
-    
-    # 清理过期的请求记录
-    request_counts[ip_address] = [req_time for req_time in request_counts[ip_address] if req_time > window_start]
-    
-    # 添加当前请求
-    request_counts[ip_address].append(current_time)
-    
-    request_count = len(request_counts[ip_address])
-    
-    # 检查是否超过速率限制
-    if request_count > SECURITY_CONFIG['RATE_LIMIT_REQUESTS']:
-        return True, request_count
-    
-    return False, request_count
+    # 滑动窗口计数（所有 worker 共享），同时计入封禁阈值窗口
+    ban_counter.hit(ip_address)
+    rate_limited, request_count = rate_limiter.hit(ip_address)
+    rate_limit_decisions.inc('limited' if rate_limited else 'allowed')
+    return rate_limited, request_count
 
 def check_ban_threshold(ip_address):
-    """检查IP是否达到封禁阈值"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 检查在指定时间窗口内的请求数量
-        window_start = datetime.now() - timedelta(seconds=SECURITY_CONFIG['BAN_WINDOW'])
-        cursor.execute('''
-            SELECT COUNT(*) FROM request_logs 
-            WHERE ip_address = %s AND created_at >= %s
-        ''', (ip_address, window_start))
-        
-        request_count = cursor.fetchone()[0]
-        conn.close()
-        
-        return request_count >= SECURITY_CONFIG['BAN_THRESHOLD'], request_count
-        
-    except Exception as e:
-        logger.error(f"检查封禁阈值失败: {e}")
-        return False, 0
+    """检查IP是否达到封禁阈值（读取共享的窗口计数，不查询数据库）"""
+    request_count = ban_counter.peek(ip_address)
+    return request_count >= SECURITY_CONFIG['BAN_THRESHOLD'], request_count
+
+def _ban_page_parts(rate_limited):
+    """把封禁页面切分为 URL 参数插入点前后两部分（限流页面先替换标题和提示文字）"""
+    def build(source):
+        if rate_limited:
+            source = source.replace('访问被限制', '请求过于频繁')
+            source = source.replace('您的IP地址已被暂时限制访问', '您的请求过于频繁，请稍后再试')
+        head, mark, tail = source.partition('window.location.search')
+        return (head, tail) if mark else (source, None)
+    return build
+
+def render_ban_page(params, rate_limited=False):
+    """生成封禁/限流页面，params 为页面脚本读取的查询参数"""
+    key = 'rate_limited' if rate_limited else 'banned'
+    head, tail = page_templates.derived('banned.html', key, _ban_page_parts(rate_limited))
+    if tail is None:
+        return head
+    return f"{head}'{params}' || window.location.search{tail}"
 
 def security_middleware():
     """安全中间件装饰器"""
@@ -352,9 +563,11 @@ def security_middleware():
             method = request.method
             user_agent = request.headers.get('User-Agent', '')
             
-            # 检查IP是否被封禁
-            is_banned, ban_reason = is_ip_banned(ip_address)
-            if is_banned:
+            # 检查IP是否被封禁（读取封禁列表快照，白名单规则在同一次匹配中判断）
+            action, ban_info = ban_list.check(ip_address)
+            if action == DENY:
+                ban_reason = ban_info['reason']
+                ban_decisions.inc('blocked')
                 logger.warning(f"被封禁的IP {ip_address} 尝试访问 {endpoint}，原因: {ban_reason}")
                 log_request(ip_address, endpoint, method, user_agent, 403)
                 
@@ -366,44 +579,19 @@ def security_middleware():
                         'reason': ban_reason
                     }), 403
                 
-                # 对于页面请求，显示封禁页面
+                # 对于页面请求，显示封禁页面（封禁详情来自快照，不再查询数据库）
                 try:
-                    # 获取封禁详细信息
-                    conn = get_db_connection()
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        SELECT banned_at, expires_at, is_permanent 
-                        FROM ip_bans 
-                        WHERE ip_address = %s AND (expires_at > NOW() OR is_permanent = TRUE)
-                        ORDER BY banned_at DESC LIMIT 1
-                    ''', (ip_address,))
-                    ban_info = cursor.fetchone()
-                    conn.close()
-                    
-                    # 构建封禁页面URL参数
                     params = f"?reason={ban_reason}"
-                    if ban_info:
-                        banned_at, expires_at, is_permanent = ban_info
-                        if banned_at:
-                            params += f"&ban_time={banned_at.isoformat()}"
-                        if not is_permanent and expires_at:
-                            params += f"&unban_time={expires_at.isoformat()}"
-                            remaining_seconds = int((expires_at - datetime.now()).total_seconds())
-                            if remaining_seconds > 0:
-                                params += f"&remaining={remaining_seconds}"
-                    
-                    # 读取并返回封禁页面
-                    with open('banned.html', 'r', encoding='utf-8') as f:
-                        banned_page = f.read()
+                    banned_at, expires_at = ban_info['banned_at'], ban_info['expires_at']
+                    if banned_at:
+                        params += f"&ban_time={banned_at.isoformat()}"
+                    if not ban_info['is_permanent'] and expires_at:
+                        params += f"&unban_time={expires_at.isoformat()}"
+                        remaining_seconds = int((expires_at - datetime.now()).total_seconds())
+                        if remaining_seconds > 0:
+                            params += f"&remaining={remaining_seconds}"
                     
-                    # 如果有参数，添加到页面URL中
-                    if params != "?reason=" + ban_reason:
-                        banned_page = banned_page.replace(
-                            'window.location.search', 
-                            f"'{params}' || window.location.search"
-                        )
-                    
-                    return banned_page, 403, {'Content-Type': 'text/html; charset=utf-8'}
+                    return render_ban_page(params), 403, {'Content-Type': 'text/html; charset=utf-8'}
                     
                 except Exception as e:
                     logger.error(f"显示封禁页面失败: {e}")
@@ -420,14 +608,17 @@ def security_middleware():
                     ''', 403, {'Content-Type': 'text/html; charset=utf-8'}
             
             # 检查速率限制
-            rate_limited, request_count = check_rate_limit(ip_address)
+            rate_limited, request_count = check_rate_limit(ip_address, whitelisted=action == ALLOW)
             if rate_limited:
                 logger.warning(f"IP {ip_address} 超过速率限制: {request_count} 请求/分钟")
                 
                 # 检查是否达到封禁阈值
                 should_ban, total_requests = check_ban_threshold(ip_address)
                 if should_ban:
+                    # 清零计数，避免其它 worker 在封禁生效前重复写入封禁记录
+                    ban_counter.reset(ip_address)
                     ban_ip(ip_address, f"频繁访问，{SECURITY_CONFIG['BAN_WINDOW']}秒内请求{total_requests}次")
+                    ban_decisions.inc('issued')
                     log_request(ip_address, endpoint, method, user_agent, 403)
                     
                     # 如果是API请求，返回JSON错误
@@ -447,15 +638,7 @@ def security_middleware():
                         
                         params = f"?reason={ban_reason}&ban_time={ban_time.isoformat()}&unban_time={unban_time.isoformat()}&remaining={remaining_seconds}"
                         
-                        with open('banned.html', 'r', encoding='utf-8') as f:
-                            banned_page = f.read()
-                        
-                        banned_page = banned_page.replace(
-                            'window.location.search', 
-                            f"'{params}' || window.location.search"
-                        )
-                        
-                        return banned_page, 403, {'Content-Type': 'text/html; charset=utf-8'}
+                        return render_ban_page(params), 403, {'Content-Type': 'text/html; charset=utf-8'}
                         
                     except Exception as e:
                         logger.error(f"显示封禁页面失败: {e}")
@@ -484,18 +667,7 @@ def security_middleware():
                     retry_after = SECURITY_CONFIG['RATE_LIMIT_WINDOW']
                     params = f"?reason=请求过于频繁&remaining={retry_after}"
                     
-                    with open('banned.html', 'r', encoding='utf-8') as f:
-                        banned_page = f.read()
-                    
-                    # 修改页面标题和内容
-                    banned_page = banned_page.replace('访问被限制', '请求过于频繁')
-                    banned_page = banned_page.replace('您的IP地址已被暂时限制访问', '您的请求过于频繁，请稍后再试')
-                    banned_page = banned_page.replace(
-                        'window.location.search', 
-                        f"'{params}' || window.location.search"
-                    )
-                    
-                    return banned_page, 429, {'Content-Type': 'text/html; charset=utf-8'}
+                    return render_ban_page(params, rate_limited=True), 429, {'Content-Type': 'text/html; charset=utf-8'}
                     
                 except Exception as e:
                     logger.error(f"显示限制页面失败: {e}")
@@ -532,26 +704,72 @@ def security_middleware():
         return decorated_function
     return decorator
 
+def cached_response(*version_names):
+    """按数据版本缓存 GET 接口的响应，并支持 ETag / If-None-Match 返回 304
+
+    缓存键为请求路径和查询参数；ETag 由缓存键、相关数据版本号和当天日期（今日统计跨天会变化）生成。
+    """
+    def decorator(func):
+        @wraps(func)
+        def decorated_function(*args, **kwargs):
+            try:
+                versions = data_versions.current(version_names)
+            except Exception as e:
+                logger.error(f"读取数据版本失败，跳过响应缓存: {e}")
+                response_cache.count('bypassed')
+                return func(*args, **kwargs)
+            
+            key = (request.path, request.query_string)
+            versions['_day'] = datetime.now().strftime('%Y-%m-%d')
+            etag = ResponseCache.make_etag(key, versions)
+            
+            if request.if_none_match.contains(etag):
+                response_cache.count('not_modified')
+                response = make_response('', 304)
+            else:
+                cached = response_cache.get(key, etag)
+                if cached is not None:
+                    body, mimetype = cached
+                    response = app.response_class(body, mimetype=mimetype)
+                else:
+                    response = make_response(func(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    response_cache.set(key, etag, response.get_data(), response.mimetype)
+            
+            response.set_etag(etag)
+            # 浏览器每次都带 If-None-Match 重新验证
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        
+        return decorated_function
+    return decorator
+
+def insert_visit(ip, user_agent, referer):
+    """写入一条访问记录并在同一事务中更新统计汇总"""
+    now = datetime.now()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        conn.begin()
+        # 地理位置由后台任务补全，这里先留空
+        cursor.execute('''
+            INSERT INTO activity_logs (activity_type, ip_address, user_agent, referer, created_at) 
+            VALUES (%s, %s, %s, %s, %s)
+        ''', ('visit', ip, user_agent, referer, now))
+        visit_id = cursor.lastrowid
+        # 不更新 stats 版本号（见 DataVersions 的 time_buckets），避免所有访问争用同一行
+        stats_rollup.record_visit(cursor, ip, now.date())
+        conn.commit()
+    geo_enricher.submit(visit_id, ip)
+
 def record_visitor():
     """记录访客信息"""
     ip = get_client_ip()
     user_agent = request.headers.get('User-Agent', '')
     referer = request.headers.get('Referer', '')
     
-    # 获取地理位置信息
-    location = get_ip_location(ip)
-    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO activity_logs (activity_type, ip_address, user_agent, referer, country, city) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', ('visit', ip, user_agent, referer, location['country'], location['city']))
-        
-        conn.commit()
-        conn.close()
+        insert_visit(ip, user_agent, referer)
     except Exception as e:
         logger.error(f"记录访客失败: {e}")
 
@@ -559,46 +777,156 @@ def record_visitor():
 @security_middleware()
 def index():
     record_visitor()
-    return render_template_string(open('birthday.html', 'r', encoding='utf-8').read())
+    return render_template(page_templates.template('birthday.html'))
 
 @app.route('/birthday')
 @security_middleware()
 def birthday():
-    return render_template_string(open('birthday.html', 'r', encoding='utf-8').read())
+    return render_template(page_templates.template('birthday.html'))
+
+def serve_static_asset(path):
+    """提供预构建的静态资源，不经过 security_middleware（不计入限流、不写请求日志），不存在时返回 None"""
+    asset = static_assets.lookup(path, request.headers.get('Accept-Encoding'))
+    if asset is None:
+        return None
+    # 封禁检查只读内存快照，不访问数据库
+    if ban_list.get(get_client_ip()):
+        return make_response('', 403)
+    
+    if request.if_none_match.contains(asset['etag']):
+        response = make_response('', 304)
+    else:
+        response = app.response_class(asset['body'])
+        response.headers['Content-Type'] = asset['mimetype']
+        if asset['encoding']:
+            response.headers['Content-Encoding'] = asset['encoding']
+    response.set_etag(asset['etag'])
+    response.headers['Vary'] = 'Accept-Encoding'
+    # 带哈希的地址内容不会变化，可以长期缓存；原始文件名和页面每次重新验证
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable' if asset['immutable'] else 'no-cache'
+    return response
+
+@app.route('/assets/<path:filename>')
+def hashed_assets(filename):
+    """带内容哈希的静态资源"""
+    response = serve_static_asset(filename)
+    if response is None:
+        abort(404)
+    return response
 
-@app.route('/<path:filename>')
 @security_middleware()
-def static_files(filename):
-    """静态文件服务"""
+def _send_static_file(filename):
     return send_from_directory('.', filename)
 
+@app.route('/<path:filename>')
+def static_files(filename):
+    """静态文件服务（已构建的资源直接返回预压缩版本，其它文件经过安全中间件）"""
+    response = serve_static_asset(filename)
+    if response is not None:
+        return response
+    return _send_static_file(filename)
+
+def _parse_positive_int(name, default=None, maximum=None):
+    """解析查询参数中的正整数，格式错误时抛出 ValueError"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    value = int(value)
+    if value < 0:
+        raise ValueError(f"{name} 不能为负数")
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
+
+def _message_to_dict(row):
+    return {
+        'id': row[0],
+        'name': row[1],
+        'message': row[2],
+        'emoji': row[3],
+        'timestamp': row[4].isoformat() if row[4] else None
+    }
+
 @app.route('/api/messages', methods=['GET'])
 @security_middleware()
+@cached_response('messages')
 def get_messages():
-    """获取所有留言"""
+    """获取留言
+
+    支持基于 id 的游标分页（走 (activity_type, id) 索引，不随留言总数变慢）：
+    - limit: 每页条数（最大 MESSAGES_MAX_PAGE_SIZE）
+    - before_id: 返回 id 小于该值的更早留言，用于向下翻页
+    - since_id: 只返回 id 大于该值的新留言，用于增量同步
+    带任一参数时返回 {messages, has_more, next_before_id, latest_id}；
+    不带参数时按旧格式返回全部留言列表
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 获取留言
-        cursor.execute('''
-            SELECT name, message, emoji, created_at 
-            FROM activity_logs 
-            WHERE activity_type = 'message'
-            ORDER BY created_at DESC
-        ''')
-        messages = []
-        for row in cursor.fetchall():
-            messages.append({
-                'name': row[0],
-                'message': row[1],
-                'emoji': row[2],
-                'timestamp': row[3].isoformat() if row[3] else None
-            })
-        
-        conn.close()
+        limit = _parse_positive_int('limit', maximum=MESSAGES_MAX_PAGE_SIZE)
+        before_id = _parse_positive_int('before_id')
+        since_id = _parse_positive_int('since_id')
+    except ValueError:
+        return jsonify({'error': '分页参数无效'}), 400
+    
+    paginated = limit is not None or before_id is not None or since_id is not None
+    
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
         
-        return jsonify(messages)
+            if not paginated:
+                # 兼容旧客户端：返回全部留言
+                cursor.execute('''
+                    SELECT id, name, message, emoji, created_at 
+                    FROM activity_logs 
+                    WHERE activity_type = 'message'
+                    ORDER BY id DESC
+                ''')
+                return jsonify([_message_to_dict(row) for row in cursor.fetchall()])
+        
+            if limit is None or limit == 0:
+                limit = MESSAGES_DEFAULT_PAGE_SIZE
+        
+            if since_id is not None:
+                # 增量同步：从旧到新取 since_id 之后的留言，超过一页时客户端用新的 latest_id 继续拉取
+                cursor.execute('''
+                    SELECT id, name, message, emoji, created_at 
+                    FROM activity_logs 
+                    WHERE activity_type = 'message' AND id > %s
+                    ORDER BY id ASC
+                    LIMIT %s
+                ''', (since_id, limit + 1))
+                rows = cursor.fetchall()
+                has_more = len(rows) > limit
+                rows = list(rows[:limit])
+                rows.reverse()
+            else:
+                if before_id is not None:
+                    cursor.execute('''
+                        SELECT id, name, message, emoji, created_at 
+                        FROM activity_logs 
+                        WHERE activity_type = 'message' AND id < %s
+                        ORDER BY id DESC
+                        LIMIT %s
+                    ''', (before_id, limit + 1))
+                else:
+                    cursor.execute('''
+                        SELECT id, name, message, emoji, created_at 
+                        FROM activity_logs 
+                        WHERE activity_type = 'message'
+                        ORDER BY id DESC
+                        LIMIT %s
+                    ''', (limit + 1,))
+                rows = cursor.fetchall()
+                has_more = len(rows) > limit
+                rows = rows[:limit]
+        
+        messages = [_message_to_dict(row) for row in rows]
+        return jsonify({
+            'messages': messages,
+            'has_more': has_more,
+            'next_before_id': messages[-1]['id'] if messages else before_id,
+            'latest_id': messages[0]['id'] if messages else since_id
+        })
         
     except Exception as e:
         logger.error(f"获取留言失败: {e}")
@@ -632,21 +960,25 @@ def add_message():
     user_agent = request.headers.get('User-Agent', '')
     referer = request.headers.get('Referer', '')
     
-    # 获取地理位置信息
-    location = get_ip_location(ip)
-    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        now = datetime.now()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            conn.begin()
         
-        cursor.execute('''
-            INSERT INTO activity_logs (activity_type, name, message, emoji, ip_address, user_agent, referer, country, city) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ''', ('message', name, message, emoji, ip, user_agent, referer, location['country'], location['city']))
+            # 地理位置由后台任务补全，这里先留空
+            cursor.execute('''
+                INSERT INTO activity_logs (activity_type, name, message, emoji, ip_address, user_agent, referer, created_at) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ''', ('message', name, message, emoji, ip, user_agent, referer, now))
+        
+            message_id = cursor.lastrowid
+            stats_rollup.record_message(cursor, name, now.date())
+            publish_event(cursor, 'message.created', _message_to_dict((message_id, name, message, emoji, now)))
+            data_versions.bump(cursor, 'messages', 'stats')
+            conn.commit()
         
-        conn.commit()
-        message_id = cursor.lastrowid
-        conn.close()
+        geo_enricher.submit(message_id, ip)
         
         logger.info(f"新留言来自 {name}: {message}")
         
@@ -670,34 +1002,39 @@ def add_message():
         logger.error(f"保存留言失败: {e}")
         return jsonify({'error': '保存留言失败'}), 500
 
+def delete_messages_by_id(message_ids):
+    """按 activity_logs.id 删除留言（单个事务，同时更新统计汇总），返回实际删除的 id 列表"""
+    placeholders = ', '.join(['%s'] * len(message_ids))
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        conn.begin()
+        cursor.execute(f'''
+            SELECT id, name, created_at FROM activity_logs
+            WHERE id IN ({placeholders}) AND activity_type = 'message'
+            FOR UPDATE
+        ''', list(message_ids))
+        rows = cursor.fetchall()
+        if not rows:
+            conn.rollback()
+            return []
+        
+        deleted_ids = [row[0] for row in rows]
+        placeholders = ', '.join(['%s'] * len(deleted_ids))
+        cursor.execute(f'DELETE FROM activity_logs WHERE id IN ({placeholders})', deleted_ids)
+        stats_rollup.remove_messages(cursor, [(row[1], row[2].date()) for row in rows])
+        publish_event(cursor, 'message.deleted', {'ids': deleted_ids})
+        data_versions.bump(cursor, 'messages', 'stats')
+        conn.commit()
+    return deleted_ids
+
 @app.route('/api/messages/<int:message_id>', methods=['DELETE'])
 def delete_message(message_id):
-    """删除指定留言"""
+    """删除指定留言（message_id 为留言的数据库 id）"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 先获取所有留言，找到对应的留言
-        cursor.execute('''
-            SELECT id FROM activity_logs 
-            WHERE activity_type = 'message'
-            ORDER BY created_at DESC
-        ''')
-        message_ids = [row[0] for row in cursor.fetchall()]
-        
-        if message_id >= len(message_ids):
-            conn.close()
+        if not delete_messages_by_id([message_id]):
             return jsonify({'error': '留言不存在'}), 404
         
-        # 获取实际的数据库ID
-        actual_id = message_ids[message_id]
-        
-        # 删除留言
-        cursor.execute('DELETE FROM activity_logs WHERE id = %s', (actual_id,))
-        conn.commit()
-        conn.close()
-        
-        logger.info(f"删除留言 ID: {actual_id}")
+        logger.info(f"删除留言 ID: {message_id}")
         
         return jsonify({
             'success': True,
@@ -708,36 +1045,65 @@ def delete_message(message_id):
         logger.error(f"删除留言失败: {e}")
         return jsonify({'error': '删除留言失败'}), 500
 
+@app.route('/api/messages/bulk-delete', methods=['POST'])
+def bulk_delete_messages():
+    """批量删除留言，请求体为 {"ids": [留言id, ...]}"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids:
+        return jsonify({'error': '请提供要删除的留言id列表'}), 400
+    try:
+        ids = list(dict.fromkeys(int(i) for i in ids))
+    except (TypeError, ValueError):
+        return jsonify({'error': '留言id无效'}), 400
+    if len(ids) > MESSAGES_BULK_DELETE_MAX:
+        return jsonify({'error': f'单次最多删除 {MESSAGES_BULK_DELETE_MAX} 条留言'}), 400
+    
+    try:
+        deleted_ids = delete_messages_by_id(ids)
+        deleted = set(deleted_ids)
+        logger.info(f"批量删除留言 {len(deleted_ids)} 条: {deleted_ids}")
+        
+        return jsonify({
+            'success': True,
+            'deleted': deleted_ids,
+            'not_found': [i for i in ids if i not in deleted],
+            'message': f'成功删除 {len(deleted_ids)} 条留言'
+        })
+        
+    except Exception as e:
+        logger.error(f"批量删除留言失败: {e}")
+        return jsonify({'error': '批量删除留言失败'}), 500
+
 @app.route('/api/visitors', methods=['GET'])
 @security_middleware()
 def get_visitors():
     """获取访问记录"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
         
-        # 获取最近的访问记录
-        cursor.execute('''
-            SELECT ip_address, user_agent, referer, created_at, country, city 
-            FROM activity_logs 
-            WHERE activity_type = 'visit'
-            ORDER BY created_at DESC
-            LIMIT 50
-        ''')
-        
-        visitors = []
-        for row in cursor.fetchall():
-            visitors.append({
-                'ip': row[0],
-                'user_agent': row[1] or '',
-                'referer': row[2] or '',
-                'timestamp': row[3].isoformat() if row[3] else None,
-                'country': row[4] or '',
-                'city': row[5] or '',
-                'location': f"{row[4]} {row[5]}".strip() if (row[4] or row[5]) else '未知'
-            })
+            # 获取最近的访问记录
+            cursor.execute('''
+                SELECT ip_address, user_agent, referer, created_at, country, city 
+                FROM activity_logs 
+                WHERE activity_type = 'visit'
+                ORDER BY created_at DESC
+                LIMIT 50
+            ''')
+        
+            visitors = []
+            for row in cursor.fetchall():
+                visitors.append({
+                    'ip': row[0],
+                    'user_agent': row[1] or '',
+                    'referer': row[2] or '',
+                    'timestamp': row[3].isoformat() if row[3] else None,
+                    'country': row[4] or '',
+                    'city': row[5] or '',
+                    'location': f"{row[4]} {row[5]}".strip() if (row[4] or row[5]) else '未知'
+                })
         
-        conn.close()
         
         return jsonify({
             'visitors': visitors
@@ -757,19 +1123,7 @@ def record_visit():
         user_agent = request.headers.get('User-Agent', '')
         referer = request.headers.get('Referer', '')
         
-        # 获取地理位置信息
-        location = get_ip_location(ip)
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO activity_logs (activity_type, ip_address, user_agent, referer, country, city) 
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', ('visit', ip, user_agent, referer, location['country'], location['city']))
-        
-        conn.commit()
-        conn.close()
+        insert_visit(ip, user_agent, referer)
         
         return jsonify({'success': True})
         
@@ -777,93 +1131,148 @@ def record_visit():
         logger.error(f"记录访问失败: {e}")
         return jsonify({'error': '记录访问失败'}), 500
 
+def _event_channels():
+    """解析 channels 参数（逗号分隔），默认订阅留言和统计"""
+    requested = request.args.get('channels', 'messages,stats').split(',')
+    return {channel.strip() for channel in requested} & set(EVENT_CHANNELS.values())
+
+def _event_last_id(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+def _sse_message(event_type, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+def push_enabled():
+    """当前 worker 是否提供实时推送
+
+    SSE 和长轮询会长时间占用处理请求的线程。auto（默认）时只在 worker 能同时处理多个请求
+    （gthread/gevent worker 或多线程的开发服务器，wsgi.multithread 为真）时开启；
+    sync worker 下一个推送连接就会占住整个 worker，接口立即返回 503，页面退回每30秒定时刷新
+    """
+    mode = EVENTS_CONFIG['push']
+    if mode == 'auto':
+        return bool(request.environ.get('wsgi.multithread'))
+    return mode in ('on', 'true', '1')
+
+def _push_disabled_response():
+    return jsonify({'error': '当前服务器未开启实时推送', 'push': False}), 503
+
+@app.route('/api/events', methods=['GET'])
+@security_middleware()
+def event_stream():
+    """SSE 推送：新留言、删除留言、统计变化（channels 包含 bans 时还有封禁/解封）
+    
+    连接保持 EVENTS_STREAM_MAX_SECONDS 秒后关闭，浏览器的 EventSource 会带着 Last-Event-ID 自动重连，
+    重连期间的事件从缓冲区补发；无法补发时发送 resync 事件
+    """
+    if not push_enabled():
+        return _push_disabled_response()
+    channels = _event_channels()
+    last_event_id = _event_last_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    seq, replay, initial_resync = event_feed.subscribe(last_event_id)
+    
+    def generate():
+        yield f"retry: {EVENTS_CONFIG['retry_ms']}\n\n"
+        if initial_resync:
+            yield _sse_message('resync', {})
+        stats = event_feed.latest_stats()
+        if 'stats' in channels and stats is not None:
+            yield _sse_message('stats', stats)
+        for event in replay:
+            if EVENT_CHANNELS.get(event['type']) in channels:
+                yield _sse_message(event['type'], event['data'], event['id'])
+        
+        position = seq
+        deadline = time.monotonic() + EVENTS_CONFIG['stream_max_seconds']
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            position, events, resync = event_feed.wait(position, min(remaining, EVENTS_CONFIG['heartbeat']))
+            if resync:
+                yield _sse_message('resync', {})
+            sent = False
+            for event in events:
+                if EVENT_CHANNELS.get(event['type']) in channels:
+                    yield _sse_message(event['type'], event['data'], event['id'])
+                    sent = True
+            if not sent:
+                yield ': ping\n\n'
+    
+    return Response(generate(), headers={
+        'Content-Type': 'text/event-stream; charset=utf-8',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 关闭 nginx 的响应缓冲
+    })
+
+@app.route('/api/events/poll', methods=['GET'])
+@security_middleware()
+def event_poll():
+    """长轮询（不支持 EventSource 的客户端）：返回 id 大于 after 的事件，没有时最多等待 EVENTS_LONG_POLL_TIMEOUT 秒
+    
+    返回 {events, last_id, resync}，下次请求带上 after=last_id；首次请求不带 after，立即返回当前的 last_id 和统计
+    """
+    if not push_enabled():
+        return _push_disabled_response()
+    channels = _event_channels()
+    after = _event_last_id(request.args.get('after'))
+    seq, replay, resync = event_feed.subscribe(after)
+    events = [event for event in replay if EVENT_CHANNELS.get(event['type']) in channels]
+    
+    if after is None:
+        stats = event_feed.latest_stats()
+        if 'stats' in channels and stats is not None:
+            events.append({'id': None, 'type': 'stats', 'data': stats})
+    else:
+        deadline = time.monotonic() + EVENTS_CONFIG['long_poll_timeout']
+        while not events and not resync:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            seq, new_events, resync = event_feed.wait(seq, remaining)
+            events = [event for event in new_events if EVENT_CHANNELS.get(event['type']) in channels]
+    
+    # 只有事件 id 会推进 last_id（取最后一个事件，较晚提交的小 id 排在后面）；resync 时从当前位置重新开始
+    ids = [event['id'] for event in events if event['id'] is not None]
+    if ids:
+        last_id = ids[-1]
+    elif after is None or resync:
+        last_id = event_feed.last_id()
+    else:
+        last_id = after
+    return jsonify({
+        'events': [{'id': event['id'], 'type': event['type'], 'data': event['data']} for event in events],
+        'last_id': last_id,
+        'resync': resync
+    })
+
 @app.route('/api/stats', methods=['GET'])
 @security_middleware()
+@cached_response('stats')
 def get_stats():
-    """获取统计信息"""
+    """获取统计信息（读取汇总表，由写入路径增量维护）"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 总留言数
-        cursor.execute('SELECT COUNT(*) FROM activity_logs WHERE activity_type = %s', ('message',))
-        total_messages = cursor.fetchone()[0]
-        
-        # 总访客数（独立IP）
-        cursor.execute('SELECT COUNT(DISTINCT ip_address) FROM activity_logs WHERE activity_type = %s', ('visit',))
-        total_visitors = cursor.fetchone()[0]
-        
-        # 今日留言数
-        today = datetime.now().strftime('%Y-%m-%d')
-        cursor.execute('SELECT COUNT(*) FROM activity_logs WHERE activity_type = %s AND DATE(created_at) = %s', ('message', today))
-        today_messages = cursor.fetchone()[0]
-        
-        # 今日访客数（独立IP）
-        cursor.execute('SELECT COUNT(DISTINCT ip_address) FROM activity_logs WHERE activity_type = %s AND DATE(created_at) = %s', ('visit', today))
-        today_visitors = cursor.fetchone()[0]
-        
-        # 独特留言者数量
-        cursor.execute('SELECT COUNT(DISTINCT name) FROM activity_logs WHERE activity_type = %s', ('message',))
-        unique_messagers = cursor.fetchone()[0]
-        
-        conn.close()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            stats = stats_rollup.read(cursor, datetime.now().date())
         
-        return jsonify({
-            'totalMessages': total_messages,
-            'totalVisitors': total_visitors,
-            'todayMessages': today_messages,
-            'todayVisitors': today_visitors,
-            'uniqueMessagers': unique_messagers
-        })
+        return jsonify(stats)
         
     except Exception as e:
         logger.error(f"获取统计信息失败: {e}")
         return jsonify({'error': '获取统计信息失败'}), 500
 
 def get_available_red_packet_code(ip_address):
-    """获取可用的红包口令"""
+    """为中奖IP分配一个红包口令（见 red_packet_io.claim），失败时返回 None"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 首先检查该IP是否已经中过奖
-        cursor.execute('''
-            SELECT COUNT(*) FROM red_packet_codes 
-            WHERE used_by_ip = %s AND is_used = TRUE
-        ''', (ip_address,))
-        
-        already_won = cursor.fetchone()[0]
-        if already_won > 0:
-            logger.info(f"IP {ip_address} 已经中过奖，不能再次中奖")
-            conn.close()
-            return None
-        
-        # 获取一个未使用的红包口令
-        cursor.execute('''
-            SELECT id, code FROM red_packet_codes 
-            WHERE is_used = FALSE 
-            ORDER BY created_at ASC 
-            LIMIT 1
-        ''')
-        
-        result = cursor.fetchone()
-        if result:
-            code_id, code = result
-            
-            # 标记为已使用
-            cursor.execute('''
-                UPDATE red_packet_codes 
-                SET is_used = TRUE, used_by_ip = %s, used_at = NOW() 
-                WHERE id = %s
-            ''', (ip_address, code_id))
-            
-            conn.commit()
-            conn.close()
-            return code
-        
-        conn.close()
-        return None
-        
+        with get_db_connection() as conn:
+            return red_packet_io.claim(conn.cursor(), ip_address)
     except Exception as e:
         logger.error(f"获取红包口令失败: {e}")
         return None
@@ -872,29 +1281,28 @@ def get_available_red_packet_code(ip_address):
 def get_red_packets():
     """获取红包口令列表"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT id, code, description, amount, is_used, used_by_ip, used_at, created_at
-            FROM red_packet_codes 
-            ORDER BY created_at DESC
-        ''')
-        
-        red_packets = []
-        for row in cursor.fetchall():
-            red_packets.append({
-                'id': row[0],
-                'code': row[1],
-                'description': row[2],
-                'amount': float(row[3]) if row[3] else None,
-                'is_used': bool(row[4]),
-                'used_by_ip': row[5],
-                'used_at': row[6].isoformat() if row[6] else None,
-                'created_at': row[7].isoformat() if row[7] else None
-            })
+            cursor.execute('''
+                SELECT id, code, description, amount, is_used, used_by_ip, used_at, created_at
+                FROM red_packet_codes 
+                ORDER BY created_at DESC
+            ''')
+        
+            red_packets = []
+            for row in cursor.fetchall():
+                red_packets.append({
+                    'id': row[0],
+                    'code': row[1],
+                    'description': row[2],
+                    'amount': float(row[3]) if row[3] else None,
+                    'is_used': bool(row[4]),
+                    'used_by_ip': row[5],
+                    'used_at': row[6].isoformat() if row[6] else None,
+                    'created_at': row[7].isoformat() if row[7] else None
+                })
         
-        conn.close()
         return jsonify(red_packets)
         
     except Exception as e:
@@ -921,17 +1329,15 @@ def add_red_packet():
         return jsonify({'error': '口令不能为空'}), 400
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO red_packet_codes (code, description, amount) 
-            VALUES (%s, %s, %s)
-        ''', (code, description, amount))
+            cursor.execute('''
+                INSERT INTO red_packet_codes (code, description, amount) 
+                VALUES (%s, %s, %s)
+            ''', (code, description, amount))
         
-        conn.commit()
-        red_packet_id = cursor.lastrowid
-        conn.close()
+            red_packet_id = cursor.lastrowid
         
         logger.info(f"新增红包口令: {code}")
         
@@ -941,22 +1347,97 @@ def add_red_packet():
             'message': '红包口令添加成功'
         })
         
-    except pymysql.IntegrityError:
+    except storage.IntegrityError:
         return jsonify({'error': '该口令已存在'}), 400
     except Exception as e:
         logger.error(f"添加红包口令失败: {e}")
         return jsonify({'error': '添加红包口令失败'}), 500
 
+@app.route('/api/red-packets/import', methods=['POST'])
+def import_red_packets():
+    """批量导入红包口令
+
+    支持上传文件（表单字段 file，.json 按 JSON 解析，其它按 CSV 解析）、JSON 请求体
+    （字符串数组或 {code, description, amount} 对象数组）和 CSV 文本请求体（code,description,amount）
+    """
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            text = upload.read().decode('utf-8-sig')
+            if upload.filename and upload.filename.lower().endswith('.json'):
+                items = red_packet_io.parse_json(json.loads(text))
+            else:
+                items = red_packet_io.parse_csv(text)
+        elif request.is_json:
+            items = red_packet_io.parse_json(request.get_json(silent=True))
+        else:
+            items = red_packet_io.parse_csv(request.get_data(as_text=True).lstrip('\ufeff'))
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': f'无法解析导入数据: {e}'}), 400
+    
+    if not items:
+        return jsonify({'error': '没有可导入的口令'}), 400
+    if len(items) > RED_PACKET_IMPORT_MAX:
+        return jsonify({'error': f'单次最多导入 {RED_PACKET_IMPORT_MAX} 条口令'}), 400
+    
+    rows, duplicates, errors = red_packet_io.validate(items)
+    
+    try:
+        inserted = 0
+        if rows:
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                conn.begin()
+                inserted = red_packet_io.insert_codes(cursor, rows, RED_PACKET_IMPORT_CHUNK)
+                conn.commit()
+        
+        logger.info(f"批量导入红包口令: 共 {len(items)} 条，新增 {inserted} 条")
+        
+        return jsonify({
+            'success': True,
+            'total': len(items),
+            'inserted': inserted,
+            'duplicates': duplicates,                 # 导入数据内部重复
+            'existing': len(rows) - inserted,         # 数据库中已存在
+            'invalid': len(errors),
+            'errors': errors[:50]
+        })
+        
+    except Exception as e:
+        logger.error(f"批量导入红包口令失败: {e}")
+        return jsonify({'error': '批量导入红包口令失败'}), 500
+
+@app.route('/api/red-packets/export', methods=['GET'])
+def export_red_packets():
+    """流式导出全部红包口令（format=csv 或 json），用于对账"""
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in ('csv', 'json'):
+        return jsonify({'error': '导出格式只支持 csv 或 json'}), 400
+    
+    rows = red_packet_io.iter_rows(get_db_connection)
+    filename = f"red_packets_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    if export_format == 'csv':
+        body, mimetype = red_packet_io.stream_csv(rows), 'text/csv; charset=utf-8'
+    else:
+        body, mimetype = red_packet_io.stream_json(rows), 'application/json; charset=utf-8'
+    
+    return Response(
+        stream_with_context(body),
+        headers={
+            'Content-Type': mimetype,
+            'Content-Disposition': f'attachment; filename={filename}',
+            'Cache-Control': 'no-store'
+        }
+    )
+
 @app.route('/api/red-packets/<int:packet_id>', methods=['DELETE'])
 def delete_red_packet(packet_id):
     """删除红包口令"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('DELETE FROM red_packet_codes WHERE id = %s', (packet_id,))
-        conn.commit()
-        conn.close()
+            cursor.execute('DELETE FROM red_packet_codes WHERE id = %s', (packet_id,))
         
         logger.info(f"删除红包口令 ID: {packet_id}")
         
@@ -975,59 +1456,67 @@ def delete_red_packet(packet_id):
 def get_banned_ips():
     """获取被封禁的IP列表"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT ip_address, ban_reason, ban_count, banned_at, expires_at, is_permanent
-            FROM ip_bans 
-            WHERE expires_at > NOW() OR is_permanent = TRUE
-            ORDER BY banned_at DESC
-        ''')
-        
-        banned_ips = []
-        for row in cursor.fetchall():
-            # Calculate remaining time safely
-            remaining_time = 'Permanent'
-            if row[4] and not row[5]:  # has expires_at and not permanent
-                time_diff = row[4] - datetime.now()
-                if time_diff.total_seconds() > 0:
-                    remaining_time = str(time_diff).split('.')[0]  # Remove microseconds
-                else:
-                    remaining_time = 'Expired'
+            cursor.execute('''
+                SELECT ip_address, ban_reason, ban_count, banned_at, expires_at, is_permanent
+                FROM ip_bans 
+                WHERE expires_at > NOW() OR is_permanent = TRUE
+                ORDER BY banned_at DESC
+            ''')
+        
+            banned_ips = []
+            for row in cursor.fetchall():
+                # Calculate remaining time safely
+                remaining_time = 'Permanent'
+                if row[4] and not row[5]:  # has expires_at and not permanent
+                    time_diff = row[4] - datetime.now()
+                    if time_diff.total_seconds() > 0:
+                        remaining_time = str(time_diff).split('.')[0]  # Remove microseconds
+                    else:
+                        remaining_time = 'Expired'
             
-            banned_ips.append({
-                'ip_address': row[0],
-                'ban_reason': row[1],
-                'ban_count': row[2],
-                'banned_at': row[3].isoformat() if row[3] else None,
-                'expires_at': row[4].isoformat() if row[4] else None,
-                'is_permanent': bool(row[5]),
-                'remaining_time': remaining_time
-            })
+                banned_ips.append({
+                    'ip_address': row[0],
+                    'ban_reason': row[1],
+                    'ban_count': row[2],
+                    'banned_at': row[3].isoformat() if row[3] else None,
+                    'expires_at': row[4].isoformat() if row[4] else None,
+                    'is_permanent': bool(row[5]),
+                    'remaining_time': remaining_time
+                })
         
-        conn.close()
         return jsonify(banned_ips)
         
     except Exception as e:
         logger.error(f"获取封禁IP列表失败: {e}")
         return jsonify({'error': '获取封禁IP列表失败'}), 500
 
-@app.route('/api/security/banned-ips/<ip_address>', methods=['DELETE'])
+@app.route('/api/security/banned-ips/<path:ip_address>', methods=['DELETE'])
 @security_middleware()
 def unban_ip(ip_address):
-    """解封IP地址"""
+    """解封IP地址或网段（CIDR）"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        normalized = normalize_network(ip_address)
+    except ValueError:
+        return jsonify({'error': 'IP地址或网段格式无效'}), 400
+    
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('DELETE FROM ip_bans WHERE ip_address = %s', (ip_address,))
-        conn.commit()
-        conn.close()
+            # 同时匹配原始写法和规范写法（旧记录可能未规范化）
+            cursor.execute('DELETE FROM ip_bans WHERE ip_address IN (%s, %s)', (ip_address, normalized))
+            publish_event(cursor, 'ban.removed', {'ip_address': normalized})
+            data_versions.bump(cursor, 'bans')
         
-        # 从内存缓存中移除
-        if ip_address in blocked_ips:
-            del blocked_ips[ip_address]
+        # 从封禁列表中移除，其它 worker 按版本号刷新
+        ban_list.remove(ip_address)
+        ban_list.remove(normalized)
+        # 清除限流计数，避免解封后立刻再次触发限流
+        rate_limiter.reset(ip_address)
+        ban_counter.reset(ip_address)
         
         logger.info(f"IP {ip_address} 已被解封")
         
@@ -1057,23 +1546,14 @@ def manual_ban_ip():
     if not ip_address:
         return jsonify({'error': 'IP地址不能为空'}), 400
     
+    # 支持单个地址和 CIDR 网段（如 203.0.113.0/24），统一保存为规范写法
     try:
-        if is_permanent:
-            ban_ip(ip_address, reason, duration_seconds=None)
-            # 设置为永久封禁
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            # 使用datetime对象而不是字符串
-            permanent_date = datetime(2099, 12, 31, 23, 59, 59)
-            cursor.execute('''
-                UPDATE ip_bans 
-                SET is_permanent = TRUE, expires_at = %s
-                WHERE ip_address = %s
-            ''', (permanent_date, ip_address))
-            conn.commit()
-            conn.close()
-        else:
-            ban_ip(ip_address, reason, duration)
+        ip_address = normalize_network(ip_address)
+    except ValueError:
+        return jsonify({'error': 'IP地址或网段格式无效'}), 400
+    
+    try:
+        ban_ip(ip_address, reason, duration, is_permanent=bool(is_permanent))
         
         return jsonify({
             'success': True,
@@ -1087,53 +1567,81 @@ def manual_ban_ip():
 @app.route('/api/security/request-logs', methods=['GET'])
 @security_middleware()
 def get_request_logs():
-    """获取请求日志"""
+    """获取请求日志
+
+    按 (created_at, id) 倒序的游标分页：
+    - limit: 每页条数（最大 100）
+    - cursor: 上一页返回的 next_cursor，返回更早的日志
+    - ip / endpoint / status: 按IP、请求端点、响应状态码过滤
+    - since / until: 时间范围（ISO 格式，包含 since，不包含 until）
+    - page: 旧的页码分页（OFFSET），最多翻到 REQUEST_LOGS_MAX_OFFSET 条，建议改用 cursor
+    """
     try:
-        page = int(request.args.get('page', 1))
         limit = min(int(request.args.get('limit', 50)), 100)  # 最大100条
-        ip_filter = request.args.get('ip', '')
-        
-        offset = (page - 1) * limit
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 构建查询条件
-        where_clause = ''
-        params = []
-        if ip_filter:
-            where_clause = 'WHERE ip_address = %s'
-            params.append(ip_filter)
-        
-        # 获取总数
-        cursor.execute(f'SELECT COUNT(*) FROM request_logs {where_clause}', params)
-        total = cursor.fetchone()[0]
-        
-        # 获取日志
-        cursor.execute(f'''
-            SELECT ip_address, endpoint, method, user_agent, status_code, response_time, created_at
-            FROM request_logs {where_clause}
-            ORDER BY created_at DESC
-            LIMIT %s OFFSET %s
-        ''', params + [limit, offset])
+        page = int(request.args.get('page', 1))
+        status = request.args.get('status')
+        status = int(status) if status else None
+        since = request.args.get('since')
+        since = datetime.fromisoformat(since) if since else None
+        until = request.args.get('until')
+        until = datetime.fromisoformat(until) if until else None
+        cursor_value = request.args.get('cursor')
+        page_cursor = request_log_query.parse_cursor(cursor_value) if cursor_value else None
+    except ValueError:
+        return jsonify({'error': '查询参数无效'}), 400
+    
+    if limit < 1 or page < 1:
+        return jsonify({'error': '查询参数无效'}), 400
+    offset = 0 if page_cursor else (page - 1) * limit
+    if offset > REQUEST_LOGS_MAX_OFFSET:
+        return jsonify({'error': f'页码分页最多翻到第 {REQUEST_LOGS_MAX_OFFSET} 条，请使用 cursor 翻页'}), 400
+    
+    try:
+        where_clause, params = request_log_query.build_filters(
+            ip=request.args.get('ip', ''),
+            endpoint=request.args.get('endpoint', ''),
+            status=status,
+            since=since,
+            until=until
+        )
+        
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
         
+            # 总数：无过滤条件时估算，有过滤条件时使用缓存的 COUNT
+            total, total_estimated = request_log_query.count(cursor, where_clause, params, request_log_counts)
+        
+            # 获取日志（多取一条判断是否还有下一页）
+            page_where, page_params = request_log_query.cursor_condition(where_clause, params, page_cursor)
+            cursor.execute(f'''
+                SELECT id, ip_address, endpoint, method, user_agent, status_code, response_time, created_at
+                FROM request_logs {page_where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s OFFSET %s
+            ''', page_params + [limit + 1, offset])
+            rows = cursor.fetchall()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         logs = []
-        for row in cursor.fetchall():
+        for row in rows:
             logs.append({
-                'ip_address': row[0],
-                'endpoint': row[1],
-                'method': row[2],
-                'user_agent': row[3] or '',
-                'status_code': row[4],
-                'response_time': row[5],
-                'created_at': row[6].isoformat() if row[6] else None
+                'id': row[0],
+                'ip_address': row[1],
+                'endpoint': row[2],
+                'method': row[3],
+                'user_agent': row[4] or '',
+                'status_code': row[5],
+                'response_time': row[6],
+                'created_at': row[7].isoformat() if row[7] else None
             })
         
-        conn.close()
-        
         return jsonify({
             'logs': logs,
+            'has_more': has_more,
+            'next_cursor': request_log_query.make_cursor(rows[-1][7], rows[-1][0]) if has_more else None,
             'total': total,
+            'total_estimated': total_estimated,
             'page': page,
             'limit': limit,
             'total_pages': (total + limit - 1) // limit
@@ -1146,56 +1654,44 @@ def get_request_logs():
 @app.route('/api/security/stats', methods=['GET'])
 @security_middleware()
 def get_security_stats():
-    """获取安全统计信息"""
+    """获取安全统计信息
+
+    请求数、被拒绝数和最活跃IP读取分钟汇总表，可用 since / until（ISO 格式）指定时间范围，
+    默认为今天；today_* 字段保留旧名称，表示所选时间范围内的统计
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 当前被封禁的IP数量
-        cursor.execute('SELECT COUNT(*) FROM ip_bans WHERE expires_at > NOW() OR is_permanent = TRUE')
-        active_bans = cursor.fetchone()[0]
-        
-        # 今日被封禁的IP数量
-        today = datetime.now().strftime('%Y-%m-%d')
-        cursor.execute('SELECT COUNT(*) FROM ip_bans WHERE DATE(banned_at) = %s', (today,))
-        today_bans = cursor.fetchone()[0]
+        now = datetime.now()
+        since = request.args.get('since')
+        since = datetime.fromisoformat(since) if since else datetime.combine(now.date(), datetime.min.time())
+        until = request.args.get('until')
+        until = datetime.fromisoformat(until) if until else now + timedelta(minutes=1)
+    except ValueError:
+        return jsonify({'error': '时间范围参数无效'}), 400
+    
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
         
-        # 今日请求总数
-        cursor.execute('SELECT COUNT(*) FROM request_logs WHERE DATE(created_at) = %s', (today,))
-        today_requests = cursor.fetchone()[0]
+            # 当前被封禁的IP数量
+            cursor.execute('SELECT COUNT(*) FROM ip_bans WHERE expires_at > NOW() OR is_permanent = TRUE')
+            active_bans = cursor.fetchone()[0]
         
-        # 今日被拒绝的请求数（403, 429状态码）
-        cursor.execute('''
-            SELECT COUNT(*) FROM request_logs 
-            WHERE DATE(created_at) = %s AND status_code IN (403, 429)
-        ''', (today,))
-        today_blocked = cursor.fetchone()[0]
+            # 时间范围内被封禁的IP数量
+            cursor.execute('SELECT COUNT(*) FROM ip_bans WHERE banned_at >= %s AND banned_at < %s', (since, until))
+            range_bans = cursor.fetchone()[0]
         
-        # 最活跃的IP（今日请求最多的前10个）
-        cursor.execute('''
-            SELECT ip_address, COUNT(*) as request_count
-            FROM request_logs 
-            WHERE DATE(created_at) = %s
-            GROUP BY ip_address
-            ORDER BY request_count DESC
-            LIMIT 10
-        ''', (today,))
-        
-        top_ips = []
-        for row in cursor.fetchall():
-            top_ips.append({
-                'ip_address': row[0],
-                'request_count': row[1]
-            })
-        
-        conn.close()
+            # 请求总数、被拒绝的请求数（403, 429状态码）和最活跃的前10个IP
+            summary = request_rollup.read(cursor, since, until, top=10)
         
         return jsonify({
             'active_bans': active_bans,
-            'today_bans': today_bans,
-            'today_requests': today_requests,
-            'today_blocked': today_blocked,
-            'top_ips': top_ips,
+            'today_bans': range_bans,
+            'today_requests': summary['requests'],
+            'today_blocked': summary['blocked'],
+            'avg_response_time': summary['avg_response_time'],
+            'top_ips': summary['top_ips'],
+            'since': since.isoformat(),
+            'until': until.isoformat(),
             'security_config': SECURITY_CONFIG
         })
         
@@ -1203,9 +1699,68 @@ def get_security_stats():
         logger.error(f"获取安全统计失败: {e}")
         return jsonify({'error': '获取安全统计失败'}), 500
 
+@app.route('/api/system/stats', methods=['GET'])
+@security_middleware()
+def get_system_stats():
+    """获取当前worker进程的连接池、请求日志队列等运行统计"""
+    return jsonify({
+        'db_backend': DB_BACKEND,
+        'db_pool': db_pool.stats(),
+        'request_log': request_log_writer.stats(),
+        'request_log_counts': request_log_counts.stats(),
+        'geoip': geo_locator.stats(),
+        'geo_enrich': geo_enricher.stats(),
+        'response_cache': response_cache.stats(),
+        'rate_limit': rate_limiter.stats(),
+        'ban_counter': ban_counter.stats(),
+        'ban_list': ban_list.stats(),
+        'templates': page_templates.stats(),
+        'retention': retention.stats(),
+        'events': event_feed.stats()
+    })
+
+@app.route('/api/system/db-pool', methods=['GET'])
+@security_middleware()
+def get_db_pool_stats():
+    """获取当前worker进程的数据库连接池统计（兼容旧接口，等同于 /api/system/stats 中的 db_pool）"""
+    return jsonify(db_pool.stats())
+
+@app.before_request
+def start_request_timer():
+    """记录请求开始时间（供 /metrics 的请求耗时统计）"""
+    metrics_registry.ensure_started()
+    g.metrics_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """按路由规则统计请求数和耗时（未匹配路由的请求记为 unmatched，避免标签无限增长）"""
+    start = g.get('metrics_start')
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        http_requests.inc(endpoint, request.method, str(response.status_code))
+        http_request_seconds.observe(time.perf_counter() - start, endpoint, request.method)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus 指标（所有 worker 汇总），只允许 METRICS_ALLOWED_IPS 中的对端地址或携带令牌的请求访问"""
+    token = METRICS_ACCESS['TOKEN']
+    authorization = request.headers.get('Authorization', '')
+    has_token = bool(token) and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    if not has_token and metrics_allowed.check(request.remote_addr or '')[0] != ALLOW:
+        return jsonify({'error': '访问被拒绝'}), 403
+    try:
+        return Response(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    except Exception as e:
+        logger.error(f"生成指标失败: {e}")
+        return jsonify({'error': '生成指标失败'}), 500
+
 @app.route('/admin')
 def admin_page():
     """管理后台页面"""
+    response = serve_static_asset('admin.html')
+    if response is not None:
+        return response
     return send_from_directory('.', 'admin.html')
 
 @app.errorhandler(404)
@@ -1219,6 +1774,8 @@ def internal_error(error):
     return jsonify({'error': '服务器内部错误'}), 500
 
 if __name__ == '__main__':
+    # 清空上次运行留下的指标快照
+    metrics_registry.clear()
     try:
         # 初始化数据库
         print("🔧 正在初始化数据库...")
@@ -0,0 +1,196 @@
+"""
+IP 封禁列表快照
+
+每个 worker 在内存中保存全部生效中的封禁记录（ip_bans 表通常很小），ip_address 可以是单个地址
+或 CIDR 网段，记录放在 IPPolicy 前缀树中，请求路径上的封禁检查是一次最长前缀匹配，不访问数据库。后台线程每隔 refresh_interval 秒读取 data_versions 中
+'bans' 的版本号（主键查询），版本变化时重新加载快照；本 worker 内的封禁/解封直接修改快照。
+为了覆盖绕过应用直接修改 ip_bans 的情况，每隔 full_reload_interval 秒无条件重新加载一次。
+
+白名单（allow）和封禁（deny）放在同一棵前缀树中，一次查询按最长前缀决定结果：
+封禁网段内单独放行的地址可以访问，白名单网段内单独封禁的地址被拒绝；同一网段两者都有时封禁优先。
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from ip_policy import ALLOW, DENY, IPPolicy, normalize_network
+
+logger = logging.getLogger(__name__)
+
+
+class BanList:
+    """生效中的 IP 封禁快照（每个 worker 进程一份）"""
+
+    VERSION_NAME = 'bans'
+
+    def __init__(self, connection_factory, data_versions, refresh_interval=2.0, full_reload_interval=300,
+                 allow=()):
+        self.connection_factory = connection_factory
+        self.data_versions = data_versions
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self._allow = []            # 白名单网段（规范写法），来自配置，不随重新加载变化
+        for entry in allow:
+            if not entry.strip():
+                continue
+            try:
+                self._allow.append(normalize_network(entry))
+            except ValueError:
+                logger.warning(f"忽略无效的白名单条目: {entry}")
+        # 白名单网段 -> None；封禁网段 -> {'reason', 'banned_at', 'expires_at', 'is_permanent'}
+        self._policy = self._new_policy()
+        self._version = None
+        self._loaded_at = None
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._start_lock = threading.Lock()
+        self._load_lock = threading.Lock()      # 重新加载与本 worker 内的增删互斥，避免增删落在即将被替换的旧快照上
+        self._first_load_lock = threading.Lock()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'checks': 0,
+            'banned_hits': 0,
+            'polls': 0,
+            'reloads': 0,
+            'errors': 0,
+        }
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _new_policy(self):
+        policy = IPPolicy()
+        for network in self._allow:
+            policy.allow(network)
+        return policy
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='ban-list-refresh', daemon=True)
+            self._thread.start()
+
+    def load(self):
+        """从数据库重新加载全部生效中的封禁记录"""
+        with self._load_lock:
+            # 先读版本号再读数据：两次读取之间发生的修改会在下一次轮询时再加载一次
+            version = self.data_versions.current([self.VERSION_NAME])[self.VERSION_NAME]
+            with self.connection_factory() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT ip_address, ban_reason, banned_at, expires_at, is_permanent
+                    FROM ip_bans
+                    WHERE expires_at > NOW() OR is_permanent = TRUE
+                ''')
+                rows = cursor.fetchall()
+            policy = self._new_policy()
+            for ip_address, ban_reason, banned_at, expires_at, is_permanent in rows:
+                try:
+                    policy.deny(ip_address, {
+                        'reason': ban_reason,
+                        'banned_at': banned_at,
+                        'expires_at': expires_at,
+                        'is_permanent': bool(is_permanent)
+                    })
+                except ValueError:
+                    logger.warning(f"忽略无效的封禁记录: {ip_address}")
+            self._policy = policy
+            self._version = version
+            self._loaded_at = time.monotonic()
+            self._count('reloads')
+
+    def refresh(self):
+        """版本号变化或距离上次加载超过 full_reload_interval 时重新加载，返回是否重新加载"""
+        self._count('polls')
+        version = self.data_versions.current([self.VERSION_NAME])[self.VERSION_NAME]
+        stale = self._loaded_at is None or time.monotonic() - self._loaded_at >= self.full_reload_interval
+        if version != self._version or stale:
+            self.load()
+            return True
+        return False
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                self._count('errors')
+                logger.error(f"刷新封禁列表失败: {e}")
+
+    def check(self, ip_address, now=None):
+        """返回 (ALLOW, None)（白名单）、(DENY, 封禁信息) 或 (None, None)，按最长前缀匹配"""
+        self._ensure_thread()
+        if self._loaded_at is None:
+            self._first_load()
+        self._count('checks')
+        now = now or datetime.now()
+        # 已过期的封禁跳过，继续匹配更短的网段（过期的单个地址封禁不能让所在网段的封禁失效）
+        action, entry = self._policy.check(
+            ip_address, lambda action, data: action == ALLOW or data['is_permanent'] or data['expires_at'] > now)
+        if action == DENY:
+            self._count('banned_hits')
+        return action, entry
+
+    def get(self, ip_address, now=None):
+        """返回生效中的封禁信息，未封禁（或被更具体的白名单放行）返回 None"""
+        action, entry = self.check(ip_address, now)
+        return entry if action == DENY else None
+
+    def _first_load(self):
+        # 并发的首批请求只有一个去加载，其余等待加载结果
+        with self._first_load_lock:
+            if self._loaded_at is not None:
+                return
+            try:
+                self.load()
+            except Exception as e:
+                self._count('errors')
+                logger.error(f"加载封禁列表失败: {e}")
+                # 不在每个请求上重试，交给后台线程在下一次轮询时重新加载
+                self._loaded_at = time.monotonic() - self.full_reload_interval
+
+    def add(self, ip_address, reason, expires_at, is_permanent=False, banned_at=None):
+        """本 worker 内立即生效的封禁（调用方负责写库并递增版本号），ip_address 可以是 CIDR 网段"""
+        with self._load_lock:
+            self._policy.deny(ip_address, {
+                'reason': reason,
+                'banned_at': banned_at or datetime.now(),
+                'expires_at': expires_at,
+                'is_permanent': is_permanent
+            })
+
+    def remove(self, ip_address):
+        """本 worker 内立即生效的解封（调用方负责写库并递增版本号）"""
+        try:
+            network = normalize_network(ip_address)
+        except ValueError:
+            return
+        with self._load_lock:
+            self._policy.remove(network)
+            if network in self._allow:
+                # 同一网段的白名单被封禁覆盖过，解封后恢复
+                self._policy.allow(network)
+
+    def stats(self):
+        """封禁列表统计（当前 worker 进程）"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['entries'] = len(self._policy)           # 包括白名单条目
+        stats['whitelist_entries'] = len(self._allow)
+        stats['version'] = self._version
+        return stats
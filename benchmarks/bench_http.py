@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+HTTP 基准测试：准备数据 + 混合流量 + 按路由统计延迟
+
+1. 在单独的测试库（MySQL，或 --backend sqlite 时的 SQLite 文件，不需要数据库服务）中建表并写入一批数据（留言、访问记录、请求日志、封禁记录、红包口令），
+   数量和时间跨度可配置，--seed 固定随机数，两次运行的数据完全一致；随后重新计算统计汇总表
+2. 用 gunicorn.conf.py 启动应用（也可以用 --url 指向已经运行的服务，此时不准备数据）
+3. 多个线程模拟不同的访客：
+   - visitor  打开页面、上报访问、翻页读取留言和统计（每个请求随机使用一个外部IP，受限流和封禁检查）
+   - poster   发表留言
+   - admin    轮询管理后台用到的接口（来自 127.0.0.1，白名单）
+   - flooder  单个IP不间断请求，触发限流和封禁
+4. 预热 --warmup 秒后统计 --duration 秒，按 "方法 路由" 输出请求数、状态码分布、吞吐和 p50/p95/p99，
+   写入 --output 指定的 JSON 文件；flooder 的请求单独统计，不计入各路由
+
+两次结果可以用 compare 子命令对比，p95 变慢超过 --threshold 时退出码为 1，可用于 CI：
+    python benchmarks/bench_http.py compare baseline.json current.json [--threshold 0.2]
+
+会清空测试库中的数据，请不要指向生产库。
+
+用法：
+    python benchmarks/bench_http.py run [--database birthday_board_bench] [--duration 30] [--output result.json]
+        [--messages 5000] [--visits 100000] [--request-logs 200000] [--bans 500] [--red-packets 2000]
+        [--visitors 24] [--posters 2] [--admins 2] [--flooders 1] [--worker-class sync]
+        [--backend sqlite] [--sqlite-path /tmp/birthday_board_bench.sqlite3]
+"""
+
+import argparse
+import gzip
+import http.client
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from load_worker_classes import _free_port, wait_ready
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SEED_TABLES = ['activity_logs', 'request_logs', 'ip_bans', 'red_packet_codes', 'change_events',
+               'request_minutes', 'request_minute_ips']
+
+ENDPOINTS = ['/', '/api/messages', '/api/visit', '/api/stats', '/api/visitors', '/api/red-packets',
+             '/api/security/stats', '/api/security/request-logs', '/api/security/banned-ips']
+USER_AGENTS = [
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36',
+    'Mozilla/5.0 (Linux; Android 14) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36',
+]
+EMOJIS = ['🎂', '🎉', '🎈', '🎁', '❤️', '🌟']
+CITIES = [('中国', '北京'), ('中国', '上海'), ('中国', '广州'), ('中国', '成都'), ('美国', '纽约'), (None, None)]
+
+
+def _ip(rng):
+    return f'203.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}'
+
+
+def _chunks(rows, size=1000):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def seed(args):
+    """建库建表，清空后写入数据，返回各表写入的行数"""
+    # 在导入 app 之前切换到测试库（load_dotenv 不会覆盖已有的环境变量）
+    os.environ.update(_backend_env(args))
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+    from app import MYSQL_CONFIG, data_versions, get_db_connection, init_database
+    import request_rollup
+    import stats_rollup
+
+    if args.backend == 'mysql':
+        import pymysql
+        server_config = {k: v for k, v in MYSQL_CONFIG.items() if k != 'database'}
+        conn = pymysql.connect(**server_config)
+        try:
+            conn.cursor().execute(
+                f"CREATE DATABASE IF NOT EXISTS `{args.database}` DEFAULT CHARSET utf8mb4 COLLATE utf8mb4_unicode_ci")
+        finally:
+            conn.close()
+    init_database()
+
+    rng = random.Random(args.seed)
+    now = datetime.now().replace(microsecond=0)
+    span = args.days * 86400
+
+    def when():
+        return now - timedelta(seconds=rng.randint(0, span))
+
+    counts = {}
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for table in SEED_TABLES:
+            cursor.execute(f'DELETE FROM {table}')
+
+        rows = []
+        for i in range(args.messages):
+            country, city = rng.choice(CITIES)
+            rows.append(('message', f'朋友{rng.randint(1, args.messages // 3 + 1)}',
+                         f'生日快乐！第 {i} 条祝福' * rng.randint(1, 4), rng.choice(EMOJIS), _ip(rng),
+                         rng.choice(USER_AGENTS), None, when(), country, city))
+        for _ in range(args.visits):
+            country, city = rng.choice(CITIES)
+            rows.append(('visit', None, None, None, _ip(rng), rng.choice(USER_AGENTS), 'https://example.com/',
+                         when(), country, city))
+        for chunk in _chunks(rows):
+            cursor.executemany('''
+                INSERT INTO activity_logs (activity_type, name, message, emoji, ip_address, user_agent, referer,
+                                           created_at, country, city)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ''', chunk)
+        counts['messages'] = args.messages
+        counts['visits'] = args.visits
+
+        rows = []
+        for _ in range(args.request_logs):
+            status = rng.choices([200, 304, 400, 403, 429, 500], weights=[80, 8, 3, 3, 5, 1])[0]
+            rows.append((_ip(rng), rng.choice(ENDPOINTS), rng.choice(['GET', 'GET', 'GET', 'POST']),
+                         rng.choice(USER_AGENTS), status, round(rng.uniform(1, 200), 2), when()))
+        for chunk in _chunks(rows):
+            cursor.executemany('''
+                INSERT INTO request_logs (ip_address, endpoint, method, user_agent, status_code, response_time, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ''', chunk)
+        counts['request_logs'] = args.request_logs
+
+        rows = []
+        for i in range(args.bans):
+            banned_at = when()
+            permanent = rng.random() < 0.1
+            expires_at = datetime(2099, 12, 31) if permanent else banned_at + timedelta(hours=rng.choice([1, 24, 72]))
+            # 10.x 段的地址不会被访客线程使用，封禁记录只影响封禁列表的大小
+            rows.append((f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}', '压力测试', rng.randint(1, 5),
+                         banned_at, expires_at, permanent))
+        for chunk in _chunks(rows):
+            cursor.executemany('''
+                INSERT INTO ip_bans (ip_address, ban_reason, ban_count, banned_at, expires_at, is_permanent)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            ''', chunk)
+        counts['bans'] = args.bans
+
+        rows = []
+        for i in range(args.red_packets):
+            used = rng.random() < 0.3
+            rows.append((f'BENCH-{i:07d}', '基准测试', round(rng.uniform(1, 20), 2), used,
+                         f'198.51.{i // 256 % 256}.{i % 256}' if used else None, when() if used else None, when()))
+        for chunk in _chunks(rows):
+            cursor.executemany('''
+                INSERT INTO red_packet_codes (code, description, amount, is_used, used_by_ip, used_at, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ''', chunk)
+        counts['red_packets'] = args.red_packets
+
+        stats_rollup.rebuild(conn)
+        request_rollup.rebuild(conn)
+        data_versions.bump(cursor, 'messages', 'stats', 'bans')
+    return counts
+
+
+class Recorder:
+    """按 "方法 路由" 记录延迟和状态码（只记录预热结束后的请求）"""
+
+    def __init__(self, record_after):
+        self.record_after = record_after
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+
+    def add(self, route, started, status, elapsed):
+        if started < self.record_after:
+            return
+        with self.lock:
+            if status is None:
+                self.errors[route] += 1
+            else:
+                self.latencies[route].append(elapsed)
+                self.statuses[route][status] += 1
+
+    def summary(self, seconds):
+        routes = {}
+        for route in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[route])
+
+            def pct(p):
+                if not values:
+                    return None
+                return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 2)
+
+            routes[route] = {
+                'requests': len(values),
+                'errors': self.errors[route],
+                'status': {str(code): n for code, n in sorted(self.statuses[route].items())},
+                'rps': round(len(values) / seconds, 2),
+                'mean_ms': round(sum(values) / len(values) * 1000, 2) if values else None,
+                'p50_ms': pct(0.50),
+                'p95_ms': pct(0.95),
+                'p99_ms': pct(0.99),
+                'max_ms': round(values[-1] * 1000, 2) if values else None,
+            }
+        return routes
+
+
+class Client:
+    """每个模拟访客一个保持连接的 HTTP 客户端"""
+
+    def __init__(self, base_url, recorder, ip=None):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.recorder = recorder
+        self.ip = ip
+        self.conn = None
+
+    def request(self, method, path, route=None, body=None, ip=None):
+        headers = {'User-Agent': USER_AGENTS[0], 'Accept-Encoding': 'gzip'}
+        forwarded = ip or self.ip
+        if forwarded:
+            headers['X-Forwarded-For'] = forwarded
+        data = None
+        if body is not None:
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        route = f"{method} {route or path.split('?')[0]}"
+        started = time.monotonic()
+        status = payload = None
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.conn.request(method, path, body=data, headers=headers)
+            response = self.conn.getresponse()
+            payload = response.read()
+            status = response.status
+            if response.getheader('Content-Encoding') == 'gzip':
+                payload = gzip.decompress(payload)
+            if response.getheader('Connection', '').lower() == 'close':
+                self.close()
+        except (OSError, http.client.HTTPException):
+            self.close()
+        self.recorder.add(route, started, status, time.monotonic() - started)
+        return status, payload
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def visitor(client, rng, stop, think):
+    while not stop.is_set():
+        ip = _ip(rng)
+        client.request('GET', '/', ip=ip)
+        client.request('POST', '/api/visit', body={}, ip=ip)
+        status, payload = client.request('GET', '/api/messages?limit=50', ip=ip)
+        if status == 200 and rng.random() < 0.3:
+            # 部分访客向下翻一页
+            before_id = json.loads(payload).get('next_before_id')
+            if before_id:
+                client.request('GET', f'/api/messages?limit=50&before_id={before_id}', ip=ip)
+        client.request('GET', '/api/stats', ip=ip)
+        if think:
+            stop.wait(rng.uniform(0, think * 2))
+
+
+def poster(client, rng, stop, think):
+    while not stop.is_set():
+        ip = _ip(rng)
+        client.request('POST', '/api/messages', ip=ip, body={
+            'name': f'访客{rng.randint(1, 10000)}',
+            'message': '生日快乐，天天开心！' * rng.randint(1, 5),
+            'emoji': rng.choice(EMOJIS),
+        })
+        client.request('GET', '/api/messages?limit=50', ip=ip)
+        stop.wait(rng.uniform(0, max(think, 0.5) * 2))
+
+
+def admin(client, rng, stop, think):
+    while not stop.is_set():
+        client.request('GET', '/api/security/stats')
+        client.request('GET', '/api/security/request-logs?limit=50')
+        client.request('GET', f"/api/security/request-logs?limit=50&status={rng.choice([403, 429])}")
+        client.request('GET', '/api/security/banned-ips')
+        client.request('GET', '/api/red-packets')
+        client.request('GET', '/api/visitors')
+        client.request('GET', '/api/system/stats')
+        stop.wait(max(think, 1.0))
+
+
+def flooder(client, rng, stop, think):
+    while not stop.is_set():
+        client.request('GET', '/api/messages?limit=50')
+
+
+ACTORS = {'visitors': visitor, 'posters': poster, 'admins': admin, 'flooders': flooder}
+
+
+def drive(base_url, args):
+    """运行混合流量，返回 (各路由统计, flooder 统计, 统计时长)"""
+    started = time.monotonic()
+    recorder = Recorder(started + args.warmup)
+    flood_recorder = Recorder(started + args.warmup)
+    stop = threading.Event()
+    threads = []
+    for kind, actor in ACTORS.items():
+        for n in range(getattr(args, kind)):
+            rng = random.Random(f'{args.seed}-{kind}-{n}')
+            if kind == 'flooders':
+                client = Client(base_url, flood_recorder, ip=f'192.0.2.{n + 1}')
+            else:
+                client = Client(base_url, recorder)
+            thread = threading.Thread(target=actor, args=(client, rng, stop, args.think), daemon=True)
+            threads.append((thread, client))
+            thread.start()
+    time.sleep(args.warmup + args.duration)
+    stop.set()
+    for thread, client in threads:
+        thread.join(timeout=30)
+        client.close()
+    measured = time.monotonic() - started - args.warmup
+    return recorder.summary(measured), flood_recorder.summary(measured), measured
+
+
+def _backend_env(args):
+    if args.backend == 'sqlite':
+        return {'DB_BACKEND': 'sqlite', 'SQLITE_PATH': args.sqlite_path}
+    return {'DB_BACKEND': 'mysql', 'MYSQL_DATABASE': args.database}
+
+
+def start_server(args):
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, GUNICORN_BIND=f'127.0.0.1:{port}', GUNICORN_WORKER_CLASS=args.worker_class,
+               GUNICORN_WORKERS=str(args.workers), **_backend_env(args))
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    if not wait_ready(base_url, process):
+        stop_server(process)
+        raise RuntimeError('应用启动失败')
+    return base_url, process
+
+
+def stop_server(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    seeded = None
+    process = None
+    base_url = args.url
+    if base_url is None:
+        print(f"🌱 正在准备测试数据（{args.sqlite_path if args.backend == 'sqlite' else args.database}）...")
+        seeded = seed(args)
+        print(f"   {seeded}")
+        base_url, process = start_server(args)
+
+    try:
+        print(f"🚀 {base_url}：预热 {args.warmup}s，统计 {args.duration}s")
+        routes, flood, measured = drive(base_url, args)
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    result = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'url': args.url,
+            'backend': None if args.url else args.backend,
+            'worker_class': args.worker_class,
+            'workers': args.workers,
+            'seed': args.seed,
+            'seeded': seeded,
+            'actors': {kind: getattr(args, kind) for kind in ACTORS},
+            'think': args.think,
+            'seconds': round(measured, 2),
+        },
+        'routes': routes,
+        'flood': flood,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(f"{'路由':<45}{'请求数':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}  状态码")
+    for route, stats in routes.items():
+        print(f"{route:<45}{stats['requests']:>8}{stats['rps']:>9}{stats['p50_ms'] or '-':>9}"
+              f"{stats['p95_ms'] or '-':>9}{stats['p99_ms'] or '-':>9}  {stats['status']}")
+    for route, stats in flood.items():
+        print(f"[flood] {route:<37}{stats['requests']:>8}{stats['rps']:>9}  {stats['status']}")
+    print(f"✅ 结果已写入 {args.output}")
+    return 0
+
+
+def compare(args):
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)['routes']
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)['routes']
+
+    regressions = []
+    print(f"{'路由':<45}{'p95 基线':>10}{'p95 当前':>10}{'变化':>9}{'req/s 变化':>12}")
+    for route in sorted(set(baseline) | set(current)):
+        before, after = baseline.get(route), current.get(route)
+        if not before or not after or not before['p95_ms'] or not after['p95_ms']:
+            print(f"{route:<45}{'（仅在一次结果中出现）':>20}")
+            continue
+        change = after['p95_ms'] / before['p95_ms'] - 1
+        rps_change = after['rps'] / before['rps'] - 1 if before['rps'] else 0
+        flag = ' ⚠️' if change > args.threshold else ''
+        print(f"{route:<45}{before['p95_ms']:>10}{after['p95_ms']:>10}{change:>+9.1%}{rps_change:>+12.1%}{flag}")
+        if change > args.threshold:
+            regressions.append(route)
+    if regressions:
+        print(f"❌ {len(regressions)} 个路由的 p95 变慢超过 {args.threshold:.0%}")
+        return 1
+    print("✅ 没有明显退化")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='HTTP 基准测试')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('run', help='准备数据并运行混合流量')
+    p.add_argument('--backend', choices=['mysql', 'sqlite'], default=os.getenv('DB_BACKEND', 'mysql'),
+                   help='存储后端，sqlite 不需要数据库服务')
+    p.add_argument('--database', default='birthday_board_bench', help='MySQL 测试库名（会被清空）')
+    p.add_argument('--sqlite-path', default=os.path.join(tempfile.gettempdir(), 'birthday_board_bench.sqlite3'),
+                   help='SQLite 测试库文件（会被清空）')
+    p.add_argument('--url', help='压测已经运行的服务（不准备数据、不启动应用）')
+    p.add_argument('--output', default='bench_http_result.json', help='结果文件')
+    p.add_argument('--seed', type=int, default=42, help='随机数种子')
+    p.add_argument('--days', type=int, default=30, help='测试数据的时间跨度（天）')
+    p.add_argument('--messages', type=int, default=5000)
+    p.add_argument('--visits', type=int, default=100000)
+    p.add_argument('--request-logs', type=int, default=200000)
+    p.add_argument('--bans', type=int, default=500)
+    p.add_argument('--red-packets', type=int, default=2000)
+    p.add_argument('--visitors', type=int, default=24, help='访客线程数')
+    p.add_argument('--posters', type=int, default=2, help='留言线程数')
+    p.add_argument('--admins', type=int, default=2, help='管理后台轮询线程数')
+    p.add_argument('--flooders', type=int, default=1, help='刷请求的IP数')
+    p.add_argument('--think', type=float, default=0, help='访客两轮请求之间的平均停顿（秒）')
+    p.add_argument('--warmup', type=float, default=5, help='预热时间（秒），不计入统计')
+    p.add_argument('--duration', type=float, default=30, help='统计时间（秒）')
+    p.add_argument('--worker-class', default=os.getenv('GUNICORN_WORKER_CLASS', 'sync'))
+    p.add_argument('--workers', type=int, default=int(os.getenv('GUNICORN_WORKERS', 4)))
+
+    p = sub.add_parser('compare', help='对比两次结果的 p95')
+    p.add_argument('baseline')
+    p.add_argument('current')
+    p.add_argument('--threshold', type=float, default=0.2, help='p95 变慢超过该比例视为退化')
+
+    args = parser.parse_args(argv)
+    return run(args) if args.command == 'run' else compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
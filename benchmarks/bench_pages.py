@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+页面渲染开销对比：每次请求读文件并编译模板（旧实现）vs 缓存编译后的模板（当前实现）
+
+只测量渲染本身，不经过 security_middleware，也不访问数据库
+（旧实现的封禁页面还会再查询一次 ip_bans，这部分开销不在此统计内）。
+
+用法：
+    python benchmarks/bench_pages.py [--number 2000]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from flask import render_template, render_template_string  # noqa: E402
+
+from app import app, page_templates, render_ban_page  # noqa: E402
+
+
+def old_birthday():
+    return render_template_string(open('birthday.html', 'r', encoding='utf-8').read())
+
+
+def new_birthday():
+    return render_template(page_templates.template('birthday.html'))
+
+
+def _ban_params():
+    ban_time = datetime.now()
+    unban_time = ban_time + timedelta(hours=1)
+    return f"?reason=测试&ban_time={ban_time.isoformat()}&unban_time={unban_time.isoformat()}&remaining=3600"
+
+
+def old_ban_page():
+    params = _ban_params()
+    with open('banned.html', 'r', encoding='utf-8') as f:
+        banned_page = f.read()
+    return banned_page.replace('window.location.search', f"'{params}' || window.location.search")
+
+
+def new_ban_page():
+    return render_ban_page(_ban_params())
+
+
+def old_rate_limited_page():
+    params = "?reason=请求过于频繁&remaining=60"
+    with open('banned.html', 'r', encoding='utf-8') as f:
+        banned_page = f.read()
+    banned_page = banned_page.replace('访问被限制', '请求过于频繁')
+    banned_page = banned_page.replace('您的IP地址已被暂时限制访问', '您的请求过于频繁，请稍后再试')
+    return banned_page.replace('window.location.search', f"'{params}' || window.location.search")
+
+
+def new_rate_limited_page():
+    return render_ban_page("?reason=请求过于频繁&remaining=60", rate_limited=True)
+
+
+CASES = [
+    ('birthday.html', old_birthday, new_birthday),
+    ('封禁页面', old_ban_page, new_ban_page),
+    ('限流页面', old_rate_limited_page, new_rate_limited_page),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='页面渲染开销对比')
+    parser.add_argument('--number', type=int, default=2000, help='每项重复次数')
+    args = parser.parse_args(argv)
+
+    print(f"{'页面':<16}{'旧实现 µs/次':>14}{'缓存后 µs/次':>14}{'加速':>8}")
+    with app.test_request_context('/'):
+        assert old_birthday() == new_birthday(), "birthday.html 渲染结果不一致"
+        for name, old, new in CASES:
+            new()  # 预热缓存
+            old_us = min(timeit.repeat(old, number=args.number, repeat=3)) / args.number * 1e6
+            new_us = min(timeit.repeat(new, number=args.number, repeat=3)) / args.number * 1e6
+            print(f"{name:<16}{old_us:>14.1f}{new_us:>14.1f}{old_us / new_us:>7.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
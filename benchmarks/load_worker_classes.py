@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+不同 gunicorn worker 类型在上游变慢时的吞吐对比
+
+在本机启动：
+- 一个 TCP 代理，转发到 MySQL，每次客户端发往服务器的数据延迟 --db-latency 毫秒（模拟慢查询/远程数据库）
+- 一个慢速的地理位置接口桩（GEOIP_API_URL 指向它），每次请求延迟 --geo-latency 毫秒
+然后按 --classes 依次用 gunicorn.conf.py 启动应用（只改 worker 类型和监听端口），
+可选先打开 --sse 个 /api/events 长连接，再用 --concurrency 个线程持续请求 --duration 秒，
+输出每种 worker 类型的吞吐、p50/p95 延迟和错误数。
+
+请求来自 127.0.0.1（默认白名单），不会触发限流。需要可用的 MySQL（已初始化的库），
+gevent 模式需要安装 requirements.txt 中的 gevent。
+
+用法：
+    python benchmarks/load_worker_classes.py [--classes sync,gthread,gevent] [--db-latency 50] [--geo-latency 1000]
+        [--concurrency 32] [--duration 15] [--sse 0] [--path /api/messages --path /api/stats]
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_PATHS = ['/api/messages', '/api/stats', '/api/visitors', '/api/security/request-logs?limit=20']
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class SlowProxy:
+    """转发到 upstream 的 TCP 代理，客户端发出的每段数据延迟 latency 秒后再转发"""
+
+    def __init__(self, upstream, latency):
+        self.upstream = upstream
+        self.latency = latency
+        self.server = socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(256)
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self.server.accept()
+            try:
+                upstream = socket.create_connection(self.upstream)
+            except OSError:
+                client.close()
+                continue
+            threading.Thread(target=self._pipe, args=(client, upstream, self.latency), daemon=True).start()
+            threading.Thread(target=self._pipe, args=(upstream, client, 0), daemon=True).start()
+
+    @staticmethod
+    def _pipe(src, dst, latency):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                if latency:
+                    time.sleep(latency)
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for s in (src, dst):
+                try:
+                    s.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+def start_geo_stub(latency):
+    """模拟 ip-api：单个查询和批量查询都延迟 latency 秒"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, body):
+            time.sleep(latency)
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._reply({'status': 'success', 'country': '测试', 'city': '测试'})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            queries = json.loads(self.rfile.read(length) or b'[]')
+            self._reply([{'status': 'success', 'country': '测试', 'city': '测试'} for _ in queries])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def wait_ready(base_url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            urllib.request.urlopen(base_url + '/api/stats', timeout=2).read()
+            return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.3)
+    return False
+
+
+def hold_sse(base_url, stop):
+    """保持一个 SSE 连接，服务端关闭后立即重连"""
+    while not stop.is_set():
+        try:
+            with urllib.request.urlopen(base_url + '/api/events?channels=messages', timeout=60) as resp:
+                while not stop.is_set() and resp.readline():
+                    pass
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+
+
+def run_load(base_url, paths, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(offset):
+        i = offset
+        local, local_errors = [], 0
+        while time.monotonic() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                urllib.request.urlopen(base_url + path, timeout=30).read()
+            except (urllib.error.URLError, OSError):
+                local_errors += 1
+                continue
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+
+    def pct(p):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+    }
+
+
+def bench_class(worker_class, args, env):
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(env, GUNICORN_WORKER_CLASS=worker_class, GUNICORN_BIND=f'127.0.0.1:{port}')
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    stop = threading.Event()
+    try:
+        if not wait_ready(base_url, process):
+            return {'error': '启动失败（gevent 模式需要 pip install -r requirements.txt）'}
+        for _ in range(args.sse):
+            threading.Thread(target=hold_sse, args=(base_url, stop), daemon=True).start()
+        if args.sse:
+            time.sleep(1)
+        return run_load(base_url, args.path or DEFAULT_PATHS, args.concurrency, args.duration)
+    finally:
+        stop.set()
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='不同 gunicorn worker 类型在上游变慢时的吞吐对比')
+    parser.add_argument('--classes', default='sync,gthread,gevent', help='逗号分隔的 worker 类型')
+    parser.add_argument('--workers', type=int, default=4, help='worker 进程数')
+    parser.add_argument('--threads', type=int, default=8, help='gthread 每个 worker 的线程数')
+    parser.add_argument('--db-latency', type=float, default=50, help='MySQL 每次往返额外延迟（毫秒）')
+    parser.add_argument('--geo-latency', type=float, default=1000, help='地理位置接口延迟（毫秒）')
+    parser.add_argument('--concurrency', type=int, default=32, help='并发请求线程数')
+    parser.add_argument('--duration', type=float, default=15, help='每种 worker 类型的压测时间（秒）')
+    parser.add_argument('--sse', type=int, default=0, help='压测期间保持的 SSE 连接数')
+    parser.add_argument('--path', action='append', help='请求的路径（可重复），默认几个只读接口轮流')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, ROOT)
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(ROOT, '.env'))
+
+    proxy = SlowProxy((os.getenv('MYSQL_HOST', 'localhost'), int(os.getenv('MYSQL_PORT', 3306))),
+                      args.db_latency / 1000)
+    geo_port = start_geo_stub(args.geo_latency / 1000)
+    env = dict(
+        os.environ,
+        MYSQL_HOST='127.0.0.1',
+        MYSQL_PORT=str(proxy.port),
+        GEOIP_API_URL=f'http://127.0.0.1:{geo_port}/json/{{ip}}',
+        GEOIP_BATCH_URL=f'http://127.0.0.1:{geo_port}/batch',
+        GEOIP_SHARED_CACHE='',
+        GUNICORN_WORKERS=str(args.workers),
+        GUNICORN_THREADS=str(args.threads),
+        # 连接池不小于线程数，否则 gthread 的并发被连接池限制
+        DB_POOL_SIZE=os.getenv('DB_POOL_SIZE', str(max(args.threads, 5))),
+    )
+
+    print(f"⏱  MySQL 延迟 {args.db_latency}ms，地理位置接口延迟 {args.geo_latency}ms，"
+          f"{args.workers} 个 worker，{args.concurrency} 个并发，{args.sse} 个 SSE 连接")
+    print(f"{'worker':<10}{'请求数':>10}{'错误':>8}{'req/s':>10}{'p50(ms)':>10}{'p95(ms)':>10}")
+    for worker_class in [c.strip() for c in args.classes.split(',') if c.strip()]:
+        result = bench_class(worker_class, args, env)
+        if 'error' in result:
+            print(f"{worker_class:<10}{result['error']}")
+            continue
+        print(f"{worker_class:<10}{result['requests']:>10}{result['errors']:>8}{result['rps']:>10}"
+              f"{result['p50_ms']:>10}{result['p95_ms']:>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+红包口令并发分配压力测试
+
+在单独的测试库中准备一批口令，多个线程同时为不同（以及重复的）IP 分配口令，检查：
+- 没有任何口令被分配两次
+- 每个IP最多拿到一个口令
+- 分配出去的口令数 = min(口令数, 不同IP数)，且数据库中的记录与返回结果一致
+
+会清空测试库中的 red_packet_codes 表，请不要指向生产库。
+
+用法：
+    python benchmarks/stress_red_packets.py [--database birthday_board_stress] [--codes 200] [--threads 32] [--requests 2000]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='红包口令并发分配压力测试')
+    parser.add_argument('--database', default='birthday_board_stress', help='测试库名（会被清空 red_packet_codes）')
+    parser.add_argument('--codes', type=int, default=200, help='准备的口令数')
+    parser.add_argument('--threads', type=int, default=32, help='并发线程数')
+    parser.add_argument('--requests', type=int, default=2000, help='总分配请求数')
+    parser.add_argument('--ips', type=int, default=500, help='不同IP数（请求数大于IP数时同一IP会重复请求）')
+    args = parser.parse_args(argv)
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, root)
+    os.chdir(root)
+    # 在导入 app 之前切换到测试库（load_dotenv 不会覆盖已有的环境变量）
+    os.environ['MYSQL_DATABASE'] = args.database
+    os.environ.setdefault('DB_POOL_SIZE', str(args.threads))
+
+    import pymysql
+    from app import MYSQL_CONFIG, get_db_connection, get_available_red_packet_code, init_database
+
+    server_config = {k: v for k, v in MYSQL_CONFIG.items() if k != 'database'}
+    conn = pymysql.connect(**server_config)
+    try:
+        conn.cursor().execute(
+            f"CREATE DATABASE IF NOT EXISTS `{args.database}` DEFAULT CHARSET utf8mb4 COLLATE utf8mb4_unicode_ci")
+    finally:
+        conn.close()
+    init_database()
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM red_packet_codes')
+        cursor.executemany('INSERT INTO red_packet_codes (code, description) VALUES (%s, %s)',
+                           [(f'STRESS-{i:06d}', '压力测试') for i in range(args.codes)])
+    print(f"🧧 已准备 {args.codes} 个口令，{args.threads} 个线程发起 {args.requests} 次分配（{args.ips} 个不同IP）")
+
+    results = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+    start_barrier = threading.Barrier(args.threads)
+
+    def worker():
+        start_barrier.wait()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            ip = f'198.18.{(i % args.ips) // 256}.{(i % args.ips) % 256}'
+            try:
+                code = get_available_red_packet_code(ip)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                continue
+            if code:
+                with lock:
+                    results.append((ip, code))
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    code_counts = Counter(code for _, code in results)
+    ip_counts = Counter(ip for ip, _ in results)
+    duplicate_codes = [code for code, n in code_counts.items() if n > 1]
+    repeat_winners = [ip for ip, n in ip_counts.items() if n > 1]
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT used_by_ip, code FROM red_packet_codes WHERE is_used = TRUE')
+        db_assigned = set(cursor.fetchall())
+
+    expected = min(args.codes, args.ips, args.requests)
+    print(f"⏱️  耗时 {elapsed:.2f}s，{args.requests / elapsed:.0f} 次分配/秒，分配出 {len(results)} 个口令（期望 {expected}）")
+
+    failures = []
+    if duplicate_codes:
+        failures.append(f"口令被重复分配: {duplicate_codes[:10]}")
+    if repeat_winners:
+        failures.append(f"同一IP多次中奖: {repeat_winners[:10]}")
+    if len(results) != expected:
+        failures.append(f"分配数量 {len(results)} 与期望 {expected} 不符")
+    if db_assigned != set(results):
+        failures.append("数据库中的分配记录与返回结果不一致")
+    if errors:
+        failures.append(f"{len(errors)} 次调用抛出异常，例如: {errors[0]}")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+    print("✅ 没有重复分配的口令，每个IP最多中奖一次")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
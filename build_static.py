@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+静态资源构建
+
+为 CSS/JS 生成带内容哈希的文件名，并预先压缩出 gzip（以及安装了 brotli 时的 br）版本；
+页面中的资源地址改写为带哈希的地址后同样预先压缩。输出目录结构：
+
+    dist/assets/styles.3f2a1b9c0d.css(.gz/.br)
+    dist/pages/admin.html(.gz/.br)
+    dist/manifest.json
+
+旧的带哈希文件不会删除，部署期间仍在使用旧页面的客户端可以继续加载。
+
+用法：
+    python build_static.py [--output dist]
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+
+from static_assets import MANIFEST_NAME, rewrite_asset_urls
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 需要加哈希的资源，以及需要改写资源地址并预压缩的页面
+ASSETS = ['styles.css', 'script.js', 'birthday-script.js']
+PAGES = ['admin.html', 'index.html']
+
+HASH_LENGTH = 10
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def _write(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_compressed(path, data):
+    """写入原文件和预压缩版本，返回写入的编码列表"""
+    _write(path, data)
+    written = ['identity']
+    # mtime=0 保证同样的内容生成同样的 .gz 文件
+    _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    written.append('gzip')
+    if brotli is not None:
+        _write(path + '.br', brotli.compress(data, quality=11))
+        written.append('br')
+    return written
+
+
+def build(source_dir, output_dir, assets=ASSETS, pages=PAGES):
+    """构建静态资源，返回清单字典"""
+    if brotli is None:
+        logger.warning("⚠️  未安装 brotli，只生成 gzip 压缩版本，不会生成 .br 文件（pip install brotli）")
+    assets_dir = os.path.join(output_dir, 'assets')
+    pages_dir = os.path.join(output_dir, 'pages')
+    os.makedirs(assets_dir, exist_ok=True)
+    os.makedirs(pages_dir, exist_ok=True)
+
+    manifest = {'assets': {}, 'pages': {}}
+    for name in assets:
+        with open(os.path.join(source_dir, name), 'rb') as f:
+            data = f.read()
+        stem, ext = os.path.splitext(name)
+        hashed = f'{stem}.{content_hash(data)}{ext}'
+        encodings = write_compressed(os.path.join(assets_dir, hashed), data)
+        manifest['assets'][name] = hashed
+        print(f"   {name} -> assets/{hashed} ({', '.join(encodings)})")
+
+    for name in pages:
+        with open(os.path.join(source_dir, name), 'r', encoding='utf-8') as f:
+            html = f.read()
+        data = rewrite_asset_urls(html, manifest['assets']).encode('utf-8')
+        encodings = write_compressed(os.path.join(pages_dir, name), data)
+        manifest['pages'][name] = content_hash(data)
+        print(f"   {name} -> pages/{name} ({', '.join(encodings)})")
+
+    _write(os.path.join(output_dir, MANIFEST_NAME),
+           json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+    return manifest
+
+
+def main(argv=None):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='构建带哈希、预压缩的静态资源')
+    parser.add_argument('--source', default=base_dir, help='源文件目录')
+    parser.add_argument('--output', default=os.path.join(base_dir, 'dist'), help='输出目录')
+    args = parser.parse_args(argv)
+
+    print("📦 正在构建静态资源...")
+    build(args.source, args.output)
+    print(f"✅ 构建完成: {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
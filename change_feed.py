@@ -0,0 +1,267 @@
+"""
+变更推送
+
+写操作在自己的事务中调用 publish() 向 change_events 表写入一条事件（新留言、删除留言、封禁/解封）。
+每个 worker 只有一个后台线程读取变更：先读 data_versions 中相关类别的版本号（主键查询），
+版本变化时才读取 change_events 中的新事件，放进进程内的环形缓冲区并唤醒等待中的连接；
+stats 版本变化时（包括 stats 版本所在的时间段变化）读取一次统计汇总，内容有变化时作为 stats 事件推送。idle_timeout 秒内没有连接时不再轮询数据库。
+
+/api/events（SSE）和 /api/events/poll（长轮询）都只从缓冲区取事件，空闲的客户端只占用一个连接。
+事件 id 为 change_events.id（所有 worker 一致），客户端重连时带上最后的 id 即可补发缓冲区内的事件，
+已经超出缓冲区的发送 resync 事件，由客户端重新拉取数据。stats 事件没有 id，只推送最新值。
+
+自增 id 在插入时分配、在提交时才可见，并发事务可能不按 id 顺序提交：读到 N+1 时 N 可能还未提交。
+读取时跳过的 id 记为缺口，gap_timeout 秒内每次轮询都会按 id 重新查询这些缺口，之后出现的事件照常推送
+（已回滚的事务留下的缺口超时后放弃）。缓冲区中的事件按读到的顺序排列，补发按客户端最后收到的事件在缓冲区中的位置进行。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS change_events (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        event_type VARCHAR(32) NOT NULL COMMENT '事件类型',
+        payload TEXT NOT NULL COMMENT '事件内容(JSON)',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+
+        INDEX idx_created_at (created_at)
+    ) ENGINE=InnoDB
+      DEFAULT CHARSET=utf8mb4
+      COLLATE=utf8mb4_unicode_ci
+      COMMENT='变更事件表：用于向客户端推送更新'
+'''
+
+# 事件类型 -> 频道，客户端按频道订阅
+CHANNELS = {
+    'message.created': 'messages',
+    'message.deleted': 'messages',
+    'ban.added': 'bans',
+    'ban.removed': 'bans',
+    'stats': 'stats',
+}
+
+# 对应 data_versions 中的类别，版本变化时才读取事件
+VERSION_NAMES = ['messages', 'bans', 'stats']
+
+# 最多同时跟踪的缺口 id 数
+MAX_GAPS = 1000
+
+
+def publish(cursor, event_type, payload):
+    """在调用方的连接（可在事务中）里写入一条变更事件"""
+    cursor.execute('INSERT INTO change_events (event_type, payload) VALUES (%s, %s)',
+                   (event_type, json.dumps(payload, ensure_ascii=False, default=str)))
+
+
+class ChangeFeed:
+    """进程内的变更事件缓冲区和后台轮询线程（每个 worker 进程一份）"""
+
+    def __init__(self, connection_factory, data_versions, stats_reader, poll_interval=1.0,
+                 buffer_size=1000, idle_timeout=60, gap_timeout=10.0):
+        self.connection_factory = connection_factory
+        self.data_versions = data_versions
+        self.stats_reader = stats_reader  # 返回当前统计数据的函数
+        self.poll_interval = poll_interval
+        self.buffer_size = max(1, int(buffer_size))
+        self.idle_timeout = idle_timeout
+        self.gap_timeout = gap_timeout  # 等待未提交的较小 id 出现的时间（秒）
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=self.buffer_size)  # {'seq', 'id', 'type', 'data'}
+        self._seq = 0               # 进程内事件序号
+        self._last_id = None        # 已读取的最大 change_events.id，None 表示尚未同步
+        self._floor_id = None       # 缓冲区可以补发 id 大于该值的全部事件
+        self._gaps = {}             # 小于 _last_id 但尚未读到的 id -> 发现时间
+        self._versions = {}
+        self._stats_payload = None
+        self._last_active = 0.0
+        self._waiting = 0
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'polls': 0,
+            'events': 0,
+            'errors': 0,
+            'resyncs': 0,
+        }
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            self._reset()
+        self._last_active = time.monotonic()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            if self._waiting == 0 and time.monotonic() - self._last_active > self.idle_timeout:
+                # 没有客户端时停止轮询；恢复后从最新的事件开始，之前的连接重连时会收到 resync
+                if self._last_id is not None:
+                    with self._cond:
+                        self._last_id = None
+                        self._events.clear()
+                        self._gaps = {}
+                time.sleep(self.poll_interval)
+                continue
+            try:
+                self.poll()
+            except Exception as e:
+                self._count('errors')
+                logger.error(f"读取变更事件失败: {e}")
+            time.sleep(self.poll_interval)
+
+    def poll(self):
+        """读取一次版本号，有变化时读取新事件并唤醒等待中的连接"""
+        self._count('polls')
+        versions = self.data_versions.current(VERSION_NAMES)
+        if self._last_id is None:
+            with self.connection_factory() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT COALESCE(MAX(id), 0) FROM change_events')
+                last_id = cursor.fetchone()[0]
+            stats_payload = self.stats_reader()
+            with self._cond:
+                self._last_id = self._floor_id = last_id
+                self._gaps = {}
+                self._versions = versions
+                self._stats_payload = stats_payload
+                self._cond.notify_all()
+            return
+
+        changed = {name for name in VERSION_NAMES if versions[name] != self._versions.get(name)}
+        self._versions = versions
+        now = time.monotonic()
+        if self._gaps:
+            self._gaps = {event_id: seen for event_id, seen in self._gaps.items() if now - seen < self.gap_timeout}
+        if not changed and not self._gaps:
+            return
+
+        new_events = []
+        last_id = self._last_id
+        if changed & {'messages', 'bans'} or self._gaps:
+            gaps = sorted(self._gaps)
+            gap_filter = f" OR id IN ({', '.join(['%s'] * len(gaps))})" if gaps else ''
+            with self.connection_factory() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT id, event_type, payload FROM change_events
+                    WHERE id > %s{gap_filter} ORDER BY id LIMIT %s
+                ''', [self._last_id] + gaps + [self.buffer_size])
+                rows = cursor.fetchall()
+            for event_id, event_type, payload in rows:
+                if event_id in self._gaps:
+                    del self._gaps[event_id]
+                elif event_id > last_id:
+                    # 跳过的 id 可能属于尚未提交的事务
+                    for missing in range(max(last_id + 1, event_id - MAX_GAPS), event_id):
+                        self._gaps[missing] = now
+                    last_id = event_id
+                else:
+                    continue
+                new_events.append((event_id, event_type, json.loads(payload)))
+            if len(self._gaps) > MAX_GAPS:
+                for event_id in sorted(self._gaps)[:len(self._gaps) - MAX_GAPS]:
+                    del self._gaps[event_id]
+            if len(rows) == self.buffer_size:
+                # 还有未读完的事件，下次轮询继续读取
+                self._versions.pop('messages', None)
+        stats_payload = self.stats_reader() if 'stats' in changed else None
+        if stats_payload == self._stats_payload:
+            stats_payload = None
+
+        with self._cond:
+            for event_id, event_type, payload in new_events:
+                self._append(event_id, event_type, payload)
+            self._last_id = last_id
+            if stats_payload is not None:
+                self._stats_payload = stats_payload
+                self._append(None, 'stats', stats_payload)
+            self._cond.notify_all()
+        self._count('events', len(new_events) + (1 if stats_payload is not None else 0))
+
+    def _append(self, event_id, event_type, payload):
+        if len(self._events) == self._events.maxlen:
+            dropped = self._events[0]
+            if dropped['id'] is not None:
+                self._floor_id = dropped['id']
+        self._seq += 1
+        self._events.append({'seq': self._seq, 'id': event_id, 'type': event_type, 'data': payload})
+
+    def subscribe(self, last_event_id=None, timeout=None):
+        """开始订阅，返回 (序号, 需要补发的事件, 是否需要 resync)
+
+        last_event_id 为客户端收到的最后一个事件 id；尚未同步时最多等待 timeout 秒
+        """
+        self._ensure_thread()
+        with self._cond:
+            if self._last_id is None:
+                self._cond.wait_for(lambda: self._last_id is not None,
+                                    timeout if timeout is not None else self.poll_interval * 2)
+            if last_event_id is None:
+                return self._seq, [], False
+            if self._floor_id is None or last_event_id < self._floor_id:
+                self._count('resyncs')
+                return self._seq, [], True
+            # 较晚提交的小 id 排在缓冲区后面，按位置补发而不是按 id 大小
+            position = next((event['seq'] for event in self._events if event['id'] == last_event_id), None)
+            if position is not None:
+                replay = [event for event in self._events if event['id'] is not None and event['seq'] > position]
+            else:
+                replay = [event for event in self._events
+                          if event['id'] is not None and event['id'] > last_event_id]
+            return self._seq, replay, False
+
+    def wait(self, after_seq, timeout):
+        """等待序号大于 after_seq 的事件，返回 (新的序号, 事件列表, 是否需要 resync)"""
+        self._ensure_thread()
+        with self._cond:
+            self._waiting += 1
+            try:
+                self._cond.wait_for(lambda: self._seq > after_seq, timeout)
+            finally:
+                self._waiting -= 1
+                self._last_active = time.monotonic()
+            if self._events and self._events[0]['seq'] > after_seq + 1:
+                # 缓冲区已经溢出，中间的事件无法补发
+                self._count('resyncs')
+                return self._seq, [], True
+            events = [event for event in self._events if event['seq'] > after_seq]
+            return self._seq, events, False
+
+    def last_id(self):
+        return self._last_id
+
+    def latest_stats(self):
+        return self._stats_payload
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({
+            'buffered': len(self._events),
+            'waiting': self._waiting,
+            'last_id': self._last_id,
+        })
+        return stats
@@ -7,6 +7,11 @@ import pymysql
 from dotenv import load_dotenv
 import os
 
+from response_cache import CREATE_TABLE_SQL as DATA_VERSIONS_TABLE_SQL
+from change_feed import CREATE_TABLE_SQL as CHANGE_EVENTS_TABLE_SQL
+import stats_rollup
+import request_rollup
+
 # 加载环境变量
 load_dotenv()
 
@@ -66,9 +71,10 @@ def create_tables():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '请求时间',
                 
                 INDEX idx_ip_address (ip_address),
-                INDEX idx_endpoint (endpoint),
                 INDEX idx_created_at (created_at),
-                INDEX idx_ip_time (ip_address, created_at)
+                INDEX idx_ip_time (ip_address, created_at),
+                INDEX idx_endpoint_time (endpoint, created_at),
+                INDEX idx_status_time (status_code, created_at)
             ) ENGINE=InnoDB 
               DEFAULT CHARSET=utf8mb4 
               COLLATE=utf8mb4_unicode_ci 
@@ -101,7 +107,9 @@ def create_tables():
                 INDEX idx_activity_type (activity_type),
                 INDEX idx_ip_address (ip_address),
                 INDEX idx_created_at (created_at),
-                INDEX idx_type_time (activity_type, created_at)
+                INDEX idx_type_time (activity_type, created_at),
+                INDEX idx_type_id (activity_type, id),
+                INDEX idx_country (country)
             ) ENGINE=InnoDB 
               DEFAULT CHARSET=utf8mb4 
               COLLATE=utf8mb4_unicode_ci 
@@ -121,13 +129,29 @@ def create_tables():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
                 
                 INDEX idx_is_used (is_used),
-                INDEX idx_created_at (created_at)
+                INDEX idx_created_at (created_at),
+                INDEX idx_used_created (is_used, created_at, id),
+                UNIQUE INDEX uq_used_by_ip (used_by_ip)
             ) ENGINE=InnoDB 
               DEFAULT CHARSET=utf8mb4 
               COLLATE=utf8mb4_unicode_ci 
               COMMENT='红包口令表：管理支付宝红包口令'
         ''')
         
+        print("📋 创建 data_versions 表...")
+        cursor.execute(DATA_VERSIONS_TABLE_SQL)
+        
+        print("📋 创建 change_events 表...")
+        cursor.execute(CHANGE_EVENTS_TABLE_SQL)
+        
+        print("📋 创建 stats_counters / stats_uniques 表...")
+        for sql in stats_rollup.CREATE_TABLES_SQL:
+            cursor.execute(sql)
+        
+        print("📋 创建 request_minutes / request_minute_ips 表...")
+        for sql in request_rollup.CREATE_TABLES_SQL:
+            cursor.execute(sql)
+        
         connection.commit()
         connection.close()
         
@@ -137,6 +161,10 @@ def create_tables():
         print("   - red_packet_codes (红包口令表)")
         print("   - ip_bans (IP封禁表)")
         print("   - request_logs (请求日志表)")
+        print("   - data_versions (数据版本表)")
+        print("   - change_events (变更事件表)")
+        print("   - stats_counters / stats_uniques (统计汇总表)")
+        print("   - request_minutes / request_minute_ips (请求分钟汇总表)")
         
     except Exception as e:
         print(f"❌ 创建数据库表失败: {e}")
@@ -0,0 +1,212 @@
+"""
+MySQL 连接池
+
+每个 gunicorn worker 进程持有一个独立的连接池：
+- fork 之后子进程会丢弃从父进程继承来的连接（preload_app=True 时主进程可能已建立过连接）
+- 连接数有上限，超过上限的借用请求会排队等待，超时抛出 PoolTimeout
+- 空闲过久的连接会被回收，空闲超过 ping_interval 的连接在借出前会先 ping 检查
+- 通过 with pool.connection() as conn 使用，出现异常时连接也会被归还
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pymysql
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """等待可用连接超时"""
+
+
+class ConnectionPool:
+    """线程安全、fork 安全的 PyMySQL 连接池"""
+
+    def __init__(self, connect_kwargs, max_size=5, timeout=5.0, idle_timeout=300.0,
+                 ping_interval=5.0, connect=pymysql.connect):
+        self.connect_kwargs = dict(connect_kwargs)
+        self.max_size = max(1, int(max_size))
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self._connect = connect
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        """初始化（或在 fork 后重建）池的内部状态"""
+        # 不关闭继承来的连接：它们的 socket 与父进程共享，发送 QUIT 会断开父进程的连接
+        self._pid = os.getpid()
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = deque()  # (connection, 归还时间)
+        self._size = 0        # 已创建且未关闭的连接数（含借出中的）
+        self._in_use = 0
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'closed': 0,
+            'evicted': 0,
+            'ping_failures': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'max_wait_time_ms': 0.0,
+            'timeouts': 0,
+        }
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _evict_idle_locked(self, now):
+        """取出空闲超时的连接（调用方持有锁），返回需要关闭的连接列表"""
+        expired = []
+        if self.idle_timeout is None:
+            return expired
+        # 队列左侧是最早归还的连接
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._stats['evicted'] += 1
+            expired.append(conn)
+        return expired
+
+    def acquire(self):
+        """借出一个连接，必须通过 release() 归还"""
+        self._check_pid()
+        start = time.monotonic()
+        deadline = start + self.timeout if self.timeout is not None else None
+        waited = False
+        conn = None
+        last_used = None
+        expired = []
+
+        with self._cond:
+            while True:
+                evicted = self._evict_idle_locked(time.monotonic())
+                if evicted:
+                    expired.extend(evicted)
+                    self._cond.notify(len(evicted))
+                if self._idle:
+                    # 后进先出：优先复用最近用过的连接，让冷连接自然过期
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                if not waited:
+                    waited = True
+                    self._stats['waits'] += 1
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"等待数据库连接超时（{self.timeout}秒，连接池上限 {self.max_size}）")
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            if waited:
+                wait_ms = (time.monotonic() - start) * 1000
+                self._stats['wait_time_ms'] += wait_ms
+                self._stats['max_wait_time_ms'] = max(self._stats['max_wait_time_ms'], wait_ms)
+
+        for stale in expired:
+            self._close_quietly(stale)
+
+        try:
+            if conn is not None and time.monotonic() - last_used >= self.ping_interval:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception as e:
+                    logger.warning(f"连接池健康检查失败，重新建立连接: {e}")
+                    with self._cond:
+                        self._stats['ping_failures'] += 1
+                    self._close_quietly(conn)
+                    conn = None
+            if conn is None:
+                conn = self._connect(**self.connect_kwargs)
+                with self._cond:
+                    self._stats['created'] += 1
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        return conn
+
+    def release(self, conn, discard=False):
+        """归还连接；discard=True 时直接关闭（例如连接状态不可信）"""
+        if self._pid != os.getpid():
+            # 在 fork 之前借出的连接，不属于当前进程的池
+            return
+        if not discard and not getattr(conn, 'open', True):
+            discard = True
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._size -= 1
+                self._stats['closed'] += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        """借出连接的上下文管理器，退出时（包括异常）自动归还"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            # 回滚可能未提交的事务；回滚失败说明连接已不可用，直接丢弃
+            try:
+                conn.rollback()
+                discard = False
+            except Exception:
+                discard = True
+            self.release(conn, discard=discard)
+            raise
+        else:
+            self.release(conn)
+
+    def close_all(self):
+        """关闭所有空闲连接（借出中的连接在归还后仍会进入池中）"""
+        self._check_pid()
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._stats['closed'] += len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """连接池统计信息（当前 worker 进程）"""
+        self._check_pid()
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'pid': self._pid,
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            })
+        stats['wait_time_ms'] = round(stats['wait_time_ms'], 3)
+        stats['max_wait_time_ms'] = round(stats['max_wait_time_ms'], 3)
+        return stats
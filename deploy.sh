@@ -8,6 +8,9 @@ export FLASK_ENV=production
 # 安装依赖
 pip install -r requirements.txt
 
+# 构建带哈希、预压缩的静态资源（输出到 dist/）
+python build_static.py
+
 # 使用gunicorn启动应用
 echo "启动生日留言板应用..."
 
@@ -0,0 +1,156 @@
+"""
+activity_logs 地理位置异步补全
+
+访问/留言记录写入时 country、city 先留空（NULL），插入后把 (id, ip) 交给本模块；
+后台线程攒批后调用 GeoLocator.lookup_many 批量解析，再按位置分组用
+UPDATE ... WHERE id IN (...) 回填。无法解析的记录回填为空字符串，
+因此 country IS NULL 始终表示“待补全”。进程退出前没来得及处理的记录
+由定期扫描（sweep）补上。
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class GeoEnricher:
+    """后台批量补全 activity_logs 的 country/city（每个worker进程一个后台线程）"""
+
+    def __init__(self, connection_factory, geo_locator, batch_size=100, interval=2.0, max_pending=10000,
+                 sweep_interval=300, sweep_min_age=60):
+        self.connection_factory = connection_factory
+        self.geo_locator = geo_locator
+        self.batch_size = max(1, int(batch_size))
+        self.interval = interval
+        self.max_pending = max(1, int(max_pending))
+        self.sweep_interval = sweep_interval    # 扫描遗漏记录的间隔（秒），0 表示不扫描
+        self.sweep_min_age = sweep_min_age      # 只扫描创建超过该秒数的记录，避免和实时队列重复处理
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._last_sweep = time.monotonic()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'overflow': 0,
+            'enriched': 0,
+            'swept': 0,
+            'batches': 0,
+            'failed': 0,
+        }
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='geo-enricher', daemon=True)
+            self._thread.start()
+
+    def submit(self, row_id, ip_address):
+        """登记一条待补全的记录；队列满时放弃，等待定期扫描处理"""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((row_id, ip_address))
+            self._count('submitted')
+        except queue.Full:
+            self._count('overflow')
+
+    def _next_batch(self):
+        try:
+            rows = [self._queue.get(timeout=self.interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.interval
+        while len(rows) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return rows
+
+    def enrich(self, rows):
+        """解析一批 (id, ip) 并回填，返回更新的记录数"""
+        if not rows:
+            return 0
+        ids_by_ip = defaultdict(list)
+        for row_id, ip_address in rows:
+            ids_by_ip[ip_address].append(row_id)
+        locations = self.geo_locator.lookup_many(list(ids_by_ip))
+
+        ids_by_location = defaultdict(list)
+        for ip_address, ids in ids_by_ip.items():
+            location = locations.get(ip_address) or {}
+            key = ((location.get('country') or '')[:50], (location.get('city') or '')[:100])
+            ids_by_location[key].extend(ids)
+
+        updated = 0
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            for (country, city), ids in ids_by_location.items():
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(f'''
+                    UPDATE activity_logs SET country = %s, city = %s
+                    WHERE id IN ({placeholders}) AND country IS NULL
+                ''', [country, city] + ids)
+                updated += cursor.rowcount
+        self._count('batches')
+        return updated
+
+    def sweep(self, limit=None):
+        """补全队列之外遗漏的记录（例如 worker 退出前未处理完的），返回更新的记录数"""
+        limit = limit or self.batch_size
+        cutoff = time.time() - self.sweep_min_age
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, ip_address FROM activity_logs
+                WHERE country IS NULL AND created_at < FROM_UNIXTIME(%s)
+                ORDER BY id DESC
+                LIMIT %s
+            ''', (cutoff, limit))
+            rows = list(cursor.fetchall())
+        updated = self.enrich(rows)
+        self._count('swept', updated)
+        return updated
+
+    def _run(self):
+        while True:
+            rows = self._next_batch()
+            try:
+                if rows:
+                    self._count('enriched', self.enrich(rows))
+                if self.sweep_interval and time.monotonic() - self._last_sweep >= self.sweep_interval:
+                    self._last_sweep = time.monotonic()
+                    self.sweep()
+            except Exception as e:
+                self._count('failed', len(rows))
+                logger.error(f"补全地理位置失败: {e}")
+
+    def stats(self):
+        """补全任务统计（当前 worker 进程）"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['pending'] = self._queue.qsize()
+        return stats
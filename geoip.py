@@ -0,0 +1,332 @@
+"""
+IP 地理位置查询与缓存
+
+查询顺序：离线IP库（GEOIP_MODE 含 offline 时）-> 进程内 LRU 缓存
+-> 各 worker 共享的磁盘缓存（SQLite 文件）-> ip-api.com（GEOIP_MODE 含 api 时）。
+查询失败的结果也会以较短的 TTL 缓存（负缓存），避免同一个 IP 反复超时；
+内网/保留地址直接返回空结果，不发起外部请求。HTTP 请求复用 keep-alive 会话。
+"""
+
+import ipaddress
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+from ip_range_db import IPRangeDB
+
+logger = logging.getLogger(__name__)
+
+EMPTY_LOCATION = {'country': '', 'region': '', 'city': '', 'isp': ''}
+
+
+def is_public_ip(ip_address):
+    """是否为需要查询地理位置的公网地址"""
+    try:
+        return ipaddress.ip_address(ip_address).is_global
+    except ValueError:
+        return False
+
+
+class LRUCache:
+    """带过期时间的线程安全 LRU 缓存"""
+
+    def __init__(self, max_size):
+        self.max_size = max(1, int(max_size))
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[1] <= now:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SharedGeoCache:
+    """多个 worker 进程共享的磁盘缓存（SQLite WAL），每个线程使用独立连接"""
+
+    def __init__(self, path, max_rows=100000):
+        self.path = path
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self._writes = 0
+        self._initialized = False
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._initialized:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS geo_cache (
+                        ip_address TEXT PRIMARY KEY,
+                        location TEXT NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_geo_cache_expires ON geo_cache (expires_at)')
+                self._initialized = True
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, ip_address, now):
+        row = self._conn().execute(
+            'SELECT location, expires_at FROM geo_cache WHERE ip_address = ? AND expires_at > ?',
+            (ip_address, now)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, ip_address, location, expires_at):
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO geo_cache (ip_address, location, expires_at) VALUES (?, ?, ?)',
+            (ip_address, json.dumps(location, ensure_ascii=False), expires_at)
+        )
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            self.prune(conn)
+
+    def prune(self, conn=None):
+        """删除过期记录，并把行数控制在 max_rows 以内"""
+        conn = conn or self._conn()
+        conn.execute('DELETE FROM geo_cache WHERE expires_at <= ?', (time.time(),))
+        conn.execute('''
+            DELETE FROM geo_cache WHERE ip_address IN (
+                SELECT ip_address FROM geo_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_rows,))
+
+
+class GeoLocator:
+    """带多级缓存的 IP 地理位置查询
+
+    mode: api（只用在线接口）、offline（只用离线库）、offline+api（离线库未命中时再查在线接口）
+    """
+
+    def __init__(self, api_url='http://ip-api.com/json/{ip}?lang=zh-CN', timeout=3.0, cache_size=10000,
+                 ttl=86400, negative_ttl=600, shared_cache_path=None, shared_cache_max=100000,
+                 mode='api', offline_db_path=None, batch_url='http://ip-api.com/batch?lang=zh-CN', observer=None):
+        self.mode = mode
+        self.use_api = 'api' in mode.split('+')
+        self.offline_db = None
+        if 'offline' in mode.split('+'):
+            try:
+                self.offline_db = IPRangeDB(offline_db_path)
+                logger.info(f"已加载离线IP库 {offline_db_path}（{self.offline_db.count} 个IP段）")
+            except Exception as e:
+                logger.error(f"加载离线IP库失败: {e}")
+        self.api_url = api_url
+        self.batch_url = batch_url
+        self.timeout = timeout
+        # 每次调用在线接口后调用 observer(kind, 秒数, 是否成功)，kind 为 'single' 或 'batch'
+        self.observer = observer
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory = LRUCache(cache_size)
+        self.shared = SharedGeoCache(shared_cache_path, shared_cache_max) if shared_cache_path else None
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'lookups': 0,
+            'memory_hits': 0,
+            'shared_hits': 0,
+            'negative_hits': 0,
+            'skipped_private': 0,
+            'offline_hits': 0,
+            'offline_misses': 0,
+            'api_calls': 0,
+            'api_failures': 0,
+            'api_time_ms': 0.0,
+            'shared_errors': 0,
+        }
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _session(self):
+        """每个线程复用一个 keep-alive 会话（fork 后重新创建）"""
+        session = getattr(self._local, 'session', None)
+        if session is None or getattr(self._local, 'pid', None) != os.getpid():
+            session = requests.Session()
+            self._local.session = session
+            self._local.pid = os.getpid()
+        return session
+
+    def fetch(self, ip_address):
+        """直接请求 ip-api.com，失败时返回 None"""
+        self._count('api_calls')
+        start = time.time()
+        location = None
+        try:
+            response = self._session().get(self.api_url.format(ip=ip_address), timeout=self.timeout)
+            if response.status_code == 200:
+                data = response.json()
+                if data.get('status') == 'success':
+                    location = {
+                        'country': data.get('country', ''),
+                        'region': data.get('regionName', ''),
+                        'city': data.get('city', ''),
+                        'isp': data.get('isp', '')
+                    }
+        except Exception as e:
+            logger.error(f"获取IP位置信息失败: {e}")
+        finally:
+            elapsed = time.time() - start
+            self._count('api_time_ms', elapsed * 1000)
+            if self.observer is not None:
+                self.observer('single', elapsed, location is not None)
+        if location is None:
+            self._count('api_failures')
+        return location
+
+    def _remember(self, ip_address, location, now):
+        """写入两级缓存；location 为 None 表示查询失败（负缓存）"""
+        expires_at = now + (self.ttl if location is not None else self.negative_ttl)
+        self.memory.set(ip_address, location, expires_at)
+        if self.shared is not None:
+            try:
+                self.shared.set(ip_address, location, expires_at)
+            except Exception as e:
+                self._count('shared_errors')
+                logger.warning(f"写入共享地理位置缓存失败: {e}")
+
+    def _lookup_local(self, ip_address, now):
+        """只查本地数据（离线库和缓存），返回 (是否已有结果, 位置或 None)"""
+        self._count('lookups')
+        if not is_public_ip(ip_address):
+            self._count('skipped_private')
+            return True, None
+
+        if self.offline_db is not None:
+            location = self.offline_db.lookup(ip_address)
+            if location is not None:
+                self._count('offline_hits')
+                return True, location
+            self._count('offline_misses')
+        if not self.use_api:
+            return True, None
+
+        cached = self.memory.get(ip_address, now)
+        if cached is not None:
+            self._count('memory_hits')
+        elif self.shared is not None:
+            try:
+                cached = self.shared.get(ip_address, now)
+            except Exception as e:
+                self._count('shared_errors')
+                logger.warning(f"读取共享地理位置缓存失败: {e}")
+            if cached is not None:
+                self._count('shared_hits')
+                self.memory.set(ip_address, cached[0], cached[1])
+
+        if cached is None:
+            return False, None
+        if cached[0] is None:
+            self._count('negative_hits')
+        return True, cached[0]
+
+    def lookup(self, ip_address):
+        """查询IP地理位置，总是返回包含 country/region/city/isp 的字典"""
+        now = time.time()
+        found, location = self._lookup_local(ip_address, now)
+        if not found:
+            location = self.fetch(ip_address)
+            self._remember(ip_address, location, now)
+        return dict(location) if location is not None else dict(EMPTY_LOCATION)
+
+    def fetch_batch(self, ip_addresses):
+        """通过批量接口一次查询多个IP（每次最多100个），返回 {ip: 位置或 None}"""
+        results = {ip: None for ip in ip_addresses}
+        if not self.batch_url:
+            for ip in ip_addresses:
+                results[ip] = self.fetch(ip)
+            return results
+        for i in range(0, len(ip_addresses), 100):
+            chunk = ip_addresses[i:i + 100]
+            self._count('api_calls')
+            start = time.time()
+            ok = False
+            try:
+                response = self._session().post(
+                    self.batch_url,
+                    json=[{'query': ip, 'fields': 'status,country,regionName,city,isp,query'} for ip in chunk],
+                    timeout=self.timeout
+                )
+                if response.status_code != 200:
+                    raise ValueError(f"HTTP {response.status_code}")
+                for data in response.json():
+                    if data.get('status') == 'success' and data.get('query') in results:
+                        results[data['query']] = {
+                            'country': data.get('country', ''),
+                            'region': data.get('regionName', ''),
+                            'city': data.get('city', ''),
+                            'isp': data.get('isp', '')
+                        }
+                ok = True
+            except Exception as e:
+                self._count('api_failures')
+                logger.error(f"批量获取IP位置信息失败: {e}")
+            finally:
+                elapsed = time.time() - start
+                self._count('api_time_ms', elapsed * 1000)
+                if self.observer is not None:
+                    self.observer('batch', elapsed, ok)
+        return results
+
+    def lookup_many(self, ip_addresses):
+        """批量查询IP地理位置，缓存未命中的IP合并成批量请求，返回 {ip: 位置字典}"""
+        now = time.time()
+        results = {}
+        missing = []
+        for ip in dict.fromkeys(ip_addresses):
+            found, location = self._lookup_local(ip, now)
+            if found:
+                results[ip] = location
+            else:
+                missing.append(ip)
+        if missing:
+            for ip, location in self.fetch_batch(missing).items():
+                self._remember(ip, location, now)
+                results[ip] = location
+        return {ip: dict(location) if location is not None else dict(EMPTY_LOCATION)
+                for ip, location in results.items()}
+
+    def stats(self):
+        """缓存与外部调用统计（当前 worker 进程）"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        cacheable = stats['lookups'] - stats['skipped_private'] - stats['offline_hits']
+        hits = stats['memory_hits'] + stats['shared_hits']
+        stats['hit_rate'] = round(hits / cacheable, 4) if cacheable else 0.0
+        stats['api_time_ms'] = round(stats['api_time_ms'], 3)
+        stats['memory_entries'] = len(self.memory)
+        stats['mode'] = self.mode
+        return stats
@@ -2,16 +2,27 @@
 import os
 
 # 服务器套接字
-bind = "0.0.0.0:3000"
+bind = os.getenv('GUNICORN_BIND', "0.0.0.0:3000")
 backlog = 2048
 
 # 工作进程
-workers = 4
-worker_class = "sync"
-worker_connections = 1000
-timeout = 30
+# worker_class:
+#   gthread （默认）每个 worker 有 threads 个线程并发处理请求（建议 DB_POOL_SIZE 不小于 threads）
+#   sync    每个 worker 同时只处理一个请求，慢查询会占住整个 worker，实时推送自动关闭（页面退回定时刷新）
+#   gevent  协程模式，socket/time.sleep/锁都变成协作式，单个 worker 可同时处理 worker_connections 个连接
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
 keepalive = 2
 
+if worker_class == 'gevent':
+    # preload_app 会在 master 进程中导入应用（创建连接池、锁和后台线程的状态），
+    # 必须在那之前打补丁，worker 中的 pymysql、requests 和后台线程才会是协作式的
+    from gevent import monkey
+    monkey.patch_all()
+
 # 重启
 max_requests = 1000
 max_requests_jitter = 50
@@ -40,3 +51,15 @@ tmp_upload_dir = None
 # SSL (如果需要HTTPS)
 # keyfile = "/path/to/keyfile"
 # certfile = "/path/to/certfile"
+
+# 钩子
+def on_starting(server):
+    """master 启动时清空上次运行留下的指标快照（/metrics 的计数从零开始）"""
+    from app import metrics_registry
+    metrics_registry.clear()
+
+def worker_exit(server, worker):
+    """worker退出（包括 max_requests 回收）前写完队列中的请求日志，并把本 worker 的指标并入归档"""
+    from app import request_log_writer, metrics_registry
+    request_log_writer.shutdown()
+    metrics_registry.retire()
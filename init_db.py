@@ -20,6 +20,10 @@ if __name__ == '__main__':
         print("   - red_packet_codes (红包口令表)")
         print("   - ip_bans (IP封禁表)")
         print("   - request_logs (请求日志表)")
+        print("   - data_versions (数据版本表)")
+        print("   - change_events (变更事件表)")
+        print("   - stats_counters / stats_uniques (统计汇总表)")
+        print("   - request_minutes / request_minute_ips (请求分钟汇总表)")
     except Exception as e:
         print(f"❌ 数据库初始化失败: {e}")
         sys.exit(1)
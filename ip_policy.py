@@ -0,0 +1,154 @@
+"""
+IP 访问策略：按网段（CIDR）匹配的允许/拒绝规则
+
+规则保存在二进制前缀树中，IPv4 和 IPv6 各一棵（IPv4 映射的 IPv6 地址按 IPv4 处理），
+查询沿地址的二进制位向下走，取最长匹配的规则，复杂度只和前缀长度有关（IPv4 最多 32 步），
+与规则数量无关。单个地址等价于 /32（IPv4）或 /128（IPv6）的网段。
+"""
+
+import ipaddress
+import socket
+import threading
+
+ALLOW = 'allow'
+DENY = 'deny'
+
+
+def normalize_network(text):
+    """把 IP 或 CIDR 文本规范化：单个地址返回地址本身，网段返回 “网络地址/前缀长度”，无效时抛出 ValueError"""
+    text = text.strip()
+    if '/' not in text:
+        address = ipaddress.ip_address(text)
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        return str(address)
+    network = ipaddress.ip_network(text, strict=False)
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address)
+    return str(network)
+
+
+def _parse_network(text):
+    """返回 (IP版本, 网络地址整数, 前缀长度)"""
+    network = ipaddress.ip_network(text.strip(), strict=False)
+    if isinstance(network, ipaddress.IPv6Network) and network.prefixlen >= 96 \
+            and network.network_address.ipv4_mapped is not None:
+        network = ipaddress.ip_network(f'{network.network_address.ipv4_mapped}/{network.prefixlen - 96}')
+    return network.version, int(network.network_address), network.prefixlen
+
+
+def _parse_address(ip_address):
+    """返回 (IP版本, 地址整数)，无效地址返回 (None, None)"""
+    ip_address = ip_address.strip()
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip_address), 'big')
+    except OSError:
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, ip_address)
+    except OSError:
+        return None, None
+    if packed[:12] == b'\x00' * 10 + b'\xff\xff':
+        return 4, int.from_bytes(packed[12:], 'big')
+    return 6, int.from_bytes(packed, 'big')
+
+
+class PrefixTrie:
+    """二进制前缀树，节点为 [0分支, 1分支, 值, 是否有值]"""
+
+    def __init__(self, bits):
+        self.bits = bits
+        self._root = [None, None, None, False]
+        self._size = 0
+
+    def insert(self, address, prefixlen, value):
+        node = self._root
+        for i in range(prefixlen):
+            bit = (address >> (self.bits - 1 - i)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None, False]
+            node = node[bit]
+        if not node[3]:
+            self._size += 1
+        node[2] = value
+        node[3] = True
+
+    def remove(self, address, prefixlen):
+        """删除一个网段，返回是否存在（不回收空节点，规则表重建时自然释放）"""
+        node = self._root
+        for i in range(prefixlen):
+            node = node[(address >> (self.bits - 1 - i)) & 1]
+            if node is None:
+                return False
+        if not node[3]:
+            return False
+        node[2] = None
+        node[3] = False
+        self._size -= 1
+        return True
+
+    def lookup(self, address, accept=None):
+        """最长前缀匹配，返回 (是否命中, 值)
+
+        accept 不为 None 时跳过 accept(值) 为假的规则（如已过期的封禁），继续匹配更短的前缀
+        """
+        node = self._root
+        matches = [node[2]] if node[3] else []
+        shift = self.bits - 1
+        while shift >= 0:
+            node = node[(address >> shift) & 1]
+            if node is None:
+                break
+            if node[3]:
+                matches.append(node[2])
+            shift -= 1
+        for value in reversed(matches):
+            if accept is None or accept(value):
+                return True, value
+        return False, None
+
+    def __len__(self):
+        return self._size
+
+
+class IPPolicy:
+    """允许/拒绝规则集合，按最长前缀匹配决定结果"""
+
+    def __init__(self, rules=None):
+        self._lock = threading.Lock()
+        self._tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        for network, action, data in rules or ():
+            self.add(network, action, data)
+
+    def add(self, network, action, data=None):
+        """添加规则，network 为 IP 或 CIDR，action 为 ALLOW 或 DENY；同一网段重复添加时覆盖"""
+        if action not in (ALLOW, DENY):
+            raise ValueError(f"未知的规则类型: {action}")
+        version, address, prefixlen = _parse_network(network)
+        with self._lock:
+            self._tries[version].insert(address, prefixlen, (action, data))
+
+    def allow(self, network, data=None):
+        self.add(network, ALLOW, data)
+
+    def deny(self, network, data=None):
+        self.add(network, DENY, data)
+
+    def remove(self, network):
+        version, address, prefixlen = _parse_network(network)
+        with self._lock:
+            return self._tries[version].remove(address, prefixlen)
+
+    def check(self, ip_address, accept=None):
+        """返回 (ALLOW/DENY, 规则附带的数据)；没有匹配的规则或地址无效时返回 (None, None)
+
+        accept(action, data) 返回假的规则视为不存在，继续匹配更短的前缀
+        """
+        version, address = _parse_address(ip_address)
+        if version is None:
+            return None, None
+        found, value = self._tries[version].lookup(address, None if accept is None else lambda v: accept(*v))
+        return value if found else (None, None)
+
+    def __len__(self):
+        return len(self._tries[4]) + len(self._tries[6])
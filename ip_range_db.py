@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+离线 IP 段地理位置库
+
+把 “起始IP, 结束IP, 国家, 地区, 城市” 形式的 CSV 转换为紧凑的二进制文件，
+运行时通过 mmap 映射文件并对有序的起始地址做二分查找，单次查询为微秒级，
+不需要任何外部网络请求。IPv4 地址统一按 IPv4 映射地址（::ffff:a.b.c.d）存储，
+因此 IPv4 和 IPv6 共用同一张表。
+
+文件格式（小端整数）：
+    头部   8字节魔数 | uint32 记录数 | uint32 位置数
+    记录   16字节起始地址(大端) | 16字节结束地址(大端) | uint32 位置下标   （按起始地址排序）
+    位置   UTF-8 JSON 数组，每项为 [国家, 地区, 城市]
+
+用法：
+    python ip_range_db.py import ranges.csv geoip.bin
+    python ip_range_db.py lookup geoip.bin 8.8.8.8
+"""
+
+import argparse
+import bisect
+import csv
+import ipaddress
+import json
+import mmap
+import os
+import socket
+import struct
+import sys
+
+MAGIC = b'BDIPDB01'
+HEADER = struct.Struct('<8sII')
+RECORD = struct.Struct('<16s16sI')
+
+
+_V4_MAPPED_PREFIX = b'\x00' * 10 + b'\xff\xff'
+
+
+def ip_to_key(ip_address):
+    """把IP地址转换为16字节大端键，IPv4 转为 IPv4 映射的 IPv6 地址"""
+    ip_address = ip_address.strip()
+    try:
+        return _V4_MAPPED_PREFIX + socket.inet_pton(socket.AF_INET, ip_address)
+    except OSError:
+        pass
+    try:
+        return socket.inet_pton(socket.AF_INET6, ip_address)
+    except OSError:
+        raise ValueError(f"无效的IP地址: {ip_address}")
+
+
+def _parse_bound(value):
+    """CSV中的地址可以是文本形式，也可以是整数（小于 2^32 视为 IPv4）"""
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        if number < 2 ** 32:
+            return ip_to_key(str(ipaddress.IPv4Address(number)))
+        return ipaddress.IPv6Address(number).packed
+    return ip_to_key(value)
+
+
+def _parse_row(row):
+    """解析一行CSV，支持 “起始,结束,国家,地区,城市” 和 “网段CIDR,国家,地区,城市” 两种格式"""
+    if '/' in row[0]:
+        network = ipaddress.ip_network(row[0].strip(), strict=False)
+        start = ip_to_key(str(network.network_address))
+        end = ip_to_key(str(network.broadcast_address))
+        fields = row[1:]
+    else:
+        start = _parse_bound(row[0])
+        end = _parse_bound(row[1])
+        fields = row[2:]
+    fields = [f.strip() for f in fields] + ['', '', '']
+    return start, end, (fields[0], fields[1], fields[2])
+
+
+def build_database(csv_path, output_path, encoding='utf-8'):
+    """从CSV生成二进制IP库，返回 (写入记录数, 跳过行数)"""
+    ranges = []
+    skipped = 0
+    with open(csv_path, 'r', encoding=encoding, newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith('#'):
+                continue
+            try:
+                start, end, location = _parse_row(row)
+            except (ValueError, IndexError):
+                # 表头或格式错误的行
+                skipped += 1
+                continue
+            if start > end:
+                skipped += 1
+                continue
+            ranges.append((start, end, location))
+
+    ranges.sort(key=lambda r: (r[0], r[1]))
+
+    locations = []
+    location_index = {}
+    records = []
+    last_end = None
+    for start, end, location in ranges:
+        if last_end is not None and start <= last_end:
+            # 与上一个网段重叠，保留先出现的（起始地址更小的）网段
+            skipped += 1
+            continue
+        index = location_index.get(location)
+        if index is None:
+            index = location_index[location] = len(locations)
+            locations.append(list(location))
+        records.append(RECORD.pack(start, end, index))
+        last_end = end
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(records), len(locations)))
+        for record in records:
+            f.write(record)
+        f.write(json.dumps(locations, ensure_ascii=False).encode('utf-8'))
+    os.replace(tmp_path, output_path)
+    return len(records), skipped
+
+
+class _StartKeys:
+    """把 mmap 中的记录起始地址暴露为可二分查找的序列"""
+
+    def __init__(self, buf, offset, count):
+        self._buf = buf
+        self._offset = offset
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        pos = self._offset + i * RECORD.size
+        return self._buf[pos:pos + 16]
+
+
+class IPRangeDB:
+    """只读的离线IP库，通过 mmap 加载，多进程共享同一份页缓存"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, location_count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} 不是有效的IP库文件")
+        self._records_offset = HEADER.size
+        locations_offset = self._records_offset + self.count * RECORD.size
+        self._locations = [tuple(loc) for loc in json.loads(self._mm[locations_offset:].decode('utf-8'))]
+        if len(self._locations) != location_count:
+            raise ValueError(f"{path} 位置表损坏")
+        self._keys = _StartKeys(self._mm, self._records_offset, self.count)
+
+    def lookup(self, ip_address):
+        """查询IP所在网段的位置，返回 {'country','region','city','isp'}，未命中返回 None"""
+        try:
+            key = ip_to_key(ip_address)
+        except ValueError:
+            return None
+        i = bisect.bisect_right(self._keys, key) - 1
+        if i < 0:
+            return None
+        _, end, index = RECORD.unpack_from(self._mm, self._records_offset + i * RECORD.size)
+        if key > end:
+            return None
+        country, region, city = self._locations[index]
+        return {'country': country, 'region': region, 'city': city, 'isp': ''}
+
+    def close(self):
+        self._mm.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='离线IP段地理位置库工具')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_import = sub.add_parser('import', help='从CSV生成二进制IP库')
+    p_import.add_argument('csv_path', help='CSV文件：起始IP,结束IP,国家,地区,城市 或 CIDR,国家,地区,城市')
+    p_import.add_argument('output_path', help='输出的二进制库文件')
+    p_import.add_argument('--encoding', default='utf-8', help='CSV文件编码')
+
+    p_lookup = sub.add_parser('lookup', help='查询IP')
+    p_lookup.add_argument('db_path')
+    p_lookup.add_argument('ips', nargs='+')
+
+    args = parser.parse_args(argv)
+    if args.command == 'import':
+        written, skipped = build_database(args.csv_path, args.output_path, args.encoding)
+        print(f"✅ 已写入 {written} 个IP段到 {args.output_path}（跳过 {skipped} 行）")
+    else:
+        db = IPRangeDB(args.db_path)
+        for ip in args.ips:
+            print(ip, db.lookup(ip) or '未找到')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""
+进程内指标（计数器、直方图）与 Prometheus 文本格式输出
+
+每个 worker 在内存中累加自己的指标，请求路径上只有一次加锁的字典更新（直方图再加一次二分查找），
+不访问数据库也不跨进程通信。后台线程每 flush_interval 秒把本进程的快照写入
+directory/worker-<pid>.json（先写临时文件再原子替换）。/metrics 读取所有 worker 的快照文件，
+加上处理该请求的 worker 的实时值，按指标和标签求和后输出，因此结果覆盖所有 worker
+（其它 worker 的数据最多延迟 flush_interval 秒）。
+
+worker 退出（包括 max_requests 回收）时调用 retire()，把本进程的累计值合并进 archive.json 并删除自己的文件，
+计数不会因为 worker 重启而倒退，目录中的文件数也不会随重启次数增长；被强制杀死的 worker 的最后一次快照仍会被计入。
+gunicorn master 启动时调用 clear() 清空目录（重启后计数从零开始，Prometheus 会按计数器重置处理）。
+
+register_collector() 登记的函数在生成快照时调用，返回 {(标签值...): 累计值}，
+用于把各模块已有的进程内统计（缓存命中、连接池等待等）作为计数器导出。
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# 请求延迟的默认分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 数据库语句的分桶（秒）
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+ARCHIVE_FILE = 'archive.json'
+
+
+class Counter:
+    def __init__(self, registry, name, help_text, labels):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+
+    def inc(self, *label_values, amount=1):
+        registry = self.registry
+        key = (self.name, label_values)
+        with registry._lock:
+            registry._counters[key] = registry._counters.get(key, 0) + amount
+
+
+class Histogram:
+    def __init__(self, registry, name, help_text, labels, buckets):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        registry = self.registry
+        key = (self.name, label_values)
+        index = bisect_left(self.buckets, value)  # 落在第一个 >= value 的分桶，超过最大分桶计入 +Inf
+        with registry._lock:
+            series = registry._histograms.get(key)
+            if series is None:
+                series = registry._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+
+class Registry:
+    """本进程的指标注册表，快照通过 directory 中的文件在 worker 之间汇总"""
+
+    def __init__(self, directory, flush_interval=5.0, prefix=''):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+        self._metrics = {}     # 名称 -> Counter / Histogram
+        self._collectors = []  # (Counter, 函数)
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # fork 之后从零开始，master 中（preload 时）的计数不算进 worker
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._counters = {}    # (名称, 标签值) -> 值
+        self._histograms = {}  # (名称, 标签值) -> [各分桶计数, 总和]
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._flush_lock = threading.Lock()
+        self._retired = False
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(self, self.prefix + name, help_text, labels)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(self, self.prefix + name, help_text, labels, buckets)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, name, help_text, labels, collect):
+        """登记一个在生成快照时读取的计数器，collect() 返回 {(标签值...): 累计值}"""
+        metric = Counter(self, self.prefix + name, help_text, labels)
+        self._metrics[metric.name] = metric
+        self._collectors.append((metric, collect))
+        return metric
+
+    def ensure_started(self):
+        """启动后台写快照的线程，fork 之后在各 worker 中调用"""
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # 同一 pid 的旧文件属于已经退出（未能 retire）的 worker，先并入 archive.json，避免被覆盖
+        path = self._path(os.getpid())
+        if os.path.exists(path):
+            try:
+                self._archive(_read(path), path)
+            except Exception as e:
+                logger.error(f"归档旧的指标快照失败: {e}")
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"写入指标快照失败: {e}")
+
+    def snapshot(self):
+        """本进程的当前值：{'counters': [[名称, 标签值, 值]], 'histograms': [[名称, 标签值, 分桶计数, 总和]]}"""
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, list(labels), list(series[0]), series[1]]
+                          for (name, labels), series in self._histograms.items()]
+        for metric, collect in self._collectors:
+            try:
+                for labels, value in collect().items():
+                    counters.append([metric.name, list(labels), value])
+            except Exception as e:
+                logger.error(f"读取指标 {metric.name} 失败: {e}")
+        return {'counters': counters, 'histograms': histograms}
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'worker-{pid}.json')
+
+    def _write(self, path, data):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        """把本进程的快照写入文件"""
+        with self._flush_lock:
+            if not self._retired:
+                self._write(self._path(os.getpid()), self.snapshot())
+
+    def retire(self):
+        """worker 退出前调用：把本进程的累计值合并进 archive.json，删除自己的快照文件"""
+        with self._flush_lock:
+            if self._retired:
+                return
+            self._retired = True
+            self._archive(self.snapshot(), self._path(os.getpid()))
+
+    def _archive(self, snapshot, path):
+        """在文件锁内把 snapshot 加进 archive.json，然后删除 path"""
+        os.makedirs(self.directory, exist_ok=True)
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            merged = _Merged()
+            merged.add(_read(archive_path))
+            merged.add(snapshot)
+            self._write(archive_path, merged.to_snapshot())
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """删除目录中所有快照文件（gunicorn master 启动时调用）"""
+        if not os.path.isdir(self.directory):
+            return
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.json') or filename.endswith('.tmp'):
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except FileNotFoundError:
+                    pass
+
+    def collect(self):
+        """汇总所有 worker 的快照（本进程使用实时值）"""
+        merged = _Merged()
+        own_file = os.path.basename(self._path(os.getpid()))
+        if os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                if filename.endswith('.json') and filename != own_file:
+                    merged.add(_read(os.path.join(self.directory, filename)))
+        if not self._retired:
+            merged.add(self.snapshot())
+        return merged
+
+    def render(self):
+        """Prometheus 文本格式（0.0.4）"""
+        merged = self.collect()
+        lines = []
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            if isinstance(metric, Histogram):
+                lines.append(f'# HELP {name} {metric.help}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, (counts, total) in sorted(merged.histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (float('inf'),), counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else _format_value(bound)
+                        lines.append(f"{name}_bucket{_labels(metric.labels + ('le',), labels + (le,))} {cumulative}")
+                    lines.append(f'{name}_sum{_labels(metric.labels, labels)} {_format_value(total)}')
+                    lines.append(f'{name}_count{_labels(metric.labels, labels)} {cumulative}')
+            else:
+                lines.append(f'# HELP {name} {metric.help}')
+                lines.append(f'# TYPE {name} counter')
+                for labels, value in sorted(merged.counters.get(name, {}).items()):
+                    lines.append(f'{name}{_labels(metric.labels, labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class _Merged:
+    """按指标和标签求和的快照"""
+
+    def __init__(self):
+        self.counters = {}    # 名称 -> {标签值: 值}
+        self.histograms = {}  # 名称 -> {标签值: [分桶计数, 总和]}
+
+    def add(self, snapshot):
+        for name, labels, value in snapshot.get('counters', []):
+            series = self.counters.setdefault(name, {})
+            labels = tuple(labels)
+            series[labels] = series.get(labels, 0) + value
+        for name, labels, counts, total in snapshot.get('histograms', []):
+            series = self.histograms.setdefault(name, {})
+            labels = tuple(labels)
+            if labels in series and len(series[labels][0]) == len(counts):
+                existing = series[labels]
+                existing[0] = [a + b for a, b in zip(existing[0], counts)]
+                existing[1] += total
+            else:
+                series[labels] = [list(counts), total]
+
+    def to_snapshot(self):
+        return {
+            'counters': [[name, list(labels), value]
+                         for name, series in self.counters.items() for labels, value in series.items()],
+            'histograms': [[name, list(labels), counts, total]
+                           for name, series in self.histograms.items() for labels, (counts, total) in series.items()],
+        }
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
@@ -32,7 +32,9 @@ CREATE TABLE IF NOT EXISTS activity_logs (
     INDEX idx_activity_type (activity_type),
     INDEX idx_ip_address (ip_address),
     INDEX idx_created_at (created_at),
-    INDEX idx_type_time (activity_type, created_at)
+    INDEX idx_type_time (activity_type, created_at),
+    INDEX idx_type_id (activity_type, id),
+    INDEX idx_country (country)
 ) ENGINE=InnoDB 
   DEFAULT CHARSET=utf8mb4 
   COLLATE=utf8mb4_unicode_ci 
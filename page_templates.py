@@ -0,0 +1,83 @@
+"""
+页面模板缓存
+
+页面文件在每个 worker 中只读取和编译一次，之后直接使用缓存的 Jinja 模板；
+由页面源码派生出的内容（例如切分好的封禁页面）也随源码一起缓存。
+transform 用于在编译前统一改写页面源码（例如替换为带哈希的静态资源地址）；
+auto_reload 打开时（开发环境）每隔 check_interval 秒检查一次文件修改时间，文件变化后重新加载。
+"""
+
+import os
+import threading
+import time
+
+
+class PageTemplates:
+    """按文件名缓存页面源码、编译后的模板和派生内容（每个 worker 进程一份）"""
+
+    def __init__(self, jinja_env, base_dir='.', auto_reload=False, check_interval=1.0, transform=None):
+        self.jinja_env = jinja_env
+        self.transform = transform
+        self.base_dir = base_dir
+        self.auto_reload = auto_reload
+        self.check_interval = check_interval
+        self._entries = {}  # 文件名 -> {'mtime', 'checked_at', 'source', 'template', 'derived'}
+        self._lock = threading.Lock()
+        self._stats = {'loads': 0, 'reloads': 0, 'compiles': 0}
+
+    def _path(self, name):
+        return os.path.join(self.base_dir, name)
+
+    def _load(self, name):
+        path = self._path(name)
+        mtime = os.path.getmtime(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        if self.transform is not None:
+            source = self.transform(source)
+        return {'mtime': mtime, 'checked_at': time.monotonic(), 'source': source, 'template': None, 'derived': {}}
+
+    def _entry(self, name):
+        entry = self._entries.get(name)
+        if entry is not None and self.auto_reload:
+            now = time.monotonic()
+            if now - entry['checked_at'] >= self.check_interval:
+                entry['checked_at'] = now
+                if os.path.getmtime(self._path(name)) != entry['mtime']:
+                    entry = None
+                    with self._lock:
+                        self._stats['reloads'] += 1
+        if entry is None:
+            entry = self._load(name)
+            with self._lock:
+                self._entries[name] = entry
+                self._stats['loads'] += 1
+        return entry
+
+    def source(self, name):
+        """页面源码"""
+        return self._entry(name)['source']
+
+    def template(self, name):
+        """编译后的 Jinja 模板，可直接传给 flask.render_template"""
+        entry = self._entry(name)
+        if entry['template'] is None:
+            entry['template'] = self.jinja_env.from_string(entry['source'])
+            with self._lock:
+                self._stats['compiles'] += 1
+        return entry['template']
+
+    def derived(self, name, key, build):
+        """由页面源码派生的内容：build(source) 的结果按 key 缓存，源码变化时一起失效"""
+        entry = self._entry(name)
+        derived = entry['derived']
+        if key not in derived:
+            derived[key] = build(entry['source'])
+        return derived[key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['cached'] = len(self._entries)
+        stats['auto_reload'] = self.auto_reload
+        return stats
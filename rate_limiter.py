@@ -0,0 +1,229 @@
+"""
+多个 worker 共享的滑动窗口限流计数器
+
+计数表放在匿名共享内存（mmap）里，在 gunicorn master 中创建（preload_app = True），
+fork 出来的所有 worker 看到的是同一张表，因此限流按整台机器计算，而不是每个 worker 各算一份。
+
+每个 key（IP）只占一个固定大小的槽位，记录当前窗口和上一个窗口的请求数，
+估算值 = 上一窗口计数 × 上一窗口仍在滑动窗口内的比例 + 当前窗口计数（固定窗口近似滑动窗口），
+每次请求只读写一个槽位，O(1) 且不随请求数增长。
+
+表按组相联方式组织：key 的哈希决定所在的组（ways 个槽位），组内没有空位时
+淘汰最久没有访问的槽位，所以内存上限固定为 max_keys 个槽位；
+后台线程定期清空长时间不活跃的槽位。
+"""
+
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import os
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 槽位：16字节key摘要 | 当前窗口编号 | 当前窗口计数 | 上一窗口计数 | 最后访问时间
+SLOT = struct.Struct('<16sQIId')
+EMPTY_KEY = b'\x00' * 16
+
+
+def _digest(key):
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+class SlidingWindowLimiter:
+    """固定内存、跨进程共享的滑动窗口计数器
+
+    必须在 fork 之前创建才能在 worker 之间共享；在单进程中使用时等同于进程内计数器。
+    """
+
+    def __init__(self, limit, window, max_keys=65536, ways=8, lock_stripes=16, sweep_interval=60,
+                 lock_timeout=0.05):
+        self.limit = limit
+        self.window = max(1, int(window))
+        self.ways = max(1, int(ways))
+        self.buckets = max(1, int(max_keys) // self.ways)
+        self.max_keys = self.buckets * self.ways
+        self.sweep_interval = sweep_interval   # 清理不活跃槽位的间隔（秒），0 表示不清理
+        self.lock_timeout = lock_timeout       # 获取锁的超时时间，超时则放行本次请求（避免某个 worker 异常退出时卡住其它 worker）
+        self._mm = mmap.mmap(-1, self.max_keys * SLOT.size)
+        self._locks = [multiprocessing.Lock() for _ in range(max(1, int(lock_stripes)))]
+        self._sweep_lock = multiprocessing.Lock()
+        self._last_sweep = multiprocessing.Value('d', time.time(), lock=False)
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'checked': 0,
+            'limited': 0,
+            'evicted': 0,
+            'swept': 0,
+            'lock_timeouts': 0,
+        }
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _ensure_thread(self):
+        if not self.sweep_interval:
+            return
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='rate-limit-sweeper', daemon=True)
+            self._thread.start()
+
+    def _locate(self, digest):
+        bucket = int.from_bytes(digest[:8], 'little') % self.buckets
+        return bucket * self.ways * SLOT.size, self._locks[bucket % len(self._locks)]
+
+    @staticmethod
+    def _shift(window_index, slot_window, curr, prev):
+        """按当前时间折算槽位中的计数，返回 (当前窗口计数, 上一窗口计数)"""
+        if slot_window == window_index:
+            return curr, prev
+        if slot_window == window_index - 1:
+            return 0, curr
+        return 0, 0
+
+    def hit(self, key, now=None):
+        """记录一次请求，返回 (是否超过限制, 滑动窗口内的估算请求数)"""
+        self._ensure_thread()
+        now = time.time() if now is None else now
+        window_index = int(now // self.window)
+        fraction = (now % self.window) / self.window
+        digest = _digest(key)
+        base, lock = self._locate(digest)
+        mm = self._mm
+
+        if not lock.acquire(timeout=self.lock_timeout):
+            self._count('lock_timeouts')
+            return False, 0
+        try:
+            target = None
+            empty = None
+            oldest, oldest_seen = None, float('inf')
+            for i in range(self.ways):
+                offset = base + i * SLOT.size
+                slot_key = mm[offset:offset + 16]
+                if slot_key == digest:
+                    target = offset
+                    break
+                if slot_key == EMPTY_KEY:
+                    if empty is None:
+                        empty = offset
+                    continue
+                last_seen = SLOT.unpack_from(mm, offset)[4]
+                if last_seen < oldest_seen:
+                    oldest, oldest_seen = offset, last_seen
+
+            if target is not None:
+                _, slot_window, curr, prev, _ = SLOT.unpack_from(mm, target)
+                curr, prev = self._shift(window_index, slot_window, curr, prev)
+            elif empty is not None:
+                target, curr, prev = empty, 0, 0
+            else:
+                # 组内没有空位：淘汰最久未访问的槽位
+                if oldest_seen > now - 2 * self.window:
+                    self._count('evicted')
+                target, curr, prev = oldest, 0, 0
+
+            curr += 1
+            SLOT.pack_into(mm, target, digest, window_index, curr, prev, now)
+        finally:
+            lock.release()
+
+        estimated = int(prev * (1 - fraction) + curr)
+        limited = self.limit is not None and estimated > self.limit
+        self._count('checked')
+        if limited:
+            self._count('limited')
+        return limited, estimated
+
+    def peek(self, key, now=None):
+        """返回 key 在滑动窗口内的估算请求数（不计入本次）"""
+        now = time.time() if now is None else now
+        window_index = int(now // self.window)
+        fraction = (now % self.window) / self.window
+        digest = _digest(key)
+        base, _ = self._locate(digest)
+        for i in range(self.ways):
+            offset = base + i * SLOT.size
+            if self._mm[offset:offset + 16] == digest:
+                _, slot_window, curr, prev, _ = SLOT.unpack_from(self._mm, offset)
+                curr, prev = self._shift(window_index, slot_window, curr, prev)
+                return int(prev * (1 - fraction) + curr)
+        return 0
+
+    def reset(self, key):
+        """清除 key 的计数（例如管理员解封后）"""
+        digest = _digest(key)
+        base, lock = self._locate(digest)
+        with lock:
+            for i in range(self.ways):
+                offset = base + i * SLOT.size
+                if self._mm[offset:offset + 16] == digest:
+                    self._mm[offset:offset + SLOT.size] = b'\x00' * SLOT.size
+
+    def sweep(self, now=None):
+        """清空两个窗口以上没有访问的槽位，返回清理的槽位数"""
+        now = time.time() if now is None else now
+        cutoff = now - 2 * self.window
+        mm = self._mm
+        removed = 0
+        for bucket in range(self.buckets):
+            base = bucket * self.ways * SLOT.size
+            with self._locks[bucket % len(self._locks)]:
+                for i in range(self.ways):
+                    offset = base + i * SLOT.size
+                    if mm[offset:offset + 16] == EMPTY_KEY:
+                        continue
+                    if SLOT.unpack_from(mm, offset)[4] < cutoff:
+                        mm[offset:offset + SLOT.size] = b'\x00' * SLOT.size
+                        removed += 1
+        self._count('swept', removed)
+        return removed
+
+    def _run(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            # 所有 worker 共用一个清理时间，每个间隔只由一个 worker 执行
+            if not self._sweep_lock.acquire(block=False):
+                continue
+            try:
+                if time.time() - self._last_sweep.value < self.sweep_interval:
+                    continue
+                self._last_sweep.value = time.time()
+                self.sweep()
+            except Exception as e:
+                logger.error(f"清理限流计数失败: {e}")
+            finally:
+                self._sweep_lock.release()
+
+    def active_keys(self):
+        """当前占用的槽位数（所有 worker 共享）"""
+        mm = self._mm
+        return sum(1 for offset in range(0, self.max_keys * SLOT.size, SLOT.size)
+                   if mm[offset:offset + 16] != EMPTY_KEY)
+
+    def stats(self):
+        """限流统计（计数为当前 worker 进程，槽位占用为所有 worker 共享）"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['active_keys'] = self.active_keys()
+        stats['max_keys'] = self.max_keys
+        stats['memory_bytes'] = self.max_keys * SLOT.size
+        return stats
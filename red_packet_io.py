@@ -0,0 +1,209 @@
+"""
+红包口令分配与批量导入 / 导出
+
+分配用一条条件 UPDATE 原子地占用最早的未使用口令，used_by_ip 上的唯一索引保证每个IP只能中奖一次。
+
+导入支持 CSV（code,description,amount，可带表头）和 JSON 数组（字符串或 {code, description, amount} 对象），
+先在内存中校验和去重，再按批多行写入（storage 方言的 insert_ignore），已存在的口令计为重复。
+导出按 id 分批读取（每批单独借用连接），逐行生成 CSV 或 JSON，不把整张表读进内存。
+"""
+
+import csv
+import io
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS red_packet_codes (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        code VARCHAR(50) NOT NULL UNIQUE COMMENT '支付宝口令红包代码',
+        description VARCHAR(200) NULL COMMENT '红包描述',
+        amount DECIMAL(10,2) NULL COMMENT '红包金额',
+        is_used BOOLEAN DEFAULT FALSE COMMENT '是否已使用',
+        used_by_ip VARCHAR(45) NULL COMMENT '使用者IP',
+        used_at TIMESTAMP NULL COMMENT '使用时间',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+
+        INDEX idx_is_used (is_used),
+        INDEX idx_created_at (created_at),
+        INDEX idx_used_created (is_used, created_at, id),
+        UNIQUE INDEX uq_used_by_ip (used_by_ip)
+    ) ENGINE=InnoDB
+      DEFAULT CHARSET=utf8mb4
+      COLLATE=utf8mb4_unicode_ci
+      COMMENT='红包口令表：管理支付宝红包口令'
+'''
+
+CODE_MAX_LENGTH = 50
+DESCRIPTION_MAX_LENGTH = 200
+EXPORT_COLUMNS = ['id', 'code', 'description', 'amount', 'is_used', 'used_by_ip', 'used_at', 'created_at']
+
+
+def claim(cursor, ip_address):
+    """为中奖IP分配一个红包口令，返回口令；没有可用口令或该IP已经中过奖时返回 None
+
+    并发请求在行锁上排队，不会拿到同一个口令；重复中奖时 UPDATE 因唯一键冲突失败。
+    """
+    try:
+        updated = storage.dialect(cursor).update_first(
+            cursor, 'red_packet_codes',
+            'is_used = TRUE, used_by_ip = %s, used_at = NOW()',
+            'is_used = FALSE',
+            'created_at ASC, id ASC',
+            (ip_address,))
+    except storage.IntegrityError:
+        logger.info(f"IP {ip_address} 已经中过奖，不能再次中奖")
+        return None
+
+    if updated == 0:
+        return None
+
+    # 按唯一索引读回分配到的口令
+    cursor.execute('SELECT code FROM red_packet_codes WHERE used_by_ip = %s', (ip_address,))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+
+def _normalize(code, description=None, amount=None):
+    """校验一条口令，返回 (code, description, amount)，无效时抛出 ValueError"""
+    code = code.strip() if isinstance(code, str) else ''
+    if not code:
+        raise ValueError('口令不能为空')
+    if len(code) > CODE_MAX_LENGTH:
+        raise ValueError(f'口令长度不能超过{CODE_MAX_LENGTH}个字符')
+    description = description.strip() if isinstance(description, str) else ''
+    if len(description) > DESCRIPTION_MAX_LENGTH:
+        raise ValueError(f'描述长度不能超过{DESCRIPTION_MAX_LENGTH}个字符')
+    if amount is None or (isinstance(amount, str) and not amount.strip()):
+        amount = None
+    else:
+        try:
+            amount = Decimal(str(amount).strip()).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise ValueError(f'金额格式无效: {amount}')
+        if amount < 0:
+            raise ValueError('金额不能为负数')
+    return code, description, amount
+
+
+def parse_csv(text):
+    """解析 CSV 文本，返回 [(行号, code, description, amount)]；首行为 code 表头时跳过"""
+    items = []
+    for line_no, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        if line_no == 1 and row[0].strip().lower() in ('code', '口令'):
+            continue
+        row = row + [None, None]
+        items.append((line_no, row[0], row[1], row[2]))
+    return items
+
+
+def parse_json(data):
+    """解析 JSON 数组，返回 [(序号, code, description, amount)]，格式不对时抛出 ValueError"""
+    if isinstance(data, dict):
+        data = data.get('codes')
+    if not isinstance(data, list):
+        raise ValueError('JSON 格式应为数组，或包含 codes 数组的对象')
+    items = []
+    for index, item in enumerate(data, start=1):
+        if isinstance(item, dict):
+            items.append((index, item.get('code'), item.get('description'), item.get('amount')))
+        else:
+            items.append((index, item, None, None))
+    return items
+
+
+def validate(items):
+    """校验并在内存中去重，返回 (有效行列表, 请求内重复数, 错误列表)"""
+    rows = []
+    seen = set()
+    duplicates = 0
+    errors = []
+    for position, code, description, amount in items:
+        try:
+            row = _normalize(code, description, amount)
+        except ValueError as e:
+            errors.append({'line': position, 'error': str(e)})
+            continue
+        if row[0] in seen:
+            duplicates += 1
+            continue
+        seen.add(row[0])
+        rows.append(row)
+    return rows, duplicates, errors
+
+
+def insert_codes(cursor, rows, chunk_size=500):
+    """多行插入分批写入（已存在的口令跳过），返回实际插入的行数"""
+    backend = storage.dialect(cursor)
+    inserted = 0
+    for i in range(0, len(rows), chunk_size):
+        inserted += backend.insert_ignore(cursor, 'red_packet_codes', ('code', 'description', 'amount'),
+                                          rows[i:i + chunk_size])
+    return inserted
+
+
+def iter_rows(connection_factory, batch_size=1000):
+    """按 id 顺序分批读取全部口令，每批单独借用连接"""
+    last_id = 0
+    while True:
+        with connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {', '.join(EXPORT_COLUMNS)}
+                FROM red_packet_codes
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            ''', (last_id, batch_size))
+            rows = cursor.fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield row
+        last_id = rows[-1][0]
+
+
+def _row_to_dict(row):
+    return {
+        'id': row[0],
+        'code': row[1],
+        'description': row[2],
+        'amount': float(row[3]) if row[3] is not None else None,
+        'is_used': bool(row[4]),
+        'used_by_ip': row[5],
+        'used_at': row[6].isoformat() if row[6] else None,
+        'created_at': row[7].isoformat() if row[7] else None
+    }
+
+
+def stream_csv(rows):
+    """逐行生成 CSV（带 UTF-8 BOM，方便 Excel 打开）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        item = _row_to_dict(row)
+        writer.writerow(['' if item[column] is None else item[column] for column in EXPORT_COLUMNS])
+        if buffer.tell() >= 8192:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_json(rows):
+    """逐条生成 JSON 数组"""
+    yield '['
+    first = True
+    for row in rows:
+        yield ('' if first else ',') + json.dumps(_row_to_dict(row), ensure_ascii=False)
+        first = False
+    yield ']'
@@ -0,0 +1,116 @@
+"""
+请求日志查询
+
+/api/security/request-logs 按 (created_at, id) 倒序做游标分页：下一页的条件是
+created_at < 游标时间，或时间相同且 id < 游标 id，配合以 created_at 结尾的复合索引
+（InnoDB 二级索引自带主键 id），翻到多深都只读取一页的行，不再 OFFSET 丢弃前面的记录。
+
+总数不再每次 COUNT：没有过滤条件时用 MAX(id) - MIN(id) + 1 估算（清理只删除最旧的日志，
+id 基本连续），有过滤条件时精确 COUNT 的结果按过滤条件在进程内缓存 ttl 秒。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+CURSOR_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def make_cursor(created_at, row_id):
+    """由一页最后一行生成下一页的游标，形如 2024-05-01T12:00:00_12345"""
+    return f'{created_at.strftime(CURSOR_TIME_FORMAT)}_{row_id}'
+
+
+def parse_cursor(value):
+    """解析游标，返回 (created_at, id)，格式错误时抛出 ValueError"""
+    created_at, _, row_id = value.rpartition('_')
+    return datetime.strptime(created_at, CURSOR_TIME_FORMAT), int(row_id)
+
+
+def build_filters(ip=None, endpoint=None, status=None, since=None, until=None):
+    """根据过滤条件生成 WHERE 子句（可能为空字符串）和参数列表
+
+    每个过滤条件都有以 created_at 结尾的复合索引：
+    (ip_address, created_at)、(endpoint, created_at)、(status_code, created_at)
+    """
+    conditions = []
+    params = []
+    if ip:
+        conditions.append('ip_address = %s')
+        params.append(ip)
+    if endpoint:
+        conditions.append('endpoint = %s')
+        params.append(endpoint)
+    if status is not None:
+        conditions.append('status_code = %s')
+        params.append(status)
+    if since is not None:
+        conditions.append('created_at >= %s')
+        params.append(since)
+    if until is not None:
+        conditions.append('created_at < %s')
+        params.append(until)
+    where_clause = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+    return where_clause, params
+
+
+def cursor_condition(where_clause, params, cursor):
+    """在已有条件上追加游标条件，返回新的 (where_clause, params)"""
+    if cursor is None:
+        return where_clause, params
+    created_at, row_id = cursor
+    condition = '(created_at < %s OR (created_at = %s AND id < %s))'
+    where_clause = f'{where_clause} AND {condition}' if where_clause else f'WHERE {condition}'
+    return where_clause, params + [created_at, created_at, row_id]
+
+
+class CountCache:
+    """按过滤条件缓存 COUNT 结果（每个 worker 进程一份）"""
+
+    def __init__(self, ttl=30.0, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (count, 计算时间)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[0]
+            self._stats['misses'] += 1
+            return None
+
+    def set(self, key, count):
+        with self._lock:
+            self._entries[key] = (count, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
+
+
+def count(cursor, where_clause, params, cache):
+    """返回 (总数, 是否为估算值)"""
+    if not where_clause:
+        cursor.execute('SELECT MIN(id), MAX(id) FROM request_logs')
+        min_id, max_id = cursor.fetchone()
+        return (max_id - min_id + 1 if min_id is not None else 0), True
+
+    key = (where_clause, tuple(params))
+    total = cache.get(key)
+    if total is None:
+        cursor.execute(f'SELECT COUNT(*) FROM request_logs {where_clause}', params)
+        total = cursor.fetchone()[0]
+        cache.set(key, total)
+    return total, False
@@ -0,0 +1,174 @@
+"""
+请求日志异步批量写入
+
+中间件只把日志行放进进程内的有界队列，由后台线程按条数/时间阈值
+用 executemany 批量写入 request_logs，请求处理不再等待数据库。
+队列满时按策略丢弃（drop）或短暂阻塞（block）后丢弃。
+after_write(cursor, rows) 在写入同一批日志的事务中调用，用于维护汇总表。
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+INSERT_SQL = '''
+    INSERT INTO request_logs (ip_address, endpoint, method, user_agent, status_code, response_time, created_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+'''
+
+
+class RequestLogWriter:
+    """请求日志的后台批量写入器（每个worker进程一个后台线程）"""
+
+    def __init__(self, connection_factory, max_queue=10000, batch_size=200, flush_interval=1.0,
+                 overflow_policy='drop', block_timeout=0.05, after_write=None):
+        self.connection_factory = connection_factory  # 返回连接上下文管理器的函数
+        self.max_queue = max(1, int(max_queue))
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy if overflow_policy in ('drop', 'block') else 'drop'
+        self.block_timeout = block_timeout
+        self.after_write = after_write
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.shutdown)
+
+    def _reset(self):
+        """初始化（或在 fork 后重建）队列和后台线程状态"""
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'queued': 0,
+            'dropped': 0,
+            'blocked': 0,
+            'flushed': 0,
+            'failed': 0,
+            'batches': 0,
+        }
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _ensure_thread(self):
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._stop.is_set() or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name='request-log-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, ip_address, endpoint, method, user_agent, status_code=None, response_time=None,
+               created_at=None):
+        """放入一条请求日志，返回是否成功入队"""
+        self._ensure_thread()
+        row = (ip_address, endpoint, method, user_agent, status_code, response_time, created_at)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            if self.overflow_policy != 'block':
+                self._count('dropped')
+                return False
+            self._count('blocked')
+            try:
+                self._queue.put(row, timeout=self.block_timeout)
+            except queue.Full:
+                self._count('dropped')
+                return False
+        self._count('queued')
+        return True
+
+    def _drain(self, limit):
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, rows):
+        if not rows:
+            return
+        with self._write_lock:
+            try:
+                with self.connection_factory() as conn:
+                    cursor = conn.cursor()
+                    conn.begin()
+                    cursor.executemany(INSERT_SQL, rows)
+                    if self.after_write is not None:
+                        self.after_write(cursor, rows)
+                    conn.commit()
+                self._count('flushed', len(rows))
+                self._count('batches')
+            except Exception as e:
+                self._count('failed', len(rows))
+                logger.error(f"批量写入请求日志失败（{len(rows)}条）: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            rows = [first]
+            deadline = time.monotonic() + self.flush_interval
+            # 攒够一批或等到时间阈值再写
+            while len(rows) < self.batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                rows.extend(self._drain(self.batch_size - len(rows)))
+            self._write(rows)
+        # 退出前写完队列中剩余的日志
+        self.flush()
+
+    def flush(self):
+        """在当前线程写完队列中的所有日志"""
+        if self._pid != os.getpid():
+            return
+        while True:
+            rows = self._drain(self.batch_size)
+            if not rows:
+                break
+            self._write(rows)
+
+    def shutdown(self, timeout=5.0):
+        """停止后台线程并写完剩余日志（worker 退出/被回收时调用）"""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        """写入器统计信息（当前 worker 进程）"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({
+            'pid': self._pid,
+            'queue_depth': self._queue.qsize(),
+            'max_queue': self.max_queue,
+            'overflow_policy': self.overflow_policy,
+        })
+        return stats
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+请求日志的分钟级汇总表
+
+request_minutes 每分钟一行（请求数、被拒绝的请求数、有响应时间的请求数和响应时间合计），
+平均响应时间只按有响应时间的请求计算（被限流/封禁拒绝的请求没有响应时间）。request_minute_ips 保存每分钟
+请求最多的IP。请求日志写入器每写入一批日志，在同一个事务里把这批日志按分钟累加到汇总表，
+/api/security/stats 按时间范围读取汇总表，不再扫描 request_logs。
+
+每批日志只记录该批中请求最多的 top_ips 个IP（每分钟每批），因此 request_minute_ips 中的计数
+是下限：高频IP在每一批里都会入选，计数基本准确；偶尔访问的IP可能没有记录。
+
+用法：
+    python request_rollup.py rebuild [--days 1]    # 根据 request_logs 重新计算最近几天的汇总
+"""
+
+import argparse
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from storage import dialect
+
+# 被拒绝的请求（限流 429、封禁 403）
+BLOCKED_STATUS_CODES = (403, 429)
+
+CREATE_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS request_minutes (
+        minute DATETIME PRIMARY KEY COMMENT '统计分钟',
+        requests INT NOT NULL DEFAULT 0 COMMENT '请求数',
+        blocked INT NOT NULL DEFAULT 0 COMMENT '被拒绝的请求数（403/429）',
+        timed INT NOT NULL DEFAULT 0 COMMENT '有响应时间的请求数',
+        response_time_total DOUBLE NOT NULL DEFAULT 0 COMMENT '响应时间合计(ms)'
+    ) ENGINE=InnoDB
+      DEFAULT CHARSET=utf8mb4
+      COLLATE=utf8mb4_unicode_ci
+      COMMENT='请求分钟汇总表'
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS request_minute_ips (
+        minute DATETIME NOT NULL COMMENT '统计分钟',
+        ip_address VARCHAR(45) NOT NULL COMMENT 'IP地址',
+        requests INT NOT NULL DEFAULT 0 COMMENT '请求数',
+        blocked INT NOT NULL DEFAULT 0 COMMENT '被拒绝的请求数（403/429）',
+        PRIMARY KEY (minute, ip_address)
+    ) ENGINE=InnoDB
+      DEFAULT CHARSET=utf8mb4
+      COLLATE=utf8mb4_unicode_ci
+      COMMENT='请求分钟汇总表：每分钟请求最多的IP'
+    ''',
+]
+
+
+def _minute(created_at):
+    return (created_at or datetime.now()).replace(second=0, microsecond=0)
+
+
+def record_batch(cursor, rows, top_ips=20):
+    """把一批请求日志累加到汇总表（在调用方的事务中执行）
+
+    rows 与 request_logs 的写入行相同：(ip, endpoint, method, user_agent, status_code, response_time, created_at)
+    """
+    if not rows:
+        return
+    minutes = defaultdict(lambda: [0, 0, 0, 0.0])
+    ips = defaultdict(Counter)
+    ip_blocked = defaultdict(Counter)
+    for ip_address, _, _, _, status_code, response_time, created_at in rows:
+        minute = _minute(created_at)
+        totals = minutes[minute]
+        blocked = status_code in BLOCKED_STATUS_CODES
+        totals[0] += 1
+        totals[1] += 1 if blocked else 0
+        if response_time is not None:
+            totals[2] += 1
+            totals[3] += response_time
+        ips[minute][ip_address] += 1
+        if blocked:
+            ip_blocked[minute][ip_address] += 1
+
+    backend = dialect(cursor)
+    backend.upsert_add(cursor, 'request_minutes', ('minute',), ('requests', 'blocked', 'timed', 'response_time_total'),
+                       [(minute, *totals) for minute, totals in minutes.items()])
+
+    ip_rows = []
+    for minute, counts in ips.items():
+        for ip_address, n in counts.most_common(top_ips):
+            ip_rows.append((minute, ip_address, n, ip_blocked[minute][ip_address]))
+    backend.upsert_add(cursor, 'request_minute_ips', ('minute', 'ip_address'), ('requests', 'blocked'), ip_rows)
+
+
+def read(cursor, since, until, top=10):
+    """读取 [since, until) 范围内的汇总，返回 {requests, blocked, avg_response_time, top_ips}"""
+    cursor.execute('''
+        SELECT COALESCE(SUM(requests), 0), COALESCE(SUM(blocked), 0), COALESCE(SUM(timed), 0),
+               COALESCE(SUM(response_time_total), 0)
+        FROM request_minutes
+        WHERE minute >= %s AND minute < %s
+    ''', (_minute(since), until))
+    requests, blocked, timed, response_time_total = cursor.fetchone()
+
+    cursor.execute('''
+        SELECT ip_address, SUM(requests) AS request_count, SUM(blocked)
+        FROM request_minute_ips
+        WHERE minute >= %s AND minute < %s
+        GROUP BY ip_address
+        ORDER BY request_count DESC
+        LIMIT %s
+    ''', (_minute(since), until, top))
+    top_ips = [{'ip_address': row[0], 'request_count': int(row[1]), 'blocked_count': int(row[2])}
+               for row in cursor.fetchall()]
+
+    timed = int(timed)
+    return {
+        'requests': int(requests),
+        'blocked': int(blocked),
+        'avg_response_time': round(float(response_time_total) / timed, 2) if timed else None,
+        'top_ips': top_ips,
+    }
+
+
+def is_empty(cursor):
+    cursor.execute('SELECT 1 FROM request_minutes LIMIT 1')
+    return cursor.fetchone() is None
+
+
+def backfill_timed(cursor):
+    """旧版本的汇总行没有 timed 列，按未被拒绝的请求数估算（被拒绝的请求不记录响应时间）"""
+    cursor.execute('UPDATE request_minutes SET timed = requests - blocked WHERE timed = 0')
+
+
+def rebuild(conn, since=None):
+    """根据 request_logs 重新计算 since 之后（默认全部）的汇总（单个事务），IP汇总为精确值"""
+    since = _minute(since) if since else datetime(1970, 1, 2)
+    cursor = conn.cursor()
+    conn.begin()
+    try:
+        cursor.execute('DELETE FROM request_minutes WHERE minute >= %s', (since,))
+        cursor.execute('DELETE FROM request_minute_ips WHERE minute >= %s', (since,))
+        blocked = ', '.join(str(code) for code in BLOCKED_STATUS_CODES)
+        cursor.execute(f'''
+            INSERT INTO request_minutes (minute, requests, blocked, timed, response_time_total)
+            SELECT DATE_FORMAT(created_at, '%%Y-%%m-%%d %%H:%%i:00') AS m,
+                   COUNT(*), SUM(status_code IN ({blocked})), COUNT(response_time), COALESCE(SUM(response_time), 0)
+            FROM request_logs WHERE created_at >= %s GROUP BY m
+        ''', (since,))
+        cursor.execute(f'''
+            INSERT INTO request_minute_ips (minute, ip_address, requests, blocked)
+            SELECT DATE_FORMAT(created_at, '%%Y-%%m-%%d %%H:%%i:00') AS m, ip_address,
+                   COUNT(*), SUM(status_code IN ({blocked}))
+            FROM request_logs WHERE created_at >= %s GROUP BY m, ip_address
+        ''', (since,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='请求日志分钟汇总表')
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--days', type=int, default=None, help='只重新计算最近几天，默认全部')
+    args = parser.parse_args(argv)
+
+    from app import get_db_connection
+
+    since = datetime.now() - timedelta(days=args.days) if args.days else None
+    print(f"🔧 正在根据 request_logs 重建请求汇总表{f'（最近 {args.days} 天）' if args.days else ''}...")
+    with get_db_connection() as conn:
+        rebuild(conn, since)
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*), COALESCE(SUM(requests), 0) FROM request_minutes')
+        minutes, requests = cursor.fetchone()
+    print(f"✅ 重建完成: {minutes} 分钟，{requests} 次请求")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+按数据版本失效的响应缓存
+
+data_versions 表为每类数据（messages、stats ...）保存一个版本号，写操作在同一个连接里
+把相关版本号加一，所有 worker 都能看到。读接口先查版本号（主键查询），版本号未变时：
+- 客户端带着相同的 ETag（If-None-Match）请求，直接返回 304
+- 否则返回进程内缓存的响应体，不再查表和序列化 JSON
+
+高频的写入（每次页面访问都会改变的访问统计）不逐次加版本号，否则所有访问都会在同一行上排队加锁，
+相关响应的 ETag 也几乎每次都会变化。time_buckets 中的类别，版本号再加上按固定秒数划分的时间段，
+这类数据最多延迟一个时间段才反映到缓存的响应中（留言等低频写入仍然立即加版本号）。
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from storage import dialect
+
+CREATE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        name VARCHAR(50) PRIMARY KEY COMMENT '数据类别',
+        version BIGINT NOT NULL DEFAULT 0 COMMENT '版本号，数据变化时加一',
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间'
+    ) ENGINE=InnoDB
+      DEFAULT CHARSET=utf8mb4
+      COLLATE=utf8mb4_unicode_ci
+      COMMENT='数据版本表：用于响应缓存失效'
+'''
+
+
+class DataVersions:
+    """读取和递增 data_versions 中的版本号"""
+
+    def __init__(self, connection_factory, local_ttl=0.0, time_buckets=None):
+        self.connection_factory = connection_factory
+        self.local_ttl = local_ttl  # 进程内缓存版本号的秒数，0 表示每次都查库
+        self.time_buckets = dict(time_buckets or {})  # name -> 时间段秒数，版本号为 (版本号, 时间段)
+        self._local = {}            # name -> (version, 读取时间)
+        self._lock = threading.Lock()
+
+    def current(self, names):
+        """返回 {name: version}，不存在的类别版本号为 0；time_buckets 中的类别为 (version, 时间段)"""
+        now = time.monotonic()
+        result = {}
+        missing = []
+        with self._lock:
+            for name in names:
+                item = self._local.get(name)
+                if item is not None and now - item[1] < self.local_ttl:
+                    result[name] = item[0]
+                else:
+                    missing.append(name)
+        if missing:
+            with self.connection_factory() as conn:
+                cursor = conn.cursor()
+                placeholders = ', '.join(['%s'] * len(missing))
+                cursor.execute(f'SELECT name, version FROM data_versions WHERE name IN ({placeholders})', missing)
+                found = dict(cursor.fetchall())
+            with self._lock:
+                for name in missing:
+                    result[name] = found.get(name, 0)
+                    self._local[name] = (result[name], now)
+        if self.time_buckets:
+            wall = time.time()
+            for name in names:
+                seconds = self.time_buckets.get(name)
+                if seconds:
+                    result[name] = (result[name], int(wall // seconds))
+        return result
+
+    def bump(self, cursor, *names):
+        """在调用方的连接（可在事务中）里把版本号加一"""
+        if not names:
+            return
+        dialect(cursor).upsert_add(cursor, 'data_versions', ('name',), ('version',), [(name, 1) for name in names])
+        with self._lock:
+            for name in names:
+                self._local.pop(name, None)
+
+
+class ResponseCache:
+    """进程内的有界响应缓存，条目带有生成时的版本，版本不一致即视为失效"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()  # key -> (etag, body, mimetype)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'bypassed': 0}
+
+    @staticmethod
+    def make_etag(key, versions):
+        raw = repr((key, sorted(versions.items())))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24]
+
+    def count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key, etag):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1], entry[2]
+
+    def set(self, key, etag, body, mimetype):
+        with self._lock:
+            self._entries[key] = (etag, body, mimetype)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """缓存统计（当前 worker 进程）"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['not_modified']) / (lookups + stats['not_modified']), 4) \
+            if lookups + stats['not_modified'] else 0.0
+        return stats
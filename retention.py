@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+数据保留与清理
+
+request_logs、activity_logs 中的访问记录、已过期的 ip_bans 记录、请求分钟汇总、变更事件和按天的访客去重记录会一直增长，
+这里按表配置保留天数，超过期限的数据分批删除：每批按时间索引取出最多 batch_size 行的主键
+（SELECT ... FOR UPDATE），再按主键删除并立即提交，批与批之间暂停 batch_pause 秒，避免长时间持有锁
+或造成复制延迟。设置了 archive_dir 时，删除前把整行以 JSON Lines 追加写入 gzip 压缩的归档文件。
+
+留言（activity_logs 中 activity_type = 'message' 的记录）和累计统计（stats_uniques 中 1970-01-01 的行）
+永远不会被清理。清理过访问记录之后，stats_rollup.py rebuild 只能根据剩余的访问记录计算，请勿再执行。
+
+多个 worker 或定时任务同时运行时，用 MySQL 的 GET_LOCK（SQLite 后端为锁文件，见 storage.py）保证同一时间只有一个清理任务。
+
+用法：
+    python retention.py run [--table request_logs] [--dry-run]
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from stats_rollup import TOTAL_DATE
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = 'birthday_board_retention'
+
+# 各表的清理规则：where 中的 %(cutoff)s 为保留期限的起点；order 需要能走索引；
+# key 为删除时使用的主键列；archive 为 False 的表不归档
+POLICIES = {
+    'request_logs': {
+        'table': 'request_logs',
+        'where': 'created_at < %(cutoff)s',
+        'order': 'created_at, id',
+        'key': ['id'],
+        'archive': True,
+    },
+    'visits': {
+        'table': 'activity_logs',
+        'where': "activity_type = 'visit' AND created_at < %(cutoff)s",
+        'order': 'activity_type, created_at, id',
+        'key': ['id'],
+        'archive': True,
+    },
+    'expired_bans': {
+        'table': 'ip_bans',
+        'where': 'is_permanent = FALSE AND expires_at < %(cutoff)s',
+        'order': 'expires_at, id',
+        'key': ['id'],
+        'archive': True,
+        'bump': 'bans',
+    },
+    'request_minutes': {
+        'table': 'request_minutes',
+        'where': 'minute < %(cutoff)s',
+        'order': 'minute',
+        'key': ['minute'],
+        'archive': False,
+    },
+    'request_minute_ips': {
+        'table': 'request_minute_ips',
+        'where': 'minute < %(cutoff)s',
+        'order': 'minute, ip_address',
+        'key': ['minute', 'ip_address'],
+        'archive': False,
+    },
+    'change_events': {
+        'table': 'change_events',
+        'where': 'created_at < %(cutoff)s',
+        'order': 'created_at, id',
+        'key': ['id'],
+        'archive': False,
+    },
+    'visitor_uniques': {
+        'table': 'stats_uniques',
+        'where': "kind = 'visitor' AND stat_date > %(total_date)s AND stat_date < %(cutoff)s",
+        'order': 'kind, stat_date, value',
+        'key': ['kind', 'stat_date', 'value'],
+        'archive': False,
+    },
+}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class Retention:
+    """按表的保留天数分批清理过期数据；interval 大于 0 时每个 worker 启动一个后台调度线程"""
+
+    def __init__(self, connection_factory, data_versions, ttl_days, batch_size=1000, batch_pause=0.1,
+                 archive_dir=None, interval=0):
+        self.connection_factory = connection_factory
+        self.data_versions = data_versions
+        # 名称 -> 保留天数，0 表示不清理
+        self.ttl_days = {name: int(days) for name, days in ttl_days.items() if name in POLICIES}
+        self.batch_size = max(1, int(batch_size))
+        self.batch_pause = batch_pause
+        self.archive_dir = archive_dir or None
+        self.interval = interval
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'runs': 0,
+            'skipped': 0,   # 其它进程正在清理
+            'errors': 0,
+            'deleted': 0,
+            'archived': 0,
+            'last_run': None,
+        }
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def ensure_started(self):
+        """启动后台调度线程（interval 为 0 时不启动），fork 之后在各 worker 中调用"""
+        if not self.interval or self.interval <= 0:
+            return
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run()
+            except Exception as e:
+                self._count('errors')
+                logger.error(f"数据清理失败: {e}")
+
+    def _params(self, days, now):
+        return {'cutoff': now - timedelta(days=days), 'total_date': TOTAL_DATE}
+
+    def run(self, names=None, dry_run=False):
+        """执行一次清理，返回本次统计；其它进程正在清理时返回 None
+
+        dry_run 时只统计各表将被删除的行数，不删除
+        """
+        names = [name for name in (names or POLICIES) if self.ttl_days.get(name, 0) > 0]
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT GET_LOCK(%s, 0)', (LOCK_NAME,))
+            if cursor.fetchone()[0] != 1:
+                self._count('skipped')
+                logger.info("其它进程正在执行数据清理，本次跳过")
+                return None
+            try:
+                started = time.monotonic()
+                now = datetime.now()
+                result = {'started_at': now.isoformat(), 'dry_run': dry_run, 'tables': {}}
+                for name in names:
+                    params = self._params(self.ttl_days[name], now)
+                    if dry_run:
+                        result['tables'][name] = self._count_rows(cursor, POLICIES[name], params)
+                    else:
+                        result['tables'][name] = self._purge(conn, cursor, name, POLICIES[name], params)
+                result['seconds'] = round(time.monotonic() - started, 3)
+            finally:
+                cursor.execute('SELECT RELEASE_LOCK(%s)', (LOCK_NAME,))
+
+        if not dry_run:
+            with self._stats_lock:
+                self._stats['runs'] += 1
+                self._stats['deleted'] += sum(t['deleted'] for t in result['tables'].values())
+                self._stats['archived'] += sum(t['archived'] for t in result['tables'].values())
+                self._stats['last_run'] = result
+        return result
+
+    def _count_rows(self, cursor, policy, params):
+        cursor.execute(f"SELECT COUNT(*) FROM {policy['table']} WHERE {policy['where']}", params)
+        return {'cutoff': params['cutoff'].isoformat(), 'matched': cursor.fetchone()[0]}
+
+    def _purge(self, conn, cursor, name, policy, params):
+        """分批删除一张表的过期数据"""
+        started = time.monotonic()
+        archive = None
+        deleted = archived = batches = 0
+        key = policy['key']
+        select_columns = '*' if self.archive_dir and policy['archive'] else ', '.join(key)
+        try:
+            while True:
+                conn.begin()
+                cursor.execute(f'''
+                    SELECT {select_columns} FROM {policy['table']}
+                    WHERE {policy['where']}
+                    ORDER BY {policy['order']}
+                    LIMIT {self.batch_size}
+                    FOR UPDATE
+                ''', params)
+                rows = cursor.fetchall()
+                if not rows:
+                    conn.commit()
+                    break
+
+                if select_columns == '*':
+                    columns = [column[0] for column in cursor.description]
+                    if archive is None:
+                        archive = self._open_archive(name)
+                    for row in rows:
+                        archive.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False,
+                                                 default=_json_default) + '\n')
+                    archive.flush()
+                    archived += len(rows)
+                    key_indexes = [columns.index(column) for column in key]
+                    keys = [tuple(row[i] for i in key_indexes) for row in rows]
+                else:
+                    keys = [tuple(row) for row in rows]
+
+                if len(key) == 1:
+                    placeholders = ', '.join(['%s'] * len(keys))
+                    cursor.execute(f"DELETE FROM {policy['table']} WHERE {key[0]} IN ({placeholders})",
+                                   [k[0] for k in keys])
+                else:
+                    row_placeholder = '(' + ', '.join(['%s'] * len(key)) + ')'
+                    placeholders = ', '.join([row_placeholder] * len(keys))
+                    cursor.execute(f"DELETE FROM {policy['table']} WHERE ({', '.join(key)}) IN ({placeholders})",
+                                   [value for k in keys for value in k])
+                deleted += cursor.rowcount
+                if policy.get('bump'):
+                    self.data_versions.bump(cursor, policy['bump'])
+                conn.commit()
+                batches += 1
+
+                if len(rows) < self.batch_size:
+                    break
+                if self.batch_pause:
+                    time.sleep(self.batch_pause)
+        finally:
+            if archive is not None:
+                archive.close()
+
+        result = {
+            'cutoff': params['cutoff'].isoformat(),
+            'deleted': deleted,
+            'archived': archived,
+            'batches': batches,
+            'seconds': round(time.monotonic() - started, 3),
+        }
+        if deleted:
+            logger.info(f"清理 {policy['table']}（{name}）: 删除 {deleted} 行，共 {batches} 批，"
+                        f"耗时 {result['seconds']}s")
+        return result
+
+    def _open_archive(self, name):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl.gz")
+        return gzip.open(path, 'at', encoding='utf-8')
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['ttl_days'] = dict(self.ttl_days)
+        stats['interval'] = self.interval
+        return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='按保留天数清理过期数据')
+    parser.add_argument('command', choices=['run'])
+    parser.add_argument('--table', action='append', choices=sorted(POLICIES),
+                        help='只清理指定的数据（可重复），默认全部')
+    parser.add_argument('--dry-run', action='store_true', help='只统计将被删除的行数')
+    args = parser.parse_args(argv)
+
+    from app import retention
+
+    print(f"🧹 保留天数: {retention.ttl_days}")
+    result = retention.run(args.table, dry_run=args.dry_run)
+    if result is None:
+        print("⚠️  其它进程正在执行数据清理")
+        return 1
+    for name, table_result in result['tables'].items():
+        print(f"   {name}: {table_result}")
+    print(f"✅ 完成，耗时 {result['seconds']}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,6 +6,35 @@ let totalMessagesElement;
 let totalVisitorsElement;
 let currentSection = 0;
 
+// 留言增量同步：首次拉取最新一页，之后只拉取 latestMessageId 之后的新留言
+const MESSAGE_PAGE_SIZE = 100;
+let latestMessageId = null;
+
+async function fetchMessages() {
+    let hasMore = true;
+    while (hasMore) {
+        const url = latestMessageId === null
+            ? `/api/messages?limit=${MESSAGE_PAGE_SIZE}`
+            : `/api/messages?since_id=${latestMessageId}&limit=${MESSAGE_PAGE_SIZE}`;
+        const response = await fetch(url);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const data = await response.json();
+        const knownIds = new Set(messages.map(m => m.id));
+        const newMessages = (data.messages || []).filter(m => !knownIds.has(m.id));
+        if (newMessages.length > 0) {
+            messages = [...newMessages, ...messages];
+        }
+        // 首次加载只取最新一页，增量同步时把积压的新留言取完
+        hasMore = latestMessageId !== null && data.has_more;
+        if (data.latest_id !== null && data.latest_id !== undefined) {
+            latestMessageId = Math.max(latestMessageId || 0, data.latest_id);
+        }
+    }
+    return messages;
+}
+
 // 初始化
 document.addEventListener('DOMContentLoaded', function() {
     messagesContainer = document.getElementById('messagesContainer');
@@ -517,16 +546,12 @@ function initializeDanmaku() {
     startDanmaku();
     
     // 异步获取真实祝福消息
-    fetch('/api/messages')
-        .then(response => response.json())
-        .then(data => {
-            const realMessages = Array.isArray(data) ? data : (data.messages || []);
+    fetchMessages()
+        .then(realMessages => {
             if (realMessages.length > 0) {
                 // 合并预设和真实祝福
                 danmakuMessages = [...defaultMessages, ...realMessages];
                 console.log('真实祝福合并完成，总数:', danmakuMessages.length);
-                // 更新全局messages变量
-                messages = realMessages;
             }
         })
         .catch(error => {
@@ -1087,17 +1112,13 @@ async function handleFormSubmit(e) {
 // 加载留言
 async function loadMessages() {
     try {
-        const response = await fetch('/api/messages');
-        if (response.ok) {
-            const data = await response.json();
-            messages = data.messages || [];
-            renderMessages();
-        } else {
-            renderNoMessages();
-        }
+        await fetchMessages();
+        renderMessages();
     } catch (error) {
         console.error('Error loading messages:', error);
-        renderNoMessages();
+        if (messages.length === 0) {
+            renderNoMessages();
+        }
     }
 }
 
@@ -1245,9 +1266,84 @@ document.addEventListener('visibilitychange', function() {
     }
 });
 
-// 定期刷新留言（每30秒）
-setInterval(() => {
+// 实时更新：先用不带 after 的长轮询请求（立即返回）探测服务器是否开启推送；
+// 开启时优先使用 SSE（EventSource 断开后会自动重连并补发事件），不支持 EventSource 时用长轮询；
+// 未开启时（sync worker 下推送连接会占住整个 worker）每30秒调用 fallback 定时刷新
+function subscribeEvents(channels, handlers, fallback) {
+    const dispatch = (type, data) => {
+        if (handlers[type]) {
+            handlers[type](data);
+        }
+    };
+    
+    let lastId = null;
+    async function poll() {
+        let delay = 0;
+        try {
+            const url = lastId === null
+                ? `/api/events/poll?channels=${channels}`
+                : `/api/events/poll?channels=${channels}&after=${lastId}`;
+            const response = await fetch(url);
+            if (response.ok) {
+                const data = await response.json();
+                if (data.resync) {
+                    dispatch('resync', {});
+                }
+                (data.events || []).forEach(event => dispatch(event.type, event.data));
+                lastId = data.last_id;
+            } else {
+                delay = 5000;
+            }
+        } catch (error) {
+            delay = 5000;
+        }
+        setTimeout(poll, delay);
+    }
+    
+    fetch(`/api/events/poll?channels=${channels}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (window.EventSource) {
+                const source = new EventSource(`/api/events?channels=${channels}`);
+                Object.keys(handlers).forEach(type => {
+                    source.addEventListener(type, event => dispatch(type, JSON.parse(event.data)));
+                });
+                return;
+            }
+            (data.events || []).forEach(event => dispatch(event.type, event.data));
+            lastId = data.last_id;
+            poll();
+        })
+        .catch(() => {
+            if (fallback) {
+                setInterval(fallback, 30000);
+            }
+        });
+}
+
+// 新留言、删除留言和统计变化由服务器推送；服务器未开启推送时退回每30秒刷新
+subscribeEvents('messages,stats', {
+    'message.created': () => loadMessages(),
+    'message.deleted': data => {
+        const deleted = new Set(data.ids || []);
+        messages = messages.filter(message => !deleted.has(message.id));
+        renderMessages();
+    },
+    'stats': stats => updateStats(stats),
+    'resync': () => {
+        // 错过了部分事件，重新拉取最新一页
+        messages = [];
+        latestMessageId = null;
+        loadMessages();
+    }
+}, () => {
+    // 服务器未开启推送时定期刷新留言（每30秒）
     if (!document.hidden) {
         loadMessages();
     }
-}, 30000);
+});
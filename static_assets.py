@@ -0,0 +1,137 @@
+"""
+预构建静态资源的读取与协商
+
+build_static.py 把 CSS/JS 生成带内容哈希的文件名（styles.3f2a1b9c0d.css），并预先压缩出
+.gz / .br 版本，页面中的资源地址改写为 /assets/<带哈希的文件名>，映射关系写入 manifest.json。
+运行时按 Accept-Encoding 选择已压缩好的文件（不在请求中压缩），文件内容缓存在进程内存中。
+带哈希的地址内容永远不变，可以使用一年的 immutable 缓存。
+"""
+
+import json
+import logging
+import mimetypes
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+ASSET_URL_PREFIX = '/assets/'
+
+# 按优先级排列的预压缩格式：(Content-Encoding, 文件后缀)
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def rewrite_asset_urls(html, assets, prefix=ASSET_URL_PREFIX):
+    """把页面中 href/src 引用的原始资源名替换为带哈希的地址"""
+    if not assets:
+        return html
+    names = '|'.join(re.escape(name) for name in sorted(assets, key=len, reverse=True))
+    pattern = re.compile(r'''(\b(?:href|src)=["'])(?:\./|/)?(''' + names + r''')(["'])''')
+    return pattern.sub(lambda m: f'{m.group(1)}{prefix}{assets[m.group(2)]}{m.group(3)}', html)
+
+
+def parse_accept_encoding(header):
+    """解析 Accept-Encoding，返回客户端接受的编码集合（忽略 q=0 的项）"""
+    accepted = set()
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(token)
+    return accepted
+
+
+class StaticAssets:
+    """读取 build_static.py 的输出目录；目录或清单不存在时 enabled 为 False，调用方按原方式提供文件"""
+
+    def __init__(self, dist_dir):
+        self.dist_dir = dist_dir
+        self.assets = {}   # 原始文件名 -> 带哈希的文件名
+        self.pages = {}    # 页面文件名 -> 内容哈希
+        self._files = {}   # 相对路径 -> 文件内容
+        self._lock = threading.Lock()
+        self.load()
+
+    @property
+    def enabled(self):
+        return bool(self.assets or self.pages)
+
+    def load(self):
+        """重新读取清单（例如重新构建之后）"""
+        path = os.path.join(self.dist_dir, MANIFEST_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+        except Exception as e:
+            logger.error(f"读取静态资源清单失败: {e}")
+            manifest = {}
+        with self._lock:
+            self.assets = manifest.get('assets', {})
+            self.pages = manifest.get('pages', {})
+            self._hashed = {hashed: name for name, hashed in self.assets.items()}
+            self._files = {}
+
+    def rewrite(self, html):
+        return rewrite_asset_urls(html, self.assets)
+
+    def _read(self, relative_path):
+        data = self._files.get(relative_path)
+        if data is None:
+            path = os.path.join(self.dist_dir, relative_path)
+            if not os.path.isfile(path):
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+            with self._lock:
+                self._files[relative_path] = data
+        return data
+
+    def _select(self, relative_path, accept_encoding):
+        accepted = parse_accept_encoding(accept_encoding)
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted:
+                data = self._read(relative_path + suffix)
+                if data is not None:
+                    return data, encoding
+        return self._read(relative_path), None
+
+    def lookup(self, path, accept_encoding):
+        """查找资源，返回 {body, encoding, mimetype, etag, immutable}，不存在返回 None
+
+        path 可以是带哈希的文件名（/assets/ 下的地址），也可以是原始资源名或页面名
+        """
+        if path in self._hashed:
+            relative_path, original, version, immutable = f'assets/{path}', self._hashed[path], path, True
+        elif path in self.assets:
+            hashed = self.assets[path]
+            relative_path, original, version, immutable = f'assets/{hashed}', path, hashed, False
+        elif path in self.pages:
+            relative_path, original, version, immutable = f'pages/{path}', path, self.pages[path], False
+        else:
+            return None
+
+        body, encoding = self._select(relative_path, accept_encoding)
+        if body is None:
+            return None
+        mimetype = mimetypes.guess_type(original)[0] or 'application/octet-stream'
+        if mimetype.startswith('text/') or mimetype in ('application/javascript', 'application/json'):
+            mimetype += '; charset=utf-8'
+        return {
+            'body': body,
+            'encoding': encoding,
+            'mimetype': mimetype,
+            'etag': f'{version}-{encoding or "identity"}',
+            'immutable': immutable,
+        }
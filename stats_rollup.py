@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+留言/访问统计的汇总表
+
+stats_counters 每天一行（stat_date = 统计日期），另有一行 stat_date = TOTAL_DATE 保存留言的累计值；
+stats_uniques 记录已经出现过的访客IP（累计和按天）和留言者姓名（累计，带引用计数），
+用来增量维护去重计数。写入留言/访问和删除留言时在同一个事务里更新汇总表。
+
+访问通常只更新当天的一行（否则每次访问都要在当天和累计两行上排队加锁）；
+只有IP第一次出现（stats_uniques 中插入了累计的访客行）时才给累计行的独立访客数加一。
+/api/stats 按主键读取两行。
+
+用法：
+    python stats_rollup.py rebuild    # 根据 activity_logs 重新计算汇总表
+"""
+
+import sys
+from collections import Counter
+from datetime import date
+
+from storage import dialect
+
+# 保存累计值的行使用的特殊日期
+TOTAL_DATE = date(1970, 1, 1)
+
+CREATE_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS stats_counters (
+        stat_date DATE PRIMARY KEY COMMENT '统计日期，1970-01-01 为累计值',
+        messages BIGINT NOT NULL DEFAULT 0 COMMENT '留言数',
+        visits BIGINT NOT NULL DEFAULT 0 COMMENT '访问次数（累计行不使用）',
+        unique_visitors BIGINT NOT NULL DEFAULT 0 COMMENT '独立访客IP数',
+        unique_messagers BIGINT NOT NULL DEFAULT 0 COMMENT '独立留言者数（仅累计行）',
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间'
+    ) ENGINE=InnoDB
+      DEFAULT CHARSET=utf8mb4
+      COLLATE=utf8mb4_unicode_ci
+      COMMENT='统计汇总表：按天和累计的留言/访问计数'
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS stats_uniques (
+        kind VARCHAR(16) NOT NULL COMMENT 'visitor 或 messager',
+        stat_date DATE NOT NULL COMMENT '统计日期，1970-01-01 为累计',
+        value VARCHAR(100) NOT NULL COMMENT '访客IP或留言者姓名',
+        cnt INT NOT NULL DEFAULT 1 COMMENT '出现次数',
+        PRIMARY KEY (kind, stat_date, value)
+    ) ENGINE=InnoDB
+      DEFAULT CHARSET=utf8mb4
+      COLLATE=utf8mb4_unicode_ci
+      COMMENT='统计去重表：用于增量维护独立访客/留言者数'
+    ''',
+]
+
+
+def record_visit(cursor, ip_address, day):
+    """登记一次访问（在调用方的事务中执行）"""
+    backend = dialect(cursor)
+    # 插入的行数：2 = 累计和当天都是新IP，1 = 只有当天是新IP，0 = 都见过
+    new_rows = backend.insert_ignore(cursor, 'stats_uniques', ('kind', 'stat_date', 'value'),
+                                     [('visitor', TOTAL_DATE, ip_address), ('visitor', day, ip_address)])
+    rows = [(day, 1, 1 if new_rows >= 1 else 0)]
+    if new_rows == 2:
+        # 第一次出现的IP，累计行只在这时更新
+        rows.append((TOTAL_DATE, 0, 1))
+    backend.upsert_add(cursor, 'stats_counters', ('stat_date',), ('visits', 'unique_visitors'), rows)
+
+
+def record_message(cursor, name, day):
+    """登记一条新留言（在调用方的事务中执行）"""
+    backend = dialect(cursor)
+    created = backend.upsert_created(cursor, 'stats_uniques', ('kind', 'stat_date', 'value'), 'cnt',
+                                     ('messager', TOTAL_DATE, name))
+    new_messager = 1 if created else 0
+    backend.upsert_add(cursor, 'stats_counters', ('stat_date',), ('messages', 'unique_messagers'),
+                       [(TOTAL_DATE, 1, new_messager), (day, 1, 0)])
+
+
+def remove_messages(cursor, messages):
+    """登记一批留言被删除（在调用方的事务中执行），messages 为 [(留言者姓名, 创建日期)]"""
+    if not messages:
+        return
+    by_name = Counter(name for name, _ in messages)
+    by_day = Counter(day for _, day in messages)
+
+    for name, n in by_name.items():
+        cursor.execute('''
+            UPDATE stats_uniques SET cnt = cnt - %s
+            WHERE kind = 'messager' AND stat_date = %s AND value = %s
+        ''', (n, TOTAL_DATE, name))
+    placeholders = ', '.join(['%s'] * len(by_name))
+    cursor.execute(f'''
+        DELETE FROM stats_uniques
+        WHERE kind = 'messager' AND stat_date = %s AND value IN ({placeholders}) AND cnt <= 0
+    ''', [TOTAL_DATE] + list(by_name))
+    gone_messagers = cursor.rowcount
+
+    cursor.execute('''
+        UPDATE stats_counters
+        SET messages = GREATEST(messages - %s, 0), unique_messagers = GREATEST(unique_messagers - %s, 0)
+        WHERE stat_date = %s
+    ''', (len(messages), gone_messagers, TOTAL_DATE))
+    for day, n in by_day.items():
+        cursor.execute('''
+            UPDATE stats_counters SET messages = GREATEST(messages - %s, 0) WHERE stat_date = %s
+        ''', (n, day))
+
+
+def read(cursor, today):
+    """读取累计和今日的统计，返回与 /api/stats 相同结构的字典"""
+    cursor.execute('''
+        SELECT stat_date, messages, unique_visitors, unique_messagers
+        FROM stats_counters WHERE stat_date IN (%s, %s)
+    ''', (TOTAL_DATE, today))
+    rows = {row[0]: row for row in cursor.fetchall()}
+    total = rows.get(TOTAL_DATE)
+    today_row = rows.get(today)
+    return {
+        'totalMessages': int(total[1]) if total else 0,
+        'totalVisitors': int(total[2]) if total else 0,
+        'todayMessages': int(today_row[1]) if today_row else 0,
+        'todayVisitors': int(today_row[2]) if today_row else 0,
+        'uniqueMessagers': int(total[3]) if total else 0
+    }
+
+
+def is_empty(cursor):
+    cursor.execute('SELECT COUNT(*) FROM stats_counters WHERE stat_date = %s', (TOTAL_DATE,))
+    return cursor.fetchone()[0] == 0
+
+
+def backfill_total_visitors(cursor):
+    """旧版本的累计行没有独立访客数，根据 stats_uniques 补算一次（已有值时不做任何事）"""
+    cursor.execute('''
+        UPDATE stats_counters
+        SET unique_visitors = (SELECT COUNT(*) FROM stats_uniques WHERE kind = 'visitor' AND stat_date = %s)
+        WHERE stat_date = %s AND unique_visitors = 0
+    ''', (TOTAL_DATE, TOTAL_DATE))
+
+
+def rebuild(conn):
+    """根据 activity_logs 重新计算汇总表（单个事务）"""
+    cursor = conn.cursor()
+    conn.begin()
+    try:
+        cursor.execute('DELETE FROM stats_counters')
+        cursor.execute('DELETE FROM stats_uniques')
+
+        cursor.execute('''
+            INSERT INTO stats_uniques (kind, stat_date, value, cnt)
+            SELECT 'visitor', %s, ip_address, COUNT(*) FROM activity_logs
+            WHERE activity_type = 'visit' GROUP BY ip_address
+        ''', (TOTAL_DATE,))
+        cursor.execute('''
+            INSERT INTO stats_uniques (kind, stat_date, value, cnt)
+            SELECT 'visitor', DATE(created_at), ip_address, COUNT(*) FROM activity_logs
+            WHERE activity_type = 'visit' GROUP BY DATE(created_at), ip_address
+        ''')
+        cursor.execute('''
+            INSERT INTO stats_uniques (kind, stat_date, value, cnt)
+            SELECT 'messager', %s, name, COUNT(*) FROM activity_logs
+            WHERE activity_type = 'message' AND name IS NOT NULL GROUP BY name
+        ''', (TOTAL_DATE,))
+
+        cursor.execute('''
+            INSERT INTO stats_counters (stat_date, messages, visits, unique_visitors)
+            SELECT d.stat_date, d.messages, d.visits, COALESCE(u.visitors, 0)
+            FROM (
+                SELECT DATE(created_at) AS stat_date,
+                       SUM(activity_type = 'message') AS messages,
+                       SUM(activity_type = 'visit') AS visits
+                FROM activity_logs GROUP BY DATE(created_at)
+            ) d
+            LEFT JOIN (
+                SELECT stat_date, COUNT(*) AS visitors FROM stats_uniques
+                WHERE kind = 'visitor' AND stat_date <> %s GROUP BY stat_date
+            ) u ON u.stat_date = d.stat_date
+        ''', (TOTAL_DATE,))
+        cursor.execute('''
+            INSERT INTO stats_counters (stat_date, messages, unique_visitors, unique_messagers)
+            SELECT %s,
+                   (SELECT COUNT(*) FROM activity_logs WHERE activity_type = 'message'),
+                   (SELECT COUNT(*) FROM stats_uniques WHERE kind = 'visitor' AND stat_date = %s),
+                   (SELECT COUNT(*) FROM stats_uniques WHERE kind = 'messager' AND stat_date = %s)
+        ''', (TOTAL_DATE, TOTAL_DATE, TOTAL_DATE))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv != ['rebuild']:
+        print(__doc__)
+        return 1
+
+    from app import get_db_connection, data_versions
+
+    print("🔧 正在根据 activity_logs 重建统计汇总表...")
+    with get_db_connection() as conn:
+        rebuild(conn)
+        cursor = conn.cursor()
+        data_versions.bump(cursor, 'stats')
+        stats = read(cursor, date.today())
+    print(f"✅ 重建完成: {stats}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,437 @@
+"""
+存储后端
+
+DB_BACKEND=mysql（默认）：PyMySQL + 连接池（db_pool.py），行为与之前完全相同。
+DB_BACKEND=sqlite：单文件数据库，WAL 模式（读写互不阻塞，多个 worker 可同时读，写入按事务串行），
+适合单机部署、开发和测试，不需要 MySQL 服务，也没有每次查询一次的网络往返。
+
+业务代码中的查询按 MySQL 语法编写（%s 占位符），connect_sqlite() 返回的连接与 PyMySQL 连接的用法相同
+（cursor/begin/commit/rollback/ping/close）。两种后端语义不同的写入放在方言对象中，由 dialect(cursor) 选择，
+每个后端各自生成 SQL：
+- insert_ignore：INSERT IGNORE / INSERT OR IGNORE
+- upsert_add、upsert_created：ON DUPLICATE KEY UPDATE / ON CONFLICT (...) DO UPDATE（计数累加）
+- update_first：UPDATE ... ORDER BY ... LIMIT 1 / 按 rowid 子查询（不依赖 SQLITE_ENABLE_UPDATE_DELETE_LIMIT）
+- ensure_index：information_schema + ALTER TABLE / sqlite_master + CREATE INDEX
+
+其余语句只有写法上的差异，是有意保留的适配层：SQLite 游标在执行前做下面这些逐字替换（结果有缓存），
+这样建表语句和普通查询只需要写一份：
+- %s / %(name)s 占位符转换为 ? / :name
+- CREATE TABLE：去掉 COMMENT、ENGINE 等表选项，AUTO_INCREMENT 主键改为 INTEGER PRIMARY KEY AUTOINCREMENT，
+  ENUM 改为 TEXT，表内的 INDEX 拆成单独的 CREATE INDEX（索引名加上表名前缀，SQLite 的索引名在库内唯一）；
+  ON UPDATE CURRENT_TIMESTAMP 没有对应语法，updated_at 只在语句显式赋值时更新
+- FOR UPDATE 去掉（SQLite 的写事务用 BEGIN IMMEDIATE 开始，本身就是串行的），GREATEST → MAX
+- NOW()、FROM_UNIXTIME()、DATE_FORMAT()、GET_LOCK()、RELEASE_LOCK() 注册为连接上的函数，
+  GET_LOCK 用数据库文件旁的锁文件（fcntl）实现跨进程互斥
+
+时间按本地时间以 'YYYY-mm-dd HH:MM:SS' 文本保存（与 MySQL TIMESTAMP 一样精确到秒），
+TIMESTAMP/DATETIME/DATE 列读出时转换为 datetime/date。
+
+两种后端都可以传入 observer(sql, 秒数)，每条语句执行后调用，用于统计数据库耗时：
+MySQL 通过 timed_cursor_class(observer) 作为 cursorclass 传给 pymysql.connect，SQLite 通过 connect_sqlite(observer=...)。
+"""
+
+import fcntl
+import logging
+import os
+import re
+import sqlite3
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+import pymysql
+import pymysql.cursors
+
+logger = logging.getLogger(__name__)
+
+# 两种后端的唯一键冲突异常，用于 except storage.IntegrityError
+IntegrityError = (pymysql.IntegrityError, sqlite3.IntegrityError)
+
+_PLACEHOLDER = re.compile(r'%\((\w+)\)s|%s|%%')
+_CREATE_TABLE = re.compile(r'^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\(', re.IGNORECASE)
+_INDEX_ITEM = re.compile(r'^(UNIQUE\s+)?(?:INDEX|KEY)\s+(\w+)\s*(\(.*\))$', re.IGNORECASE | re.DOTALL)
+_COMMENT = re.compile(r"\s+COMMENT\s+'(?:[^']|'')*'", re.IGNORECASE)
+
+# MySQL DATE_FORMAT 格式符 → strftime
+_DATE_FORMAT_CODES = {'%Y': '%Y', '%m': '%m', '%d': '%d', '%H': '%H', '%i': '%M', '%s': '%S', '%S': '%S', '%%': '%%'}
+
+
+def _split_items(body):
+    """按顶层逗号拆分建表语句的列定义（忽略括号和引号内的逗号）"""
+    items, depth, quoted, start = [], 0, False, 0
+    for i, ch in enumerate(body):
+        if ch == "'":
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            items.append(body[start:i])
+            start = i + 1
+    items.append(body[start:])
+    return [item.strip() for item in items if item.strip()]
+
+
+def sqlite_index_name(table, index_name):
+    return f'{table}_{index_name}'
+
+
+def translate_ddl(sql):
+    """把 MySQL 的 CREATE TABLE 转换为 SQLite 的建表和建索引语句列表"""
+    sql = re.sub(r'--[^\n]*', '', sql)
+    table = _CREATE_TABLE.match(sql).group(1)
+    body = sql[sql.index('(') + 1:sql.rindex(')')]
+    body = _COMMENT.sub('', body)
+
+    columns, indexes = [], []
+    for item in _split_items(body):
+        index = _INDEX_ITEM.match(item)
+        if index:
+            unique, name, cols = index.groups()
+            indexes.append(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS "
+                           f"{sqlite_index_name(table, name)} ON {table} {cols}")
+            continue
+        item = re.sub(r'\b(?:BIG)?INT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b', 'INTEGER PRIMARY KEY AUTOINCREMENT',
+                      item, flags=re.IGNORECASE)
+        item = re.sub(r'\bENUM\s*\([^)]*\)', 'TEXT', item, flags=re.IGNORECASE)
+        item = re.sub(r'\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP\b', '', item, flags=re.IGNORECASE)
+        item = re.sub(r'\bDEFAULT\s+CURRENT_TIMESTAMP\b', "DEFAULT (datetime('now', 'localtime'))", item,
+                      flags=re.IGNORECASE)
+        columns.append(item)
+    create = f"CREATE TABLE IF NOT EXISTS {table} (\n    " + ',\n    '.join(columns) + '\n)'
+    return [create] + indexes
+
+
+@lru_cache(maxsize=1024)
+def translate(sql, with_params):
+    """把 MySQL 语法的语句转换为 SQLite 语句列表（建表语句会拆成多条）"""
+    if _CREATE_TABLE.match(sql):
+        return tuple(translate_ddl(sql))
+
+    if with_params:
+        # 与 PyMySQL 一致：只有带参数时才处理占位符和 %%
+        def placeholder(match):
+            if match.group(1):
+                return f':{match.group(1)}'
+            return '?' if match.group(0) == '%s' else '%'
+        sql = _PLACEHOLDER.sub(placeholder, sql)
+
+    sql = re.sub(r'\s+FOR\s+UPDATE\b', '', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'\bGREATEST\s*\(', 'MAX(', sql, flags=re.IGNORECASE)
+    return (sql,)
+
+
+def _adapt(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _adapt_params(params):
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return {key: _adapt(value) for key, value in params.items()}
+    return [_adapt(value) for value in params]
+
+
+def _convert_datetime(value):
+    return datetime.fromisoformat(value.decode())
+
+
+def _convert_date(value):
+    return date.fromisoformat(value.decode()[:10])
+
+
+sqlite3.register_converter('TIMESTAMP', _convert_datetime)
+sqlite3.register_converter('DATETIME', _convert_datetime)
+sqlite3.register_converter('DATE', _convert_date)
+
+
+def _date_format(value, fmt):
+    if value is None:
+        return None
+    moment = datetime.fromisoformat(value)
+    return moment.strftime(re.sub(r'%.', lambda m: _DATE_FORMAT_CODES.get(m.group(0), m.group(0)), fmt))
+
+
+def _from_unixtime(ts):
+    return None if ts is None else datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class SQLiteCursor:
+    """接口与 PyMySQL 游标一致的 SQLite 游标"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._conn.cursor()
+        self._observer = connection.observer
+
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        try:
+            statements = translate(sql, params is not None)
+            for statement in statements[:-1]:
+                self._cursor.execute(statement)
+            self._cursor.execute(statements[-1], _adapt_params(params))
+            return self._cursor.rowcount
+        finally:
+            if self._observer is not None:
+                self._observer(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_params):
+        start = time.perf_counter()
+        try:
+            statement = translate(sql, True)[-1]
+            self._cursor.executemany(statement, (_adapt_params(params) for params in seq_of_params))
+            return self._cursor.rowcount
+        finally:
+            if self._observer is not None:
+                self._observer(sql, time.perf_counter() - start)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SQLiteConnection:
+    """接口与 PyMySQL 连接一致的 SQLite 连接（自动提交，begin() 开始写事务）"""
+
+    def __init__(self, path, busy_timeout=5.0, observer=None):
+        self.path = path
+        self.observer = observer
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        self._locks = {}  # GET_LOCK 名称 -> 锁文件
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')   # WAL 下只在检查点时 fsync，进程崩溃不丢数据
+        self._conn.execute('PRAGMA temp_store = MEMORY')
+        self._conn.execute('PRAGMA cache_size = -16000')    # 每个连接 16MB 页缓存
+        self._conn.create_function('NOW', 0, lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        self._conn.create_function('FROM_UNIXTIME', 1, _from_unixtime, deterministic=True)
+        self._conn.create_function('DATE_FORMAT', 2, _date_format, deterministic=True)
+        self._conn.create_function('GET_LOCK', 2, self._get_lock)
+        self._conn.create_function('RELEASE_LOCK', 1, self._release_lock)
+        self.open = True
+
+    def _get_lock(self, name, timeout):
+        """与 MySQL GET_LOCK 相同：获得锁返回 1，超时返回 0"""
+        if name in self._locks:
+            return 1
+        lock_file = open(f'{self.path}.{name}.lock', 'a')
+        deadline = time.monotonic() + max(timeout or 0, 0)
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._locks[name] = lock_file
+                return 1
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    lock_file.close()
+                    return 0
+                time.sleep(0.05)
+
+    def _release_lock(self, name):
+        lock_file = self._locks.pop(name, None)
+        if lock_file is None:
+            return 0
+        lock_file.close()
+        return 1
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def begin(self):
+        if self._conn.in_transaction:
+            # 与 MySQL 一致：BEGIN 会隐式提交未结束的事务
+            self._conn.execute('COMMIT')
+        self._conn.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        if self._conn.in_transaction:
+            self._conn.execute('COMMIT')
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute('ROLLBACK')
+
+    def ping(self, reconnect=False):
+        self._conn.execute('SELECT 1')
+
+    def close(self):
+        for name in list(self._locks):
+            self._release_lock(name)
+        self.open = False
+        self._conn.close()
+
+
+def connect_sqlite(path, busy_timeout=5.0, observer=None):
+    """连接池使用的连接函数：ConnectionPool({'path': ...}, connect=connect_sqlite)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    return SQLiteConnection(path, busy_timeout, observer)
+
+
+def timed_cursor_class(observer):
+    """返回每条语句执行后调用 observer(sql, 秒数) 的 PyMySQL 游标类
+
+    只覆盖 execute：PyMySQL 的 executemany 内部也是调用 execute（批量 INSERT 合并为一条或几条语句）。
+    """
+
+    class TimedCursor(pymysql.cursors.Cursor):
+        def execute(self, query, args=None):
+            start = time.perf_counter()
+            try:
+                return super().execute(query, args)
+            finally:
+                observer(query, time.perf_counter() - start)
+
+    return TimedCursor
+
+
+def _values(columns, rows):
+    """多行插入的 (列) VALUES (...), (...) 子句和展开后的参数"""
+    row_placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    clause = f"({', '.join(columns)}) VALUES {', '.join([row_placeholder] * len(rows))}"
+    return clause, [value for row in rows for value in row]
+
+
+class MySQLDialect:
+    name = 'mysql'
+
+    def ensure_index(self, cursor, table, index_name, columns, unique=False):
+        """索引不存在时创建（CREATE TABLE IF NOT EXISTS 不会给旧表加新索引），返回是否新建"""
+        cursor.execute('''
+            SELECT COUNT(*) FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        ''', (table, index_name))
+        if cursor.fetchone()[0] > 0:
+            return False
+        cursor.execute(f"ALTER TABLE {table} ADD {'UNIQUE ' if unique else ''}INDEX {index_name} {columns}")
+        return True
+
+    def ensure_column(self, cursor, table, column, definition):
+        """列不存在时添加（CREATE TABLE IF NOT EXISTS 不会给旧表加新列），返回是否新建"""
+        cursor.execute('''
+            SELECT COUNT(*) FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        ''', (table, column))
+        if cursor.fetchone()[0] > 0:
+            return False
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
+
+    def insert_ignore(self, cursor, table, columns, rows):
+        """多行插入，主键/唯一键已存在的行跳过，返回实际插入的行数"""
+        clause, params = _values(columns, rows)
+        cursor.execute(f'INSERT IGNORE INTO {table} {clause}', params)
+        return cursor.rowcount
+
+    def upsert_add(self, cursor, table, keys, columns, rows):
+        """多行插入（每行为 keys + columns 的值），主键/唯一键冲突时把 columns 的值累加到已有行上"""
+        clause, params = _values(tuple(keys) + tuple(columns), rows)
+        updates = ', '.join(f'{column} = {column} + VALUES({column})' for column in columns)
+        cursor.execute(f'INSERT INTO {table} {clause} ON DUPLICATE KEY UPDATE {updates}', params)
+
+    def upsert_created(self, cursor, table, keys, counter, values):
+        """计数类的 upsert（插入时 counter 为 1，冲突时加一），返回是否插入了新行"""
+        clause, params = _values(tuple(keys) + (counter,), [tuple(values) + (1,)])
+        # ON DUPLICATE KEY UPDATE 的影响行数：1 = 新插入，2 = 已存在并更新
+        cursor.execute(f'INSERT INTO {table} {clause} ON DUPLICATE KEY UPDATE {counter} = {counter} + 1', params)
+        return cursor.rowcount == 1
+
+    def update_first(self, cursor, table, assignments, where, order_by, params):
+        """只更新按 order_by 排序后第一条满足 where 的行，返回影响行数"""
+        cursor.execute(f'UPDATE {table} SET {assignments} WHERE {where} ORDER BY {order_by} LIMIT 1', params)
+        return cursor.rowcount
+
+
+class SQLiteDialect:
+    name = 'sqlite'
+
+    def ensure_index(self, cursor, table, index_name, columns, unique=False):
+        name = sqlite_index_name(table, index_name)
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = %s", (name,))
+        if cursor.fetchone()[0] > 0:
+            return False
+        cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} {columns}")
+        return True
+
+    def ensure_column(self, cursor, table, column, definition):
+        cursor.execute(f'PRAGMA table_info({table})')
+        if any(row[1] == column for row in cursor.fetchall()):
+            return False
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
+
+    def insert_ignore(self, cursor, table, columns, rows):
+        clause, params = _values(columns, rows)
+        cursor.execute(f'INSERT OR IGNORE INTO {table} {clause}', params)
+        return cursor.rowcount
+
+    def upsert_add(self, cursor, table, keys, columns, rows):
+        clause, params = _values(tuple(keys) + tuple(columns), rows)
+        updates = ', '.join(f'{column} = {column} + excluded.{column}' for column in columns)
+        cursor.execute(f"INSERT INTO {table} {clause} ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}",
+                       params)
+
+    def upsert_created(self, cursor, table, keys, counter, values):
+        clause, params = _values(tuple(keys) + (counter,), [tuple(values) + (1,)])
+        # SQLite 的 upsert 影响行数总是 1，根据更新后的计数判断
+        cursor.execute(f"INSERT INTO {table} {clause} ON CONFLICT ({', '.join(keys)}) "
+                       f"DO UPDATE SET {counter} = {counter} + 1 RETURNING {counter}", params)
+        return cursor.fetchone()[0] == 1
+
+    def update_first(self, cursor, table, assignments, where, order_by, params):
+        # 不依赖 SQLITE_ENABLE_UPDATE_DELETE_LIMIT 编译选项，按 rowid 子查询选出要更新的行
+        cursor.execute(f'UPDATE {table} SET {assignments} WHERE rowid IN '
+                       f'(SELECT rowid FROM {table} WHERE {where} ORDER BY {order_by} LIMIT 1)', params)
+        return cursor.rowcount
+
+
+MYSQL = MySQLDialect()
+SQLITE = SQLiteDialect()
+
+
+def dialect(cursor_or_connection):
+    """返回游标（或连接）所属后端的方言对象"""
+    if isinstance(cursor_or_connection, (SQLiteCursor, SQLiteConnection)):
+        return SQLITE
+    return MYSQL
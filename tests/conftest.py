@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+# 测试直接导入仓库根目录下的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """使用临时 SQLite 数据库导入 app（配置在导入时读取，整个测试会话共用一份）"""
+    pytest.importorskip('flask')
+    directory = tmp_path_factory.mktemp('app')
+    os.environ.update({
+        'DB_BACKEND': 'sqlite',
+        'SQLITE_PATH': str(directory / 'app.sqlite3'),
+        'METRICS_DIR': str(directory / 'metrics'),
+        'GEOIP_SHARED_CACHE': '',
+        'GEOIP_API_URL': 'http://127.0.0.1:9/{ip}',   # 测试中不访问外部接口
+        'GEOIP_BATCH_URL': 'http://127.0.0.1:9/batch',
+        'GEOIP_TIMEOUT': '0.2',
+        'EVENTS_POLL_INTERVAL': '0.05',
+        'EVENTS_BUFFER_SIZE': '5',
+        'EVENTS_STREAM_MAX_SECONDS': '5',
+        'EVENTS_HEARTBEAT': '0.2',
+        'EVENTS_LONG_POLL_TIMEOUT': '2',
+        'STATIC_DIST_DIR': str(directory / 'dist'),
+    })
+    import app
+    app.init_database()
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
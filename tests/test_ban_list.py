@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+import storage  # noqa: E402
+from ban_list import BanList  # noqa: E402
+from response_cache import CREATE_TABLE_SQL, DataVersions  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    conn = storage.connect_sqlite(str(tmp_path / 'bans.sqlite3'))
+    cursor = conn.cursor()
+    cursor.execute(CREATE_TABLE_SQL)
+    cursor.execute('''
+        CREATE TABLE ip_bans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, ip_address VARCHAR(45) NOT NULL UNIQUE, ban_reason VARCHAR(200),
+            banned_at TIMESTAMP, expires_at TIMESTAMP NOT NULL, is_permanent BOOLEAN DEFAULT FALSE
+        )
+    ''')
+
+    @contextmanager
+    def connection_factory():
+        yield conn
+
+    yield connection_factory, DataVersions(connection_factory), conn
+    conn.close()
+
+
+def _ban(conn, ip_address, expires_at, is_permanent=False):
+    conn.cursor().execute('''
+        INSERT INTO ip_bans (ip_address, ban_reason, banned_at, expires_at, is_permanent)
+        VALUES (%s, %s, %s, %s, %s)
+    ''', (ip_address, f'封禁 {ip_address}', datetime.now(), expires_at, is_permanent))
+
+
+def test_reload_when_version_changes(db):
+    connection_factory, data_versions, conn = db
+    ban_list = BanList(connection_factory, data_versions, refresh_interval=3600)
+    assert ban_list.get('192.0.2.1') is None
+
+    # 其它 worker 写库并递增版本号后，下一次轮询重新加载
+    _ban(conn, '192.0.2.1', datetime.now() + timedelta(hours=1))
+    assert ban_list.refresh() is False
+    assert ban_list.get('192.0.2.1') is None
+    data_versions.bump(conn.cursor(), BanList.VERSION_NAME)
+    assert ban_list.refresh() is True
+    assert ban_list.get('192.0.2.1')['reason'] == '封禁 192.0.2.1'
+    assert ban_list.refresh() is False
+
+
+def test_full_reload_picks_up_unversioned_changes(db):
+    connection_factory, data_versions, conn = db
+    ban_list = BanList(connection_factory, data_versions, refresh_interval=3600, full_reload_interval=0)
+    ban_list.load()
+    _ban(conn, '192.0.2.2', datetime.now(), is_permanent=True)
+    assert ban_list.refresh() is True
+    assert ban_list.get('192.0.2.2')['is_permanent'] is True
+
+
+def test_expired_bans_are_not_loaded(db):
+    connection_factory, data_versions, conn = db
+    _ban(conn, '192.0.2.3', datetime.now() - timedelta(minutes=1))
+    _ban(conn, '198.51.100.0/24', datetime.now() + timedelta(hours=1))
+    ban_list = BanList(connection_factory, data_versions, refresh_interval=3600)
+    ban_list.load()
+    assert ban_list.get('192.0.2.3') is None
+    assert ban_list.get('198.51.100.200')['reason'] == '封禁 198.51.100.0/24'
+    assert ban_list.stats()['entries'] == 1
+
+
+def test_failed_first_load_lets_requests_through(db):
+    _, data_versions, _ = db
+
+    @contextmanager
+    def broken():
+        raise RuntimeError('数据库不可用')
+        yield
+
+    ban_list = BanList(broken, data_versions, refresh_interval=3600)
+    assert ban_list.get('192.0.2.1') is None
+    assert ban_list.stats()['errors'] == 1
+    # 不在每个请求上重试
+    assert ban_list.get('192.0.2.1') is None
+    assert ban_list.stats()['errors'] == 1
@@ -0,0 +1,94 @@
+import json
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+import storage  # noqa: E402
+from change_feed import CREATE_TABLE_SQL, ChangeFeed  # noqa: E402
+
+
+class _Versions:
+    """每次调用 bump() 后版本号加一"""
+
+    def __init__(self):
+        self.version = 0
+
+    def bump(self):
+        self.version += 1
+
+    def current(self, names):
+        return {name: self.version for name in names}
+
+
+def _make_feed(tmp_path, gap_timeout=10.0):
+    conn = storage.connect_sqlite(str(tmp_path / 'events.sqlite3'))
+    conn.cursor().execute(CREATE_TABLE_SQL)
+    versions = _Versions()
+
+    @contextmanager
+    def connection_factory():
+        yield conn
+
+    feed = ChangeFeed(connection_factory, versions, lambda: {}, gap_timeout=gap_timeout)
+    feed.poll()  # 初始同步
+
+    def commit(event_id):
+        # 模拟事务提交：事件在此刻才对读取方可见
+        conn.cursor().execute('INSERT INTO change_events (id, event_type, payload) VALUES (%s, %s, %s)',
+                              (event_id, 'message.created', json.dumps({'id': event_id})))
+        versions.bump()
+
+    return feed, commit
+
+
+def _ids(events):
+    return [event['id'] for event in events]
+
+
+def _after(feed, seq):
+    """缓冲区中序号大于 seq 的事件（不调用 wait()，避免启动与测试并发轮询的后台线程）"""
+    return feed._seq, [event for event in feed._events if event['seq'] > seq]
+
+
+def test_id_committed_out_of_order_is_delivered(tmp_path):
+    feed, commit = _make_feed(tmp_path)
+    seq = 0
+
+    commit(2)
+    feed.poll()
+    seq, events = _after(feed, seq)
+    assert _ids(events) == [2]
+
+    commit(1)
+    feed.poll()
+    seq, events = _after(feed, seq)
+    assert _ids(events) == [1]
+
+    # 后续轮询不会重复推送
+    commit(3)
+    feed.poll()
+    feed.poll()
+    _, events = _after(feed, seq)
+    assert _ids(events) == [3]
+    assert _ids(feed._events) == [2, 1, 3]
+
+    # 客户端最后收到的是 2 时，重连后补发较晚提交的 1
+    _, replay, resync = feed.subscribe(last_event_id=2)
+    assert not resync
+    assert _ids(replay) == [1, 3]
+
+
+def test_gap_expires(tmp_path):
+    feed, commit = _make_feed(tmp_path, gap_timeout=0)
+    commit(2)
+    feed.poll()
+    assert feed._gaps == {1: feed._gaps[1]}
+
+    # 超过 gap_timeout 后不再等待（对应已回滚的事务）
+    feed.poll()
+    assert feed._gaps == {}
+    commit(1)
+    feed.poll()
+    assert _ids(feed._events) == [2]
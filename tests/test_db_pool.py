@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+import storage  # noqa: E402
+from db_pool import ConnectionPool, PoolTimeout  # noqa: E402
+
+
+def _make_pool(tmp_path, **kwargs):
+    return ConnectionPool({'path': str(tmp_path / 'pool.sqlite3')}, connect=storage.connect_sqlite, **kwargs)
+
+
+def test_connection_is_reused(tmp_path):
+    pool = _make_pool(tmp_path)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    stats = pool.stats()
+    assert (stats['created'], stats['checkouts'], stats['size'], stats['in_use'], stats['idle']) == (1, 2, 1, 0, 1)
+    pool.close_all()
+
+
+def test_acquire_times_out_when_pool_is_full(tmp_path):
+    pool = _make_pool(tmp_path, max_size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    stats = pool.stats()
+    assert (stats['waits'], stats['timeouts'], stats['in_use']) == (1, 1, 1)
+    pool.release(conn)
+    pool.close_all()
+
+
+def test_waiter_gets_released_connection(tmp_path):
+    pool = _make_pool(tmp_path, max_size=1, timeout=5)
+    conn = pool.acquire()
+    acquired = []
+
+    def borrow():
+        with pool.connection() as other:
+            acquired.append(other)
+
+    thread = threading.Thread(target=borrow)
+    thread.start()
+    time.sleep(0.1)
+    assert acquired == []
+    pool.release(conn)
+    thread.join(5)
+    assert acquired == [conn]
+    assert pool.stats()['waits'] == 1
+    pool.close_all()
+
+
+def test_failed_ping_reconnects(tmp_path):
+    pool = _make_pool(tmp_path, ping_interval=0)
+    with pool.connection() as conn:
+        pass
+    # 连接在池外被关闭，借出前的 ping 会失败
+    conn._conn.close()
+    with pool.connection() as fresh:
+        assert fresh is not conn
+        fresh.ping()
+    stats = pool.stats()
+    assert (stats['ping_failures'], stats['created'], stats['size']) == (1, 2, 1)
+    pool.close_all()
+
+
+def test_idle_connections_are_evicted(tmp_path):
+    pool = _make_pool(tmp_path, idle_timeout=0)
+    with pool.connection() as conn:
+        pass
+    time.sleep(0.01)
+    with pool.connection() as fresh:
+        assert fresh is not conn
+    assert conn.open is False
+    stats = pool.stats()
+    assert (stats['evicted'], stats['created'], stats['size']) == (1, 2, 1)
+    pool.close_all()
+
+
+def test_exception_rolls_back_and_returns_connection(tmp_path):
+    pool = _make_pool(tmp_path)
+    with pool.connection() as conn:
+        conn.cursor().execute('CREATE TABLE items (name TEXT)')
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.begin()
+            conn.cursor().execute('INSERT INTO items (name) VALUES (%s)', ('a',))
+            raise RuntimeError('失败')
+    with pool.connection() as same:
+        assert same is conn
+        cursor = same.cursor()
+        cursor.execute('SELECT COUNT(*) FROM items')
+        assert cursor.fetchone()[0] == 0
+    assert pool.stats()['in_use'] == 0
+    pool.close_all()
@@ -0,0 +1,145 @@
+import json
+import time
+
+import pytest
+
+THREADED = {'wsgi.multithread': True}
+
+
+@pytest.fixture
+def feed(app_module):
+    # 等后台线程完成首次同步，之后的订阅都能按 id 补发
+    app_module.event_feed.subscribe(timeout=5)
+    return app_module.event_feed
+
+
+def _post_message(client, text):
+    response = client.post('/api/messages', json={'name': '事件测试', 'message': text})
+    assert response.status_code == 200
+    return response.get_json()['id']
+
+
+def _event_ids(client, count, after):
+    """用长轮询取 after 之后的 count 个 message.created 事件的 id"""
+    ids = []
+    deadline = time.monotonic() + 5
+    while len(ids) < count and time.monotonic() < deadline:
+        data = client.get(f'/api/events/poll?channels=messages&after={after}',
+                          environ_overrides=THREADED).get_json()
+        ids.extend(event['id'] for event in data['events'] if event['type'] == 'message.created')
+        after = data['last_id']
+    assert len(ids) == count
+    return ids
+
+
+def _frames(response):
+    """把 SSE 响应体解析为 {'id', 'event', 'data'} 字典（注释行和 retry 跳过）"""
+    for chunk in response.response:
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        frame = {}
+        for line in chunk.strip().split('\n'):
+            field, _, value = line.partition(': ')
+            if field in ('id', 'event'):
+                frame[field] = value
+            elif field == 'data':
+                frame['data'] = json.loads(value)
+        if 'event' in frame:
+            yield frame
+
+
+def _read_until(response, event_type):
+    frames = []
+    for frame in _frames(response):
+        frames.append(frame)
+        if frame['event'] == event_type:
+            return frames
+    raise AssertionError(f'SSE 连接结束时没有收到 {event_type}: {frames}')
+
+
+def test_push_disabled_for_single_threaded_workers(client):
+    assert client.get('/api/events').status_code == 503
+    response = client.get('/api/events/poll')
+    assert response.status_code == 503
+    assert response.get_json()['push'] is False
+
+
+def test_sse_delivers_new_message(client, feed):
+    response = client.get('/api/events?channels=messages', environ_overrides=THREADED, buffered=False)
+    try:
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        message_id = _post_message(client, 'SSE 新留言')
+        frames = _read_until(response, 'message.created')
+    finally:
+        response.close()
+    event = frames[-1]
+    assert event['data']['id'] == message_id
+    assert event['data']['message'] == 'SSE 新留言'
+    assert int(event['id']) > 0
+
+
+def test_sse_replays_after_last_event_id(client, feed):
+    after = feed.last_id()
+    first, second = (_post_message(client, f'补发 {i}') for i in range(2))
+    first_event, _ = _event_ids(client, 2, after)
+
+    response = client.get('/api/events?channels=messages', environ_overrides=THREADED, buffered=False,
+                          headers={'Last-Event-ID': str(first_event)})
+    try:
+        frames = _read_until(response, 'message.created')
+    finally:
+        response.close()
+    assert [frame['data']['id'] for frame in frames if frame['event'] == 'message.created'] == [second]
+
+
+def test_sse_resync_when_events_left_the_buffer(client, feed):
+    after = feed.last_id()
+    for i in range(feed.buffer_size + 1):
+        _post_message(client, f'溢出 {i}')
+    deadline = time.monotonic() + 5
+    while feed.last_id() < after + feed.buffer_size + 1 and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    # after 之后的第一个事件已经被挤出缓冲区
+    response = client.get('/api/events?channels=messages', environ_overrides=THREADED, buffered=False,
+                          headers={'Last-Event-ID': str(after)})
+    try:
+        frames = _read_until(response, 'resync')
+    finally:
+        response.close()
+    assert frames[0]['event'] == 'resync'
+
+
+def test_long_poll(client, feed):
+    first = client.get('/api/events/poll?channels=messages,stats', environ_overrides=THREADED).get_json()
+    assert first['resync'] is False
+    assert first['last_id'] == feed.last_id()
+
+    message_id = _post_message(client, '长轮询')
+    data = client.get(f"/api/events/poll?channels=messages&after={first['last_id']}",
+                      environ_overrides=THREADED).get_json()
+    assert [event['data']['id'] for event in data['events']] == [message_id]
+    last_id = data['events'][0]['id']
+    assert data['last_id'] == last_id
+
+    # 没有新事件时等到超时，last_id 不变
+    data = client.get(f'/api/events/poll?channels=messages&after={last_id}', environ_overrides=THREADED).get_json()
+    assert data['events'] == []
+    assert data['last_id'] == last_id
+
+
+def test_permanent_ban_publishes_once(client, feed):
+    after = feed.last_id()
+    response = client.post('/api/security/banned-ips', json={'ip_address': '192.0.2.77', 'is_permanent': True})
+    assert response.status_code == 200
+    try:
+        data = client.get(f'/api/events/poll?channels=bans&after={after}', environ_overrides=THREADED).get_json()
+        # 长轮询在第一批事件到达时返回，再等一次确认没有重复的事件
+        events = data['events']
+        data = client.get(f"/api/events/poll?channels=bans&after={data['last_id']}",
+                          environ_overrides=THREADED).get_json()
+        events += data['events']
+    finally:
+        client.delete('/api/security/banned-ips/192.0.2.77')
+    assert [event['type'] for event in events] == ['ban.added']
+    assert events[0]['data']['is_permanent'] is True
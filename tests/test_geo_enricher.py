@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+import storage  # noqa: E402
+from geo_enricher import GeoEnricher  # noqa: E402
+
+LOCATIONS = {'8.8.8.8': {'country': '美国', 'region': '', 'city': '山景城', 'isp': ''}}
+
+
+class _Locator:
+    def __init__(self):
+        self.calls = []
+
+    def lookup_many(self, ip_addresses):
+        self.calls.append(list(ip_addresses))
+        return {ip: LOCATIONS.get(ip, {'country': '', 'region': '', 'city': '', 'isp': ''}) for ip in ip_addresses}
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = storage.connect_sqlite(str(tmp_path / 'activity.sqlite3'))
+    conn.cursor().execute('''
+        CREATE TABLE activity_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, ip_address TEXT, country TEXT, city TEXT, created_at DATETIME
+        )
+    ''')
+    yield conn
+    conn.close()
+
+
+def _enricher(conn, locator, **kwargs):
+    @contextmanager
+    def connection_factory():
+        yield conn
+
+    return GeoEnricher(connection_factory, locator, **kwargs)
+
+
+def _insert(conn, ip_address, created_at, country=None):
+    cursor = conn.cursor()
+    cursor.execute('INSERT INTO activity_logs (ip_address, country, created_at) VALUES (%s, %s, %s)',
+                   (ip_address, country, created_at))
+    return cursor.lastrowid
+
+
+def _locations(conn):
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, country, city FROM activity_logs ORDER BY id')
+    return cursor.fetchall()
+
+
+def test_enrich_resolves_each_ip_once(conn):
+    now = datetime.now()
+    ids = [_insert(conn, ip, now) for ip in ('8.8.8.8', '8.8.8.8', '9.9.9.9')]
+    locator = _Locator()
+    enricher = _enricher(conn, locator)
+    assert enricher.enrich(list(zip(ids, ('8.8.8.8', '8.8.8.8', '9.9.9.9')))) == 3
+    assert locator.calls == [['8.8.8.8', '9.9.9.9']]
+    # 无法解析的记录回填为空字符串，不再是待补全状态
+    assert _locations(conn) == [(ids[0], '美国', '山景城'), (ids[1], '美国', '山景城'), (ids[2], '', '')]
+
+
+def test_enrich_does_not_overwrite_filled_rows(conn):
+    row_id = _insert(conn, '8.8.8.8', datetime.now(), country='日本')
+    assert _enricher(conn, _Locator()).enrich([(row_id, '8.8.8.8')]) == 0
+    assert _locations(conn) == [(row_id, '日本', None)]
+
+
+def test_sweep_only_picks_up_old_pending_rows(conn):
+    old = _insert(conn, '8.8.8.8', datetime.now() - timedelta(minutes=10))
+    recent = _insert(conn, '8.8.8.8', datetime.now())
+    enricher = _enricher(conn, _Locator(), sweep_min_age=60)
+    assert enricher.sweep() == 1
+    assert _locations(conn) == [(old, '美国', '山景城'), (recent, None, None)]
+    assert enricher.stats()['swept'] == 1
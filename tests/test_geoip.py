@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip('requests')
+
+from geoip import EMPTY_LOCATION, GeoLocator  # noqa: E402
+
+LOCATION = {'country': '美国', 'region': '加利福尼亚', 'city': '山景城', 'isp': 'Google'}
+
+
+class _Locator(GeoLocator):
+    """不访问外部接口，记录每次在线查询的IP"""
+
+    def __init__(self, results, **kwargs):
+        super().__init__(**kwargs)
+        self.results = results
+        self.fetched = []
+
+    def fetch(self, ip_address):
+        self.fetched.append(ip_address)
+        return self.results.get(ip_address)
+
+    def fetch_batch(self, ip_addresses):
+        self.fetched.extend(ip_addresses)
+        return {ip: self.results.get(ip) for ip in ip_addresses}
+
+
+def test_memory_cache_and_negative_cache():
+    locator = _Locator({'8.8.8.8': LOCATION})
+    assert locator.lookup('8.8.8.8') == LOCATION
+    assert locator.lookup('8.8.8.8') == LOCATION
+    # 查询失败的结果同样缓存，不会反复请求
+    assert locator.lookup('1.1.1.1') == EMPTY_LOCATION
+    assert locator.lookup('1.1.1.1') == EMPTY_LOCATION
+    assert locator.fetched == ['8.8.8.8', '1.1.1.1']
+    stats = locator.stats()
+    assert (stats['memory_hits'], stats['negative_hits']) == (2, 1)
+
+
+def test_private_addresses_are_not_fetched():
+    locator = _Locator({})
+    assert locator.lookup('127.0.0.1') == EMPTY_LOCATION
+    assert locator.lookup('10.1.2.3') == EMPTY_LOCATION
+    assert locator.fetched == []
+
+
+def test_shared_cache_between_workers(tmp_path):
+    path = str(tmp_path / 'geo_cache.sqlite3')
+    first = _Locator({'8.8.8.8': LOCATION}, shared_cache_path=path)
+    second = _Locator({}, shared_cache_path=path)
+    assert first.lookup('8.8.8.8') == LOCATION
+    # 另一个 worker 从磁盘缓存读到结果，不再请求在线接口
+    assert second.lookup('8.8.8.8') == LOCATION
+    assert second.fetched == []
+    assert second.stats()['shared_hits'] == 1
+
+
+def test_expired_entries_are_fetched_again():
+    locator = _Locator({'8.8.8.8': LOCATION}, ttl=0)
+    locator.lookup('8.8.8.8')
+    locator.lookup('8.8.8.8')
+    assert locator.fetched == ['8.8.8.8', '8.8.8.8']
+
+
+def test_lookup_many_batches_cache_misses():
+    locator = _Locator({'8.8.8.8': LOCATION, '1.1.1.1': LOCATION})
+    locator.lookup('8.8.8.8')
+    results = locator.lookup_many(['8.8.8.8', '1.1.1.1', '9.9.9.9', '192.168.0.1', '1.1.1.1'])
+    assert results == {'8.8.8.8': LOCATION, '1.1.1.1': LOCATION, '9.9.9.9': EMPTY_LOCATION,
+                       '192.168.0.1': EMPTY_LOCATION}
+    assert locator.fetched == ['8.8.8.8', '1.1.1.1', '9.9.9.9']
@@ -0,0 +1,97 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from ban_list import BanList
+from ip_policy import ALLOW, DENY, IPPolicy
+
+
+def test_longest_prefix_wins():
+    policy = IPPolicy()
+    policy.deny('203.0.113.0/24', 'net')
+    policy.allow('203.0.113.7', 'host')
+    assert policy.check('203.0.113.7') == (ALLOW, 'host')
+    assert policy.check('203.0.113.8') == (DENY, 'net')
+    assert policy.check('198.51.100.1') == (None, None)
+
+
+def test_rejected_entry_falls_back_to_shorter_prefix():
+    policy = IPPolicy()
+    policy.deny('203.0.113.0/24', 'net')
+    policy.deny('203.0.113.7', 'host')
+    assert policy.check('203.0.113.7', lambda action, data: data != 'host') == (DENY, 'net')
+    assert policy.check('203.0.113.7', lambda action, data: False) == (None, None)
+
+
+class _Versions:
+    def current(self, names):
+        return {name: 0 for name in names}
+
+
+class _Connection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_expired_host_ban_inside_active_network_ban():
+    now = datetime(2026, 1, 1, 12, 0, 0)
+    rows = [
+        ('203.0.113.0/24', 'network', now - timedelta(hours=1), now + timedelta(hours=1), False),
+        ('203.0.113.7', 'host', now - timedelta(hours=2), now - timedelta(minutes=1), False),
+    ]
+
+    @contextmanager
+    def connection():
+        yield _Connection(rows)
+
+    ban_list = BanList(connection, _Versions(), refresh_interval=3600)
+    ban_list.load()
+    entry = ban_list.get('203.0.113.7', now=now)
+    assert entry is not None and entry['reason'] == 'network'
+    assert ban_list.get('198.51.100.1', now=now) is None
+
+
+def test_expired_host_ban_added_in_worker():
+    now = datetime(2026, 1, 1, 12, 0, 0)
+
+    @contextmanager
+    def connection():
+        yield _Connection([])
+
+    ban_list = BanList(connection, _Versions(), refresh_interval=3600)
+    ban_list.load()
+    ban_list.add('203.0.113.0/24', 'network', now + timedelta(hours=1))
+    ban_list.add('203.0.113.7', 'host', now - timedelta(seconds=1))
+    assert ban_list.get('203.0.113.7', now=now)['reason'] == 'network'
+
+
+def test_whitelisted_host_inside_banned_network():
+    now = datetime(2026, 1, 1, 12, 0, 0)
+    rows = [('203.0.113.0/24', 'network', now - timedelta(hours=1), now + timedelta(hours=1), False)]
+
+    @contextmanager
+    def connection():
+        yield _Connection(rows)
+
+    ban_list = BanList(connection, _Versions(), refresh_interval=3600, allow=['203.0.113.7', '198.51.100.0/24'])
+    ban_list.load()
+    assert ban_list.check('203.0.113.7', now=now) == (ALLOW, None)
+    assert ban_list.get('203.0.113.7', now=now) is None
+    assert ban_list.check('203.0.113.8', now=now)[0] == DENY
+
+    # 白名单网段内单独封禁的地址被拒绝；解封后恢复白名单
+    ban_list.add('198.51.100.9', 'host', now + timedelta(hours=1))
+    assert ban_list.check('198.51.100.9', now=now)[0] == DENY
+    assert ban_list.check('198.51.100.10', now=now) == (ALLOW, None)
+    ban_list.add('198.51.100.0/24', 'network', now + timedelta(hours=1))
+    assert ban_list.check('198.51.100.10', now=now)[0] == DENY
+    ban_list.remove('198.51.100.0/24')
+    assert ban_list.check('198.51.100.10', now=now) == (ALLOW, None)
@@ -0,0 +1,57 @@
+import pytest
+
+from ip_range_db import IPRangeDB, build_database
+
+CSV = '''start,end,country,region,city
+# 注释行
+1.0.0.0,1.0.0.255,澳大利亚,昆士兰,布里斯班
+16777472,16777727,中国,福建,福州
+8.8.8.0/24,美国,加利福尼亚,山景城
+8.8.8.128/25,重叠,网段,跳过
+2001:db8::/32,文档,地址,IPv6
+9.9.9.9,9.9.9.1,反向,网段,跳过
+'''
+
+
+def _build(tmp_path):
+    csv_path = tmp_path / 'ranges.csv'
+    csv_path.write_text(CSV, encoding='utf-8')
+    output = str(tmp_path / 'geoip.bin')
+    return build_database(str(csv_path), output), IPRangeDB(output)
+
+
+def test_build_skips_header_overlaps_and_reversed_ranges(tmp_path):
+    (written, skipped), db = _build(tmp_path)
+    try:
+        assert (written, skipped) == (4, 3)
+        assert db.count == 4
+    finally:
+        db.close()
+
+
+def test_lookup(tmp_path):
+    _, db = _build(tmp_path)
+    try:
+        assert db.lookup('1.0.0.1') == {'country': '澳大利亚', 'region': '昆士兰', 'city': '布里斯班', 'isp': ''}
+        assert db.lookup('1.0.1.0')['city'] == '福州'        # 整数形式的地址段
+        assert db.lookup('1.0.0.255')['city'] == '布里斯班'  # 段的结束地址
+        assert db.lookup('8.8.8.200')['city'] == '山景城'    # 重叠的网段保留起始地址更小的
+        assert db.lookup('2001:db8::1')['city'] == 'IPv6'
+        assert db.lookup('1.0.2.0') is None                  # 两段之间
+        assert db.lookup('0.0.0.1') is None                  # 第一段之前
+        assert db.lookup('not an ip') is None
+    finally:
+        db.close()
+
+
+def test_offline_mode_in_geo_locator(tmp_path):
+    pytest.importorskip('requests')
+    from geoip import EMPTY_LOCATION, GeoLocator
+
+    _build(tmp_path)[1].close()
+    locator = GeoLocator(mode='offline', offline_db_path=str(tmp_path / 'geoip.bin'), api_url='http://127.0.0.1:9/{ip}')
+    assert locator.lookup('1.0.0.1')['country'] == '澳大利亚'
+    # 只用离线库时，未命中的地址返回空结果，不请求在线接口
+    assert locator.lookup('9.9.9.9') == EMPTY_LOCATION
+    stats = locator.stats()
+    assert (stats['offline_hits'], stats['offline_misses'], stats['api_calls']) == (1, 1, 0)
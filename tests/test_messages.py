@@ -0,0 +1,74 @@
+def _post(client, count, prefix='分页'):
+    ids = []
+    for i in range(count):
+        response = client.post('/api/messages', json={'name': f'{prefix}{i}', 'message': f'{prefix} {i}'})
+        assert response.status_code == 200
+        ids.append(response.get_json()['id'])
+    return ids
+
+
+def _ids(data):
+    return [message['id'] for message in data['messages']]
+
+
+def test_since_id_pages_forward(client):
+    ids = _post(client, 5)
+    data = client.get(f'/api/messages?since_id={ids[0] - 1}&limit=2').get_json()
+    # 每页仍然按新到旧排列，latest_id 为本页最新的一条
+    assert _ids(data) == [ids[1], ids[0]]
+    assert data['has_more'] is True
+    assert data['latest_id'] == ids[1]
+
+    data = client.get(f"/api/messages?since_id={data['latest_id']}&limit=10").get_json()
+    assert _ids(data) == [ids[4], ids[3], ids[2]]
+    assert data['has_more'] is False
+
+    # 没有新留言时 latest_id 保持不变
+    data = client.get(f'/api/messages?since_id={ids[4]}').get_json()
+    assert data['messages'] == [] and data['latest_id'] == ids[4]
+
+
+def test_before_id_pages_backward(client):
+    ids = _post(client, 4)
+    data = client.get(f'/api/messages?before_id={ids[3]}&limit=2').get_json()
+    assert _ids(data) == [ids[2], ids[1]]
+    assert data['has_more'] is True
+    assert data['next_before_id'] == ids[1]
+
+    first_page = client.get('/api/messages?limit=1').get_json()
+    assert _ids(first_page) == [ids[3]]
+
+
+def test_unpaginated_request_returns_full_list(client):
+    ids = _post(client, 2)
+    data = client.get('/api/messages').get_json()
+    assert isinstance(data, list)
+    assert [message['id'] for message in data[:2]] == [ids[1], ids[0]]
+
+
+def test_invalid_paging_parameters(client):
+    assert client.get('/api/messages?limit=abc').status_code == 400
+    assert client.get('/api/messages?since_id=-1').status_code == 400
+
+
+def test_delete_by_id(client):
+    ids = _post(client, 2, prefix='删除')
+    total = client.get('/api/stats').get_json()['totalMessages']
+    assert client.delete(f'/api/messages/{ids[0]}').status_code == 200
+    assert client.delete(f'/api/messages/{ids[0]}').status_code == 404
+    remaining = [message['id'] for message in client.get('/api/messages').get_json()]
+    assert ids[0] not in remaining and ids[1] in remaining
+    assert client.get('/api/stats').get_json()['totalMessages'] == total - 1
+
+
+def test_bulk_delete(client):
+    ids = _post(client, 3, prefix='批量')
+    missing = ids[-1] + 1000
+    data = client.post('/api/messages/bulk-delete', json={'ids': [ids[0], ids[2], ids[0], missing]}).get_json()
+    assert data['deleted'] == [ids[0], ids[2]]
+    assert data['not_found'] == [missing]
+    remaining = [message['id'] for message in client.get('/api/messages').get_json()]
+    assert ids[1] in remaining and ids[0] not in remaining and ids[2] not in remaining
+
+    assert client.post('/api/messages/bulk-delete', json={'ids': []}).status_code == 400
+    assert client.post('/api/messages/bulk-delete', json={'ids': ['x']}).status_code == 400
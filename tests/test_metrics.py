@@ -0,0 +1,92 @@
+import multiprocessing
+
+import pytest
+
+import metrics
+
+
+def _registry(tmp_path):
+    registry = metrics.Registry(str(tmp_path / 'metrics'), prefix='test_')
+    requests = registry.counter('requests_total', '请求数', ('route',))
+    latency = registry.histogram('latency_seconds', '耗时', ('route',), buckets=(0.1, 1.0))
+    return registry, requests, latency
+
+
+def _run_worker(registry, requests, latency, retire):
+    """在 fork 出的子进程中计数后写快照（或退出归档）"""
+    def work():
+        requests.inc('/')
+        requests.inc('/api', amount=2)
+        latency.observe(0.05, '/')
+        latency.observe(5.0, '/')
+        if retire:
+            registry.retire()
+        else:
+            registry.flush()
+
+    worker = multiprocessing.get_context('fork').Process(target=work)
+    worker.start()
+    worker.join(10)
+    assert worker.exitcode == 0
+
+
+@pytest.fixture
+def fork():
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip('需要 fork')
+
+
+def test_collect_sums_worker_snapshots(tmp_path, fork):
+    registry, requests, latency = _registry(tmp_path)
+    _run_worker(registry, requests, latency, retire=False)
+    _run_worker(registry, requests, latency, retire=False)
+    requests.inc('/')  # 本进程使用实时值
+
+    text = registry.render()
+    assert 'test_requests_total{route="/"} 3' in text
+    assert 'test_requests_total{route="/api"} 4' in text
+    assert 'test_latency_seconds_bucket{route="/",le="0.1"} 2' in text
+    assert 'test_latency_seconds_bucket{route="/",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{route="/",le="+Inf"} 4' in text
+    assert 'test_latency_seconds_count{route="/"} 4' in text
+    assert 'test_latency_seconds_sum{route="/"} 10.1' in text
+
+
+def test_retired_workers_are_archived(tmp_path, fork):
+    registry, requests, latency = _registry(tmp_path)
+    _run_worker(registry, requests, latency, retire=True)
+    _run_worker(registry, requests, latency, retire=True)
+    # 退出的 worker 不留下快照文件，计数并入归档
+    assert sorted(path.name for path in (tmp_path / 'metrics').glob('*.json')) == [metrics.ARCHIVE_FILE]
+    merged = registry.collect()
+    assert merged.counters['test_requests_total'] == {('/',): 2, ('/api',): 4}
+    assert merged.histograms['test_latency_seconds'][('/',)] == [[2, 0, 2], 10.1]
+
+    registry.clear()
+    assert registry.collect().counters == {}
+
+
+def test_collectors_are_exported(tmp_path):
+    registry, _, _ = _registry(tmp_path)
+    registry.register_collector('cache_total', '缓存', ('result',), lambda: {('hit',): 7, ('miss',): 1})
+    text = registry.render()
+    assert '# TYPE test_cache_total counter' in text
+    assert 'test_cache_total{result="hit"} 7' in text
+
+
+def test_metrics_ignores_forwarded_for(client):
+    assert client.get('/metrics').status_code == 200
+    # 伪造的 X-Forwarded-For 不能绕过对端地址检查
+    response = client.get('/metrics', headers={'X-Forwarded-For': '127.0.0.1'},
+                          environ_overrides={'REMOTE_ADDR': '198.51.100.20'})
+    assert response.status_code == 403
+
+
+def test_metrics_token(app_module, client, monkeypatch):
+    monkeypatch.setitem(app_module.METRICS_ACCESS, 'TOKEN', 'secret')
+    remote = {'REMOTE_ADDR': '198.51.100.20'}
+    assert client.get('/metrics', environ_overrides=remote,
+                      headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    response = client.get('/metrics', environ_overrides=remote, headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert 'birthday_board_http_requests_total' in response.get_data(as_text=True)
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+jinja2 = pytest.importorskip('jinja2')
+
+from page_templates import PageTemplates  # noqa: E402
+
+
+def _write(path, text, mtime):
+    path.write_text(text, encoding='utf-8')
+    os.utime(path, (mtime, mtime))
+
+
+def test_template_is_compiled_once_and_transformed(tmp_path):
+    _write(tmp_path / 'page.html', '<p>{{ 1 + 1 }} style.css</p>', 1000)
+    pages = PageTemplates(jinja2.Environment(), str(tmp_path),
+                          transform=lambda source: source.replace('style.css', 'style.abc123.css'))
+    assert pages.template('page.html').render() == '<p>2 style.abc123.css</p>'
+    assert pages.template('page.html') is pages.template('page.html')
+    built = []
+    assert pages.derived('page.html', 'upper', lambda source: built.append(1) or source.upper()).startswith('<P>')
+    pages.derived('page.html', 'upper', lambda source: built.append(1) or source.upper())
+    assert built == [1]
+    assert pages.stats()['loads'] == 1 and pages.stats()['compiles'] == 1
+
+
+def test_auto_reload_on_change(tmp_path):
+    path = tmp_path / 'page.html'
+    _write(path, 'v1', 1000)
+    cached = PageTemplates(jinja2.Environment(), str(tmp_path))
+    reloading = PageTemplates(jinja2.Environment(), str(tmp_path), auto_reload=True, check_interval=0)
+    assert cached.source('page.html') == reloading.source('page.html') == 'v1'
+    reloading.derived('page.html', 'key', lambda source: source + '!')
+
+    _write(path, 'v2', 2000)
+    assert cached.source('page.html') == 'v1'
+    assert reloading.template('page.html').render() == 'v2'
+    # 派生内容随源码一起失效
+    assert reloading.derived('page.html', 'key', lambda source: source + '!') == 'v2!'
+    assert reloading.stats()['reloads'] == 1
+
+
+def test_pages_and_ban_page(app_module, client):
+    compiles = app_module.page_templates.stats()['compiles']
+    for path in ('/', '/birthday', '/'):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/html'
+    assert app_module.page_templates.stats()['compiles'] <= compiles + 1
+
+    ip = '198.51.100.51'
+    assert client.post('/api/security/banned-ips', json={'ip_address': ip, 'reason': '测试封禁'}).status_code == 200
+    try:
+        response = client.get('/birthday', environ_overrides={'REMOTE_ADDR': ip})
+    finally:
+        client.delete(f'/api/security/banned-ips/{ip}')
+    assert response.status_code == 403
+    # 封禁详情从快照插入页面脚本
+    assert "'?reason=测试封禁&ban_time=" in response.get_data(as_text=True)
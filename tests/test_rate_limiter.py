@@ -0,0 +1,89 @@
+import multiprocessing
+
+import pytest
+
+from rate_limiter import SlidingWindowLimiter
+
+
+def _limiter(**kwargs):
+    kwargs.setdefault('sweep_interval', 0)  # 测试中不启动清理线程
+    return SlidingWindowLimiter(**kwargs)
+
+
+def test_limit_within_window():
+    limiter = _limiter(limit=3, window=10)
+    assert [limiter.hit('192.0.2.1', now=100.0) for _ in range(4)] == [(False, 1), (False, 2), (False, 3), (True, 4)]
+    # 各个 key 分别计数
+    assert limiter.hit('192.0.2.2', now=100.0) == (False, 1)
+
+
+def test_previous_window_is_weighted():
+    limiter = _limiter(limit=3, window=10)
+    for _ in range(4):
+        limiter.hit('192.0.2.1', now=100.0)
+    # 下一个窗口过了一半：上一窗口的 4 次按一半计入
+    assert limiter.peek('192.0.2.1', now=115.0) == 2
+    assert limiter.hit('192.0.2.1', now=115.0) == (False, 3)
+    # 两个窗口之后计数清零
+    assert limiter.peek('192.0.2.1', now=130.0) == 0
+
+
+def test_memory_is_bounded():
+    limiter = _limiter(limit=None, window=10, max_keys=4, ways=4)
+    for i in range(4):
+        limiter.hit(f'192.0.2.{i}', now=100.0 + i)
+    limiter.hit('192.0.2.9', now=105.0)
+    # 组内没有空位时淘汰最久未访问的槽位
+    assert limiter.active_keys() == 4
+    assert limiter.peek('192.0.2.0', now=105.0) == 0
+    assert limiter.peek('192.0.2.9', now=105.0) == 1
+    assert limiter.stats()['evicted'] == 1
+
+
+def test_sweep_and_reset():
+    limiter = _limiter(limit=None, window=10)
+    limiter.hit('192.0.2.1', now=100.0)
+    limiter.hit('192.0.2.2', now=125.0)
+    assert limiter.sweep(now=125.0) == 1
+    limiter.reset('192.0.2.2')
+    assert limiter.active_keys() == 0
+
+
+def test_counts_are_shared_with_forked_workers():
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip('需要 fork')
+    limiter = _limiter(limit=None, window=3600)
+    limiter.hit('192.0.2.1')
+    worker = multiprocessing.get_context('fork').Process(target=limiter.hit, args=('192.0.2.1',))
+    worker.start()
+    worker.join(10)
+    assert worker.exitcode == 0
+    assert limiter.peek('192.0.2.1') == 2
+
+
+def test_rate_limited_requests_get_429(app_module, client):
+    remote = {'REMOTE_ADDR': '198.51.100.31'}
+    limit = app_module.SECURITY_CONFIG['RATE_LIMIT_REQUESTS']
+    statuses = [client.get('/api/stats', environ_overrides=remote).status_code for _ in range(limit + 1)]
+    assert statuses == [200] * limit + [429]
+    # 白名单地址不限流
+    assert all(client.get('/api/stats').status_code == 200 for _ in range(limit + 1))
+
+
+def test_ban_issued_from_shared_counter(app_module, client, monkeypatch):
+    monkeypatch.setitem(app_module.SECURITY_CONFIG, 'BAN_THRESHOLD', 15)
+    ip = '198.51.100.41'
+    remote = {'REMOTE_ADDR': ip}
+    try:
+        statuses = [client.get('/api/stats', environ_overrides=remote).status_code for _ in range(15)]
+        # 超过限流后继续请求，达到封禁阈值的那次请求被封禁
+        assert statuses == [200] * 10 + [429] * 4 + [403]
+        assert app_module.ban_list.get(ip)['reason'].startswith('频繁访问')
+        assert app_module.ban_counter.peek(ip) == 0
+        response = client.get('/api/stats', environ_overrides=remote, headers={'Accept': 'application/json'})
+        assert response.status_code == 403
+        assert response.get_json()['reason'].startswith('频繁访问')
+    finally:
+        client.delete(f'/api/security/banned-ips/{ip}')
+        app_module.rate_limiter.reset(ip)
+    assert app_module.ban_list.get(ip) is None
@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+from contextlib import contextmanager
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+import red_packet_io  # noqa: E402
+import storage  # noqa: E402
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = storage.connect_sqlite(str(tmp_path / 'codes.sqlite3'))
+    conn.cursor().execute(red_packet_io.CREATE_TABLE_SQL)
+    yield conn
+    conn.close()
+
+
+def test_parse_and_validate():
+    items = red_packet_io.parse_csv('code,description,amount\nA1,一等奖,8.888\n\nA2\nA1,重复\n,缺少口令\nA3,,-1\n')
+    assert [item[0] for item in items] == [2, 4, 5, 6, 7]
+    rows, duplicates, errors = red_packet_io.validate(items)
+    assert rows == [('A1', '一等奖', Decimal('8.89')), ('A2', '', None)]
+    assert duplicates == 1
+    assert [error['line'] for error in errors] == [6, 7]
+
+    items = red_packet_io.parse_json({'codes': ['B1', {'code': 'B2', 'amount': '1.5'}]})
+    assert red_packet_io.validate(items)[0] == [('B1', '', None), ('B2', '', Decimal('1.50'))]
+    with pytest.raises(ValueError):
+        red_packet_io.parse_json('B1')
+
+
+def test_insert_skips_existing_and_export_streams_in_batches(conn):
+    cursor = conn.cursor()
+    rows = [(f'C{i:03d}', '导入', Decimal('1.00')) for i in range(7)]
+    assert red_packet_io.insert_codes(cursor, rows, chunk_size=3) == 7
+    assert red_packet_io.insert_codes(cursor, rows[:2] + [('C100', '', None)], chunk_size=3) == 1
+
+    @contextmanager
+    def connection_factory():
+        yield conn
+
+    exported = list(red_packet_io.iter_rows(connection_factory, batch_size=3))
+    assert [row[1] for row in exported] == [f'C{i:03d}' for i in range(7)] + ['C100']
+
+    lines = list(csv.reader(io.StringIO(''.join(red_packet_io.stream_csv(exported)).lstrip('\ufeff'))))
+    assert lines[0] == list(red_packet_io.EXPORT_COLUMNS)
+    assert len(lines) == 9
+    data = json.loads(''.join(red_packet_io.stream_json(exported)))
+    assert data[0]['code'] == 'C000' and data[0]['amount'] == 1.0 and data[0]['is_used'] is False
+    assert json.loads(''.join(red_packet_io.stream_json([]))) == []
+
+
+def test_import_export_endpoints(client):
+    response = client.post('/api/red-packets/import', data='code,description\nIO-1,接口导入\nIO-2\nIO-1\n',
+                           content_type='text/csv')
+    data = response.get_json()
+    assert (data['inserted'], data['duplicates'], data['existing'], data['invalid']) == (2, 1, 0, 0)
+
+    response = client.post('/api/red-packets/import', json=['IO-2', 'IO-3', ''])
+    data = response.get_json()
+    assert (data['inserted'], data['existing'], data['invalid']) == (1, 1, 1)
+
+    upload = {'file': (io.BytesIO('\ufeffIO-4,文件上传'.encode('utf-8')), 'codes.csv')}
+    assert client.post('/api/red-packets/import', data=upload).get_json()['inserted'] == 1
+    assert client.post('/api/red-packets/import', json={'codes': 'x'}).status_code == 400
+
+    exported = json.loads(client.get('/api/red-packets/export?format=json').get_data(as_text=True))
+    codes = {item['code'] for item in exported}
+    assert {'IO-1', 'IO-2', 'IO-3', 'IO-4'} <= codes
+    response = client.get('/api/red-packets/export')
+    assert response.headers['Content-Type'] == 'text/csv; charset=utf-8'
+    assert 'IO-4' in response.get_data(as_text=True)
+    assert client.get('/api/red-packets/export?format=xml').status_code == 400
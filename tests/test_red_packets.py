@@ -0,0 +1,101 @@
+import os
+import threading
+from collections import Counter
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+import red_packet_io  # noqa: E402
+import storage  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+
+CODES = 40
+IPS = 60
+THREADS = 16
+REQUESTS = 240
+
+# SQLite 的写事务是整库串行的，只能验证逻辑；行锁和唯一索引在并发下的行为需要 MySQL 验证。
+# 设置 TEST_MYSQL_HOST（以及 TEST_MYSQL_PORT/USER/PASSWORD/DATABASE）后同时在 MySQL 上运行，
+# 测试会删除并重建该库中的 red_packet_codes 表，请使用单独的测试库。
+MYSQL_TEST_CONFIG = {
+    'host': os.getenv('TEST_MYSQL_HOST', ''),
+    'port': int(os.getenv('TEST_MYSQL_PORT', 3306)),
+    'user': os.getenv('TEST_MYSQL_USER', 'root'),
+    'password': os.getenv('TEST_MYSQL_PASSWORD', ''),
+    'database': os.getenv('TEST_MYSQL_DATABASE', 'birthday_board_test'),
+    'charset': 'utf8mb4',
+    'autocommit': True,
+}
+
+
+def _sqlite_pool(tmp_path):
+    return ConnectionPool({'path': str(tmp_path / 'red_packets.sqlite3')}, connect=storage.connect_sqlite,
+                          max_size=THREADS, timeout=30)
+
+
+def _mysql_pool(tmp_path):
+    if not MYSQL_TEST_CONFIG['host']:
+        pytest.skip('未设置 TEST_MYSQL_HOST')
+    pool = ConnectionPool(MYSQL_TEST_CONFIG, max_size=THREADS, timeout=30)
+    with pool.connection() as conn:
+        conn.cursor().execute('DROP TABLE IF EXISTS red_packet_codes')
+    return pool
+
+
+@pytest.fixture(params=[_sqlite_pool, _mysql_pool], ids=['sqlite', 'mysql'])
+def pool(request, tmp_path):
+    pool = request.param(tmp_path)
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(red_packet_io.CREATE_TABLE_SQL)
+        cursor.executemany('INSERT INTO red_packet_codes (code, description) VALUES (%s, %s)',
+                           [(f'TEST-{i:04d}', '测试') for i in range(CODES)])
+    yield pool
+    pool.close_all()
+
+
+def test_concurrent_claims_allocate_each_code_once(pool):
+    results = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(THREADS)
+
+    def worker(offset):
+        barrier.wait()
+        local = []
+        for i in range(offset, REQUESTS, THREADS):
+            ip = f'198.51.100.{i % IPS}'
+            with pool.connection() as conn:
+                local.append((ip, red_packet_io.claim(conn.cursor(), ip)))
+        with lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    won = [(ip, code) for ip, code in results if code is not None]
+    # 每个口令只分配一次，每个IP最多中奖一次
+    assert len({code for _, code in won}) == len(won)
+    assert max(Counter(ip for ip, _ in won).values()) == 1
+    assert len(won) == min(CODES, IPS)
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT used_by_ip, COUNT(*) FROM red_packet_codes WHERE is_used = TRUE GROUP BY used_by_ip')
+        rows = cursor.fetchall()
+        assert all(count == 1 for _, count in rows)
+        cursor.execute('SELECT used_by_ip, code FROM red_packet_codes WHERE is_used = TRUE')
+        assert dict(cursor.fetchall()) == dict(won)
+
+
+def test_second_claim_for_same_ip_returns_none(pool):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        first = red_packet_io.claim(cursor, '203.0.113.5')
+        assert first == 'TEST-0000'
+        assert red_packet_io.claim(cursor, '203.0.113.5') is None
+        cursor.execute("SELECT COUNT(*) FROM red_packet_codes WHERE used_by_ip = '203.0.113.5'")
+        assert cursor.fetchone()[0] == 1
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+import request_log_query  # noqa: E402
+import storage  # noqa: E402
+
+START = datetime(2026, 1, 2, 3, 4, 5)
+
+
+@pytest.fixture
+def cursor(tmp_path):
+    conn = storage.connect_sqlite(str(tmp_path / 'logs.sqlite3'))
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE request_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, ip_address TEXT, endpoint TEXT, status_code INT, created_at DATETIME
+        )
+    ''')
+    # 每秒三条日志，同一秒内按 id 排序
+    cursor.executemany('INSERT INTO request_logs (ip_address, endpoint, status_code, created_at) VALUES (%s, %s, %s, %s)',
+                       [(f'192.0.2.{i % 2}', '/api/stats', 429 if i % 3 == 0 else 200, START + timedelta(seconds=i // 3))
+                        for i in range(10)])
+    yield cursor
+    conn.close()
+
+
+def _pages(cursor, where_clause, params, limit):
+    pages = []
+    page_cursor = None
+    while True:
+        page_where, page_params = request_log_query.cursor_condition(where_clause, params, page_cursor)
+        cursor.execute(f'''
+            SELECT id, created_at FROM request_logs {page_where}
+            ORDER BY created_at DESC, id DESC LIMIT %s
+        ''', page_params + [limit])
+        rows = cursor.fetchall()
+        if not rows:
+            return pages
+        pages.append([row[0] for row in rows])
+        # 游标经过文本往返，和接口返回给客户端的一样
+        page_cursor = request_log_query.parse_cursor(request_log_query.make_cursor(rows[-1][1], rows[-1][0]))
+
+
+def test_cursor_pages_cover_every_row_once(cursor):
+    pages = _pages(cursor, '', [], limit=4)
+    assert pages == [[10, 9, 8, 7], [6, 5, 4, 3], [2, 1]]
+
+
+def test_filters_combine_with_cursor(cursor):
+    where_clause, params = request_log_query.build_filters(ip='192.0.2.0', status=200,
+                                                           since=START + timedelta(seconds=1))
+    assert [row_id for page in _pages(cursor, where_clause, params, limit=1) for row_id in page] == [9, 5]
+    assert request_log_query.build_filters() == ('', [])
+
+
+def test_parse_cursor_rejects_garbage():
+    with pytest.raises(ValueError):
+        request_log_query.parse_cursor('2026-01-02T03:04:05')
+    with pytest.raises(ValueError):
+        request_log_query.parse_cursor('yesterday_12')
+
+
+def test_count_estimates_without_filters_and_caches_filtered(cursor):
+    cache = request_log_query.CountCache(ttl=60)
+    cursor.execute('DELETE FROM request_logs WHERE id <= 2')
+    assert request_log_query.count(cursor, '', [], cache) == (8, True)
+
+    where_clause, params = request_log_query.build_filters(status=429)
+    assert request_log_query.count(cursor, where_clause, params, cache) == (3, False)
+    cursor.execute('DELETE FROM request_logs WHERE status_code = 429')
+    # ttl 内读缓存
+    assert request_log_query.count(cursor, where_clause, params, cache) == (3, False)
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'entries': 1}
+
+
+def test_request_logs_endpoint(app_module, client):
+    with app_module.get_db_connection() as conn:
+        conn.cursor().executemany('''
+            INSERT INTO request_logs (ip_address, endpoint, method, user_agent, status_code, response_time, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ''', [('203.0.113.99', '/api/stats', 'GET', 'ua', 200, 1.0, START + timedelta(seconds=i)) for i in range(3)])
+
+    data = client.get('/api/security/request-logs?ip=203.0.113.99&limit=2').get_json()
+    assert [log['created_at'] for log in data['logs']] == [(START + timedelta(seconds=i)).isoformat() for i in (2, 1)]
+    assert (data['has_more'], data['total'], data['total_estimated']) == (True, 3, False)
+
+    data = client.get(f"/api/security/request-logs?ip=203.0.113.99&limit=2&cursor={data['next_cursor']}").get_json()
+    assert [log['created_at'] for log in data['logs']] == [START.isoformat()]
+    assert data['has_more'] is False and data['next_cursor'] is None
+    assert client.get('/api/security/request-logs?cursor=bad').status_code == 400
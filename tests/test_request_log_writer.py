@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+import storage  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+from request_log_writer import RequestLogWriter  # noqa: E402
+
+CREATED_AT = datetime(2026, 1, 2, 3, 4, 5)
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool({'path': str(tmp_path / 'logs.sqlite3')}, connect=storage.connect_sqlite)
+    with pool.connection() as conn:
+        conn.cursor().execute('''
+            CREATE TABLE request_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, ip_address TEXT, endpoint TEXT, method TEXT, user_agent TEXT,
+                status_code INT, response_time FLOAT, created_at DATETIME
+            )
+        ''')
+    yield pool
+    pool.close_all()
+
+
+def _logged(pool):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT ip_address, endpoint, status_code FROM request_logs ORDER BY id')
+        return cursor.fetchall()
+
+
+def test_batches_are_written_with_after_write(pool):
+    batches = []
+    writer = RequestLogWriter(pool.connection, batch_size=2, flush_interval=0.05,
+                              after_write=lambda cursor, rows: batches.append(list(rows)))
+    for i in range(5):
+        assert writer.submit(f'192.0.2.{i}', '/api/messages', 'GET', 'ua', 200, 1.0, CREATED_AT)
+    writer.shutdown()
+
+    assert _logged(pool) == [(f'192.0.2.{i}', '/api/messages', 200) for i in range(5)]
+    assert sum(len(batch) for batch in batches) == 5
+    assert all(len(batch) <= 2 for batch in batches)
+    stats = writer.stats()
+    assert (stats['queued'], stats['flushed'], stats['failed'], stats['queue_depth']) == (5, 5, 0, 0)
+
+
+def test_failed_after_write_rolls_back_batch(pool):
+    def after_write(cursor, rows):
+        raise RuntimeError('汇总表写入失败')
+
+    writer = RequestLogWriter(pool.connection, after_write=after_write)
+    writer.submit('192.0.2.1', '/api/stats', 'GET', 'ua', 200, 1.0, CREATED_AT)
+    writer.shutdown()
+    # 日志和汇总在同一个事务中，汇总失败时日志也不写入
+    assert _logged(pool) == []
+    assert writer.stats()['failed'] == 1
+
+
+def test_full_queue_drops(pool):
+    writer = RequestLogWriter(pool.connection, max_queue=2)
+    writer._stop.set()  # 不启动后台线程，让队列保持满
+    results = [writer.submit('192.0.2.1', '/', 'GET', 'ua', 200, 1.0, CREATED_AT) for _ in range(3)]
+    assert results == [True, True, False]
+    assert writer.stats()['dropped'] == 1
+    writer.flush()
+    assert len(_logged(pool)) == 2
@@ -0,0 +1,83 @@
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+import request_rollup  # noqa: E402
+import storage  # noqa: E402
+
+MINUTE = datetime(2026, 1, 2, 3, 4)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = storage.connect_sqlite(str(tmp_path / 'requests.sqlite3'))
+    cursor = conn.cursor()
+    for sql in request_rollup.CREATE_TABLES_SQL:
+        cursor.execute(sql)
+    cursor.execute('''
+        CREATE TABLE request_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, ip_address TEXT, endpoint TEXT, method TEXT, user_agent TEXT,
+            status_code INT, response_time FLOAT, created_at DATETIME
+        )
+    ''')
+    yield conn
+    conn.close()
+
+
+def _rows():
+    # 被拒绝的请求在中间件中直接返回，没有响应时间
+    return [
+        ('192.0.2.1', '/api/messages', 'GET', 'ua', 200, 10.0, MINUTE.replace(second=5)),
+        ('192.0.2.1', '/api/messages', 'GET', 'ua', 200, 30.0, MINUTE.replace(second=20)),
+        ('192.0.2.1', '/api/messages', 'GET', 'ua', 429, None, MINUTE.replace(second=30)),
+        ('192.0.2.2', '/api/stats', 'GET', 'ua', 403, None, MINUTE.replace(second=40)),
+    ]
+
+
+def test_average_excludes_blocked_requests(conn):
+    cursor = conn.cursor()
+    request_rollup.record_batch(cursor, _rows())
+    summary = request_rollup.read(cursor, MINUTE, datetime(2026, 1, 3))
+    assert (summary['requests'], summary['blocked'], summary['avg_response_time']) == (4, 2, 20.0)
+    assert summary['top_ips'][0] == {'ip_address': '192.0.2.1', 'request_count': 3, 'blocked_count': 1}
+
+
+def test_rebuild_matches_incremental(conn):
+    cursor = conn.cursor()
+    cursor.executemany('''
+        INSERT INTO request_logs (ip_address, endpoint, method, user_agent, status_code, response_time, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ''', _rows())
+    request_rollup.record_batch(cursor, _rows())
+    expected = request_rollup.read(cursor, MINUTE, datetime(2026, 1, 3))
+    request_rollup.rebuild(conn)
+    assert request_rollup.read(cursor, MINUTE, datetime(2026, 1, 3)) == expected
+
+
+def test_only_blocked_requests_have_no_average(conn):
+    cursor = conn.cursor()
+    request_rollup.record_batch(cursor, _rows()[2:])
+    assert request_rollup.read(cursor, MINUTE, datetime(2026, 1, 3))['avg_response_time'] is None
+
+
+def test_security_stats_endpoint(app_module, client):
+    day = datetime(2025, 6, 1, 12, 0)
+    writer = app_module.request_log_writer
+    for ip_address, _, method, user_agent, status_code, response_time, created_at in _rows():
+        writer.submit(ip_address, '/api/stats', method, user_agent, status_code, response_time,
+                      created_at.replace(year=day.year, month=day.month, day=day.day))
+    writer.flush()
+
+    # 后台线程可能已经取走一部分日志，等它写完这一批
+    deadline = time.monotonic() + 5
+    while True:
+        data = client.get('/api/security/stats?since=2025-06-01T00:00:00&until=2025-06-02T00:00:00').get_json()
+        if data['today_requests'] == 4 or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+    assert (data['today_requests'], data['today_blocked'], data['avg_response_time']) == (4, 2, 20.0)
+    assert data['top_ips'][0]['ip_address'] == '192.0.2.1'
+    assert client.get('/api/security/stats?since=yesterday').status_code == 400
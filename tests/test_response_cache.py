@@ -0,0 +1,64 @@
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+import storage  # noqa: E402
+from response_cache import CREATE_TABLE_SQL, DataVersions, ResponseCache  # noqa: E402
+
+
+@pytest.fixture
+def versions(tmp_path):
+    conn = storage.connect_sqlite(str(tmp_path / 'versions.sqlite3'))
+    conn.cursor().execute(CREATE_TABLE_SQL)
+
+    @contextmanager
+    def connection_factory():
+        yield conn
+
+    yield DataVersions(connection_factory), conn
+    conn.close()
+
+
+def test_data_versions_bump(versions):
+    data_versions, conn = versions
+    assert data_versions.current(['messages', 'stats']) == {'messages': 0, 'stats': 0}
+    data_versions.bump(conn.cursor(), 'messages')
+    data_versions.bump(conn.cursor(), 'messages', 'stats')
+    assert data_versions.current(['messages', 'stats']) == {'messages': 2, 'stats': 1}
+
+
+def test_response_cache_entry_is_replaced_when_version_changes():
+    cache = ResponseCache(max_entries=2)
+    key = ('/api/stats', b'')
+    old = ResponseCache.make_etag(key, {'stats': 1})
+    new = ResponseCache.make_etag(key, {'stats': 2})
+    assert old != new
+    cache.set(key, old, b'{}', 'application/json')
+    assert cache.get(key, old) == (b'{}', 'application/json')
+    assert cache.get(key, new) is None
+
+    # 超过上限时淘汰最久未使用的条目
+    cache.set(('/a', b''), 'x', b'a', 'text/plain')
+    cache.set(('/b', b''), 'y', b'b', 'text/plain')
+    assert cache.get(key, old) is None
+    assert cache.stats()['entries'] == 2
+
+
+def test_etag_and_not_modified(client):
+    first = client.get('/api/messages?limit=5')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    cached = client.get('/api/messages?limit=5', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+
+    # 新留言使 messages 版本号变化，旧的 ETag 不再匹配
+    assert client.post('/api/messages', json={'name': '缓存', 'message': '缓存失效'}).status_code == 200
+    changed = client.get('/api/messages?limit=5', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()['messages'][0]['message'] == '缓存失效'
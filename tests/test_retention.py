@@ -0,0 +1,102 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+import request_rollup  # noqa: E402
+import stats_rollup  # noqa: E402
+import storage  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+from response_cache import CREATE_TABLE_SQL as DATA_VERSIONS_TABLE_SQL, DataVersions  # noqa: E402
+from retention import LOCK_NAME, Retention  # noqa: E402
+
+NOW = datetime.now()
+OLD = NOW - timedelta(days=30)
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool({'path': str(tmp_path / 'retention.sqlite3')}, connect=storage.connect_sqlite)
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(DATA_VERSIONS_TABLE_SQL)
+        for sql in stats_rollup.CREATE_TABLES_SQL + request_rollup.CREATE_TABLES_SQL:
+            cursor.execute(sql)
+        cursor.execute('''
+            CREATE TABLE request_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, ip_address TEXT, endpoint TEXT, created_at DATETIME
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE activity_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, activity_type TEXT, ip_address TEXT, created_at DATETIME
+            )
+        ''')
+        cursor.executemany('INSERT INTO request_logs (ip_address, endpoint, created_at) VALUES (%s, %s, %s)',
+                           [('192.0.2.1', f'/old/{i}', OLD) for i in range(5)] + [('192.0.2.1', '/new', NOW)])
+        cursor.executemany('INSERT INTO activity_logs (activity_type, ip_address, created_at) VALUES (%s, %s, %s)',
+                           [('visit', '192.0.2.1', OLD), ('message', '192.0.2.1', OLD), ('visit', '192.0.2.1', NOW)])
+        cursor.executemany('INSERT INTO stats_uniques (kind, stat_date, value) VALUES (%s, %s, %s)',
+                           [('visitor', stats_rollup.TOTAL_DATE, '192.0.2.1'), ('visitor', OLD.date(), '192.0.2.1'),
+                            ('visitor', NOW.date(), '192.0.2.1')])
+        cursor.executemany('INSERT INTO request_minute_ips (minute, ip_address, requests) VALUES (%s, %s, %s)',
+                           [(OLD.replace(second=0, microsecond=0), f'192.0.2.{i}', 1) for i in range(3)])
+    yield pool
+    pool.close_all()
+
+
+def _retention(pool, **kwargs):
+    ttl_days = {'request_logs': 7, 'visits': 7, 'visitor_uniques': 7, 'request_minute_ips': 7}
+    return Retention(pool.connection, DataVersions(pool.connection), ttl_days, batch_size=2, batch_pause=0,
+                     **kwargs)
+
+
+def _column(pool, sql):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def test_purge_in_batches_with_archive(pool, tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    result = _retention(pool, archive_dir=archive_dir).run()
+    tables = result['tables']
+    assert (tables['request_logs']['deleted'], tables['request_logs']['batches']) == (5, 3)
+    assert tables['visits']['deleted'] == 1
+    assert tables['visitor_uniques']['deleted'] == 1
+    assert tables['request_minute_ips']['deleted'] == 3
+
+    assert _column(pool, 'SELECT endpoint FROM request_logs') == ['/new']
+    # 留言和累计的访客去重记录不清理
+    assert sorted(_column(pool, 'SELECT activity_type FROM activity_logs')) == ['message', 'visit']
+    assert sorted(_column(pool, 'SELECT stat_date FROM stats_uniques')) == [stats_rollup.TOTAL_DATE, NOW.date()]
+
+    [name] = [name for name in os.listdir(archive_dir) if name.startswith('request_logs-')]
+    with gzip.open(os.path.join(archive_dir, name), 'rt', encoding='utf-8') as f:
+        archived = [json.loads(line) for line in f]
+    assert sorted(row['endpoint'] for row in archived) == [f'/old/{i}' for i in range(5)]
+
+
+def test_dry_run_only_counts(pool):
+    result = _retention(pool).run(['request_logs'], dry_run=True)
+    assert result['tables'] == {'request_logs': {'cutoff': result['tables']['request_logs']['cutoff'], 'matched': 5}}
+    assert len(_column(pool, 'SELECT id FROM request_logs')) == 6
+
+
+def test_skipped_while_another_process_holds_the_lock(pool):
+    retention = _retention(pool)
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT GET_LOCK(%s, 0)', (LOCK_NAME,))
+        try:
+            # 清理任务从连接池借到另一条连接，拿不到锁
+            assert retention.run() is None
+        finally:
+            cursor.execute('SELECT RELEASE_LOCK(%s)', (LOCK_NAME,))
+    assert retention.stats()['skipped'] == 1
+    assert retention.run()['tables']['request_logs']['deleted'] == 5
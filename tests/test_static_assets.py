@@ -0,0 +1,66 @@
+import gzip
+import os
+
+import build_static
+from static_assets import MANIFEST_NAME, StaticAssets, parse_accept_encoding
+
+
+def _build(tmp_path):
+    source = tmp_path / 'src'
+    source.mkdir()
+    (source / 'styles.css').write_text('body { color: red; }', encoding='utf-8')
+    (source / 'index.html').write_text('<link href="styles.css" rel="stylesheet"><p>首页</p>', encoding='utf-8')
+    output = str(tmp_path / 'dist')
+    manifest = build_static.build(str(source), output, assets=['styles.css'], pages=['index.html'])
+    return manifest, StaticAssets(output)
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip, br;q=0, deflate;q=0.5') == {'gzip', 'deflate'}
+    assert parse_accept_encoding(None) == set()
+
+
+def test_build_and_lookup(tmp_path):
+    manifest, assets = _build(tmp_path)
+    hashed = manifest['assets']['styles.css']
+    assert hashed.startswith('styles.') and hashed.endswith('.css') and hashed != 'styles.css'
+
+    asset = assets.lookup(hashed, 'gzip')
+    assert asset['encoding'] == 'gzip'
+    assert gzip.decompress(asset['body']) == b'body { color: red; }'
+    assert asset['immutable'] is True
+    assert asset['mimetype'] == 'text/css; charset=utf-8'
+    assert asset['etag'] == f'{hashed}-gzip'
+
+    plain = assets.lookup('styles.css', '')
+    assert (plain['body'], plain['encoding'], plain['immutable']) == (b'body { color: red; }', None, False)
+    if build_static.brotli is not None:
+        assert assets.lookup(hashed, 'gzip, br')['encoding'] == 'br'
+
+    # 页面中的资源地址改写为带哈希的地址
+    page = assets.lookup('index.html', None)
+    assert f'href="/assets/{hashed}"'.encode() in page['body']
+    assert assets.lookup('missing.css', 'gzip') is None
+
+
+def test_assets_are_served_with_long_lived_caching(app_module, client):
+    static_assets = app_module.static_assets
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    manifest = build_static.build(repo, static_assets.dist_dir, assets=['styles.css'], pages=[])
+    static_assets.load()
+    try:
+        hashed = manifest['assets']['styles.css']
+        response = client.get(f'/assets/{hashed}', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+        assert response.headers['Vary'] == 'Accept-Encoding'
+
+        etag = response.headers['ETag']
+        assert client.get(f'/assets/{hashed}', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}) \
+            .status_code == 304
+        assert client.get('/styles.css').headers['Cache-Control'] == 'no-cache'
+        assert client.get('/assets/styles.0000000000.css').status_code == 404
+    finally:
+        os.remove(os.path.join(static_assets.dist_dir, MANIFEST_NAME))
+        static_assets.load()
@@ -0,0 +1,78 @@
+from datetime import date, datetime
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+import stats_rollup  # noqa: E402
+import storage  # noqa: E402
+
+DAY = date(2026, 1, 2)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = storage.connect_sqlite(str(tmp_path / 'stats.sqlite3'))
+    cursor = conn.cursor()
+    for sql in stats_rollup.CREATE_TABLES_SQL:
+        cursor.execute(sql)
+    cursor.execute('''
+        CREATE TABLE activity_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, activity_type TEXT, ip_address TEXT, name TEXT, created_at DATETIME
+        )
+    ''')
+    yield conn
+    conn.close()
+
+
+def _visit(cursor, ip, day):
+    cursor.execute('INSERT INTO activity_logs (activity_type, ip_address, created_at) VALUES (%s, %s, %s)',
+                   ('visit', ip, datetime.combine(day, datetime.min.time())))
+    stats_rollup.record_visit(cursor, ip, day)
+
+
+def _message(cursor, name, day):
+    cursor.execute('INSERT INTO activity_logs (activity_type, name, created_at) VALUES (%s, %s, %s)',
+                   ('message', name, datetime.combine(day, datetime.min.time())))
+    stats_rollup.record_message(cursor, name, day)
+
+
+def test_incremental_counts_match_rebuild(conn):
+    cursor = conn.cursor()
+    _visit(cursor, '192.0.2.1', DAY)
+    _visit(cursor, '192.0.2.1', DAY)
+    _visit(cursor, '192.0.2.2', DAY)
+    _visit(cursor, '192.0.2.1', date(2026, 1, 3))
+    _message(cursor, 'alice', DAY)
+    _message(cursor, 'alice', DAY)
+    _message(cursor, 'bob', DAY)
+
+    stats = stats_rollup.read(cursor, DAY)
+    assert stats == {'totalMessages': 3, 'totalVisitors': 2, 'todayMessages': 3, 'todayVisitors': 2,
+                     'uniqueMessagers': 2}
+    # 累计行只在新IP出现时更新
+    assert stats_rollup.read(cursor, date(2026, 1, 3))['totalVisitors'] == 2
+
+    stats_rollup.rebuild(conn)
+    assert stats_rollup.read(cursor, DAY) == stats
+
+
+def test_remove_messages(conn):
+    cursor = conn.cursor()
+    _message(cursor, 'alice', DAY)
+    _message(cursor, 'alice', DAY)
+    _message(cursor, 'bob', DAY)
+    stats_rollup.remove_messages(cursor, [('alice', DAY), ('bob', DAY)])
+    stats = stats_rollup.read(cursor, DAY)
+    assert (stats['totalMessages'], stats['todayMessages'], stats['uniqueMessagers']) == (1, 1, 1)
+
+
+def test_backfill_total_visitors(conn):
+    cursor = conn.cursor()
+    _visit(cursor, '192.0.2.1', DAY)
+    _visit(cursor, '192.0.2.2', DAY)
+    _message(cursor, 'alice', DAY)
+    # 旧版本的累计行没有独立访客数
+    cursor.execute('UPDATE stats_counters SET unique_visitors = 0 WHERE stat_date = %s', (stats_rollup.TOTAL_DATE,))
+    stats_rollup.backfill_total_visitors(cursor)
+    assert stats_rollup.read(cursor, DAY)['totalVisitors'] == 2
@@ -0,0 +1,154 @@
+from datetime import date, datetime
+
+import pytest
+
+pytest.importorskip('pymysql')
+
+import storage  # noqa: E402
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = storage.connect_sqlite(str(tmp_path / 'storage.sqlite3'))
+    yield conn
+    conn.close()
+
+
+class _RecordingCursor:
+    """记录 MySQL 方言生成的语句"""
+
+    def __init__(self, rowcount=1):
+        self.executed = []
+        self.rowcount = rowcount
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+
+# 语句转换：每条规则一个用例
+
+def test_translate_placeholders():
+    assert storage.translate('SELECT * FROM t WHERE a = %s AND b LIKE %s', True) == \
+        ('SELECT * FROM t WHERE a = ? AND b LIKE ?',)
+    assert storage.translate('SELECT * FROM t WHERE a = %(a)s', True) == ('SELECT * FROM t WHERE a = :a',)
+    assert storage.translate("SELECT 'x%%'", True) == ("SELECT 'x%'",)
+    # 与 PyMySQL 一致：不带参数时不处理占位符
+    assert storage.translate("SELECT 'x%%'", False) == ("SELECT 'x%%'",)
+
+
+def test_translate_create_table():
+    create, index, unique = storage.translate('''
+        CREATE TABLE IF NOT EXISTS items (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            kind ENUM('a', 'b') NOT NULL COMMENT '类型, 可选',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_kind (kind, created_at),
+            UNIQUE KEY uk_created (created_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='表'
+    ''', False)
+    assert 'id INTEGER PRIMARY KEY AUTOINCREMENT' in create
+    assert 'kind TEXT NOT NULL' in create
+    assert 'COMMENT' not in create and 'ENGINE' not in create and 'ON UPDATE' not in create
+    assert "DEFAULT (datetime('now', 'localtime'))" in create
+    assert index == 'CREATE INDEX IF NOT EXISTS items_idx_kind ON items (kind, created_at)'
+    assert unique == 'CREATE UNIQUE INDEX IF NOT EXISTS items_uk_created ON items (created_at)'
+
+
+def test_translate_for_update():
+    assert storage.translate('SELECT id FROM t WHERE a = %s FOR UPDATE', True) == ('SELECT id FROM t WHERE a = ?',)
+
+
+def test_translate_greatest():
+    assert storage.translate('UPDATE t SET n = GREATEST(n - %s, 0)', True) == ('UPDATE t SET n = MAX(n - ?, 0)',)
+
+
+def test_sqlite_functions(conn):
+    cursor = conn.cursor()
+    cursor.execute('SELECT NOW()')
+    datetime.strptime(cursor.fetchone()[0], '%Y-%m-%d %H:%M:%S')
+    cursor.execute('SELECT FROM_UNIXTIME(%s)', (0,))
+    assert cursor.fetchone()[0] == datetime.fromtimestamp(0).strftime('%Y-%m-%d %H:%M:%S')
+    cursor.execute("SELECT DATE_FORMAT(%s, '%%Y-%%m-%%d %%H:%%i')", (datetime(2026, 1, 2, 3, 4, 5),))
+    assert cursor.fetchone()[0] == '2026-01-02 03:04'
+
+
+def test_sqlite_get_lock(conn, tmp_path):
+    other = storage.connect_sqlite(str(tmp_path / 'storage.sqlite3'))
+    try:
+        cursor, other_cursor = conn.cursor(), other.cursor()
+        cursor.execute('SELECT GET_LOCK(%s, 0)', ('job',))
+        assert cursor.fetchone()[0] == 1
+        other_cursor.execute('SELECT GET_LOCK(%s, 0)', ('job',))
+        assert other_cursor.fetchone()[0] == 0
+        cursor.execute('SELECT RELEASE_LOCK(%s)', ('job',))
+        assert cursor.fetchone()[0] == 1
+        other_cursor.execute('SELECT GET_LOCK(%s, 0)', ('job',))
+        assert other_cursor.fetchone()[0] == 1
+    finally:
+        other.close()
+
+
+# 方言中的写入
+
+def test_sqlite_insert_ignore(conn):
+    cursor = conn.cursor()
+    cursor.execute('CREATE TABLE seen (kind TEXT, value TEXT, PRIMARY KEY (kind, value))')
+    backend = storage.dialect(cursor)
+    assert backend.insert_ignore(cursor, 'seen', ('kind', 'value'), [('ip', 'a'), ('ip', 'b')]) == 2
+    assert backend.insert_ignore(cursor, 'seen', ('kind', 'value'), [('ip', 'a'), ('ip', 'c')]) == 1
+
+
+def test_sqlite_upserts(conn):
+    cursor = conn.cursor()
+    cursor.execute('CREATE TABLE counters (day DATE PRIMARY KEY, hits INT NOT NULL, uniques INT NOT NULL)')
+    cursor.execute('CREATE TABLE names (name TEXT PRIMARY KEY, cnt INT NOT NULL)')
+    backend = storage.dialect(cursor)
+    today = date(2026, 1, 2)
+    backend.upsert_add(cursor, 'counters', ('day',), ('hits', 'uniques'), [(today, 1, 1)])
+    backend.upsert_add(cursor, 'counters', ('day',), ('hits', 'uniques'), [(today, 2, 0), (date(2026, 1, 3), 1, 1)])
+    cursor.execute('SELECT day, hits, uniques FROM counters ORDER BY day')
+    assert cursor.fetchall() == [(today, 3, 1), (date(2026, 1, 3), 1, 1)]
+
+    assert backend.upsert_created(cursor, 'names', ('name',), 'cnt', ('alice',)) is True
+    assert backend.upsert_created(cursor, 'names', ('name',), 'cnt', ('alice',)) is False
+    cursor.execute('SELECT cnt FROM names')
+    assert cursor.fetchone()[0] == 2
+
+
+def test_sqlite_update_first(conn):
+    cursor = conn.cursor()
+    cursor.execute('CREATE TABLE codes (id INTEGER PRIMARY KEY, rank INT, owner TEXT)')
+    cursor.executemany('INSERT INTO codes (id, rank) VALUES (%s, %s)', [(1, 2), (2, 1), (3, 1)])
+    backend = storage.dialect(cursor)
+    assert backend.update_first(cursor, 'codes', 'owner = %s', 'owner IS NULL', 'rank, id', ('a',)) == 1
+    assert backend.update_first(cursor, 'codes', 'owner = %s', 'owner IS NULL', 'rank, id', ('b',)) == 1
+    cursor.execute('SELECT id, owner FROM codes ORDER BY id')
+    assert cursor.fetchall() == [(1, None), (2, 'a'), (3, 'b')]
+
+
+def test_mysql_dialect_statements():
+    cursor = _RecordingCursor()
+    backend = storage.MYSQL
+    backend.insert_ignore(cursor, 'seen', ('kind', 'value'), [('ip', 'a'), ('ip', 'b')])
+    backend.upsert_add(cursor, 'counters', ('day',), ('hits',), [('d', 1)])
+    assert backend.upsert_created(cursor, 'names', ('name',), 'cnt', ('alice',)) is True
+    backend.update_first(cursor, 'codes', 'owner = %s', 'owner IS NULL', 'rank, id', ('a',))
+    assert cursor.executed == [
+        ('INSERT IGNORE INTO seen (kind, value) VALUES (%s, %s), (%s, %s)', ['ip', 'a', 'ip', 'b']),
+        ('INSERT INTO counters (day, hits) VALUES (%s, %s) ON DUPLICATE KEY UPDATE hits = hits + VALUES(hits)',
+         ['d', 1]),
+        ('INSERT INTO names (name, cnt) VALUES (%s, %s) ON DUPLICATE KEY UPDATE cnt = cnt + 1', ['alice', 1]),
+        ('UPDATE codes SET owner = %s WHERE owner IS NULL ORDER BY rank, id LIMIT 1', ('a',)),
+    ]
+
+
+def test_sqlite_ensure_column(conn):
+    cursor = conn.cursor()
+    cursor.execute('CREATE TABLE minutes (minute DATETIME PRIMARY KEY, requests INT NOT NULL DEFAULT 0)')
+    cursor.execute('INSERT INTO minutes (minute, requests) VALUES (%s, %s)', (datetime(2026, 1, 2), 3))
+    backend = storage.dialect(cursor)
+    assert backend.ensure_column(cursor, 'minutes', 'timed', 'INT NOT NULL DEFAULT 0') is True
+    assert backend.ensure_column(cursor, 'minutes', 'timed', 'INT NOT NULL DEFAULT 0') is False
+    cursor.execute('SELECT requests, timed FROM minutes')
+    assert cursor.fetchall() == [(3, 0)]